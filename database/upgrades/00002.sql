@@ -0,0 +1,27 @@
+ -- Creation date: 18 oct 2026
+ -- Indexes for the synchronization and plant queries (see src/utils/sql_queries.py)
+
+ -- Untransmitted backlog, covering "select * ... where transmitted=0 order by timestamp"
+create index if not exists sensors_data_untransmitted_idx
+    on sensors_data (timestamp, type, value, plant_uuid, transmitted)
+    where transmitted = 0;
+
+create index if not exists actuators_untransmitted_idx
+    on actuators (timestamp, type, status, plant_uuid, transmitted)
+    where transmitted = 0;
+
+ -- Rows already transmitted, used by the delete queries
+create index if not exists sensors_data_transmitted_idx
+    on sensors_data (transmitted)
+    where transmitted = 1;
+
+create index if not exists actuators_transmitted_idx
+    on actuators (transmitted)
+    where transmitted = 1;
+
+create index if not exists plant_position_idx
+    on plant (position);
+
+create index if not exists plant_untransmitted_idx
+    on plant (removed, planted_at)
+    where transmitted = 0;
@@ -0,0 +1,13 @@
+ -- Creation date: 18 oct 2026
+ -- Durable high-water marks, e.g. the last rowid of a table transmitted to the API
+
+create table if not exists watermark
+(
+    name       TEXT
+        primary key,
+    last_rowid INTEGER default 0 not null
+);
+
+insert or ignore into watermark(name)
+values ('sensors_data'),
+       ('actuators');
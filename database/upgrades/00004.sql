@@ -0,0 +1,31 @@
+ -- Creation date: 18 oct 2026
+ -- Per-minute and per-hour aggregates of sensors_data
+
+create table if not exists sensors_data_minute
+(
+    bucket       TEXT    not null, -- start of the minute, e.g. 2021-11-10 14:02:00
+    type         TEXT    not null,
+    plant_uuid   TEXT    default '' not null,
+    min_value    REAL    not null,
+    max_value    REAL    not null,
+    mean_value   REAL    not null,
+    sample_count INTEGER not null,
+    primary key (bucket, type, plant_uuid),
+    check (type in ('M', 'L', 'T'))
+) without rowid;
+
+create table if not exists sensors_data_hour
+(
+    bucket       TEXT    not null, -- start of the hour, e.g. 2021-11-10 14:00:00
+    type         TEXT    not null,
+    plant_uuid   TEXT    default '' not null,
+    min_value    REAL    not null,
+    max_value    REAL    not null,
+    mean_value   REAL    not null,
+    sample_count INTEGER not null,
+    primary key (bucket, type, plant_uuid),
+    check (type in ('M', 'L', 'T'))
+) without rowid;
+
+insert or ignore into watermark(name)
+values ('sensors_data_rollup');
@@ -0,0 +1,18 @@
+ -- Creation date: 18 oct 2026
+ -- Outbox of the mutations waiting to be acknowledged by the API
+
+create table if not exists outbox
+(
+    id              INTEGER primary key autoincrement,
+    operation       TEXT    not null,
+    payload         TEXT    default '{}' not null, -- parameters of the operation, in JSON
+    idempotency_key TEXT    not null unique,
+    attempts        INTEGER default 0 not null,
+    next_attempt_at INTEGER default 0 not null, -- epoch in ms
+    last_error      TEXT,
+    dead            BOOLEAN default 0 not null, -- max attempts reached, kept for inspection
+    created_at      TEXT    default (datetime('now')) not null,
+    check (operation in ('add_plant', 'remove_plant', 'send_logs'))
+);
+
+create index if not exists outbox_due_idx on outbox (next_attempt_at) where dead = 0;
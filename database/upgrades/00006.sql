@@ -0,0 +1,8 @@
+ -- Creation date: 18 oct 2026
+ -- Hourly averages written by the storage budget in place of the oldest raw rows
+
+alter table sensors_data
+    add column compacted BOOLEAN default 0 not null;
+
+insert or ignore into watermark(name)
+values ('sensors_data_compaction');
@@ -0,0 +1,7 @@
+ -- Creation date: 18 oct 2026
+ -- The upload pages are selected by rowid range (see src/utils/sql_queries.py), so the
+ -- covering indexes on the timestamp are never used but still updated by every insert
+
+drop index if exists sensors_data_untransmitted_idx;
+
+drop index if exists actuators_untransmitted_idx;
@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 """Main program"""
-import RPi.GPIO as GPIO
-
-from src.utils import config, config_ble, led_utils, get_logger, time_in_millisecond
-from src.controllers import InternetConnectionController, DataSynchronizationController
+from src.hal import hardware
+from src.utils import config, config_ble, led_utils, get_logger
+from src.controllers import (
+    InternetConnectionController,
+    DataSynchronizationController,
+    DataRollupController,
+    StorageBudgetController,
+)
 from src.services import (
+    ActuationService,
     StatusIndicatorService,
     LightningLedService,
     ValveService,
     PumpService,
     ADCService,
     DatabaseService,
+    HttpTransportService,
+    MetricsService,
+    SchedulerService,
+    SensorRecorderService,
 )
 from src.models import StatusPattern
 
@@ -24,6 +33,12 @@ def main():
     logger = get_logger("root")
     logger.info("Version loaded: %s", config["version"])
 
+    metrics = MetricsService.instance()
+    metrics.start()
+    actuation = ActuationService.instance()
+    actuation.start()
+    scheduler = SchedulerService.instance()
+
     status_indicator_service = StatusIndicatorService.instance()
     DatabaseService.instance().run_init_scripts()
 
@@ -41,22 +56,24 @@ def main():
 
     internet_connection_controller = InternetConnectionController(config, config_ble)
     data_synchronization_controller = DataSynchronizationController(config)
+    data_rollup_controller = DataRollupController(config)
+    storage_budget_controller = StorageBudgetController(config)
 
-    lightning_led = LightningLedService(config["led_strip"])
+    lightning_led = LightningLedService.instance()
     lightning_led.turn_off_all()
 
-    valve = ValveService(config["valve"])
-    pump = PumpService(config["pump"])
+    valve = ValveService.instance()
+    pump = PumpService.instance()
     pump.stop()
 
-    adc = ADCService()
+    adc = ADCService.instance()
+    sensor_recorder = SensorRecorderService.instance()
 
     try:
         logger.debug("Main loop Initilization...")
         
 
         # TODO : Destiné à Disparaître danns les profondeurs insondables et pleines de microbe de l'oubli.
-        prev = time_in_millisecond()
         tile = 0
         tile_on = False
         open_trig = False
@@ -85,93 +102,91 @@ def main():
         low_water_level_flag = True
         open_valve_flag = False
 
-        logger.debug("Main loop startig...")
-        logger.debug("You can stop the program using Ctrl + C safely ;)")
-
-        while True:
-            
-            # Connectivity
-            internet_connection_controller.update()
-            data_synchronization_controller.update()
-
-            # Status Ring LED Update
-            status_indicator_service.update()
-            
-            # Database Update
-            for plant_position in range(PLANT_COUNT):
-                plant_detail = DatabaseService.instance().execute(GET_PLANT_BY_POSITION, plant_position)
-                # TODO : Do some string decoding shit, config a plant object and adds it to plants list.
-
-            # Add or Removing plant Detection
-
+        def read_sensors():
+            nonlocal ambient_luminosity_value, water_level_value
 
             # Update Sensors - Send to DB
             ambient_luminosity_value = adc.get_ambient_luminosity_value()
 
             water_level_value = adc.get_water_level_value()
 
+            # Only the significant changes are written
+            sensor_recorder.record_ambient_light(ambient_luminosity_value)
+            sensor_recorder.record_tank_level(water_level_value)
+
             for plant_position in range(PLANT_COUNT):
                 plants_hygrometry_values[plant_position] = adc.get_plant_hygrometry_value(plant_position)
-                DatabaseService.instance().execute(INSERT_MOISTURE_LEVEL_FOR_PLANT, ambient_luminosity_value, uuid)
                 # TODO : Shit I can't do that.. I absolutely need to scan the presents plants, gather position and then get the  value ... well 
 
+        def test_actuators():
+            nonlocal tile, tile_on, open_trig, pump_speed, valve_count, pot_count
 
+            # test LED
 
-            # Luminosity Regulation
-
-
-            # Hygrometric Regulation
-            valve.update()
-
-            if time_in_millisecond() - prev > 1000:
-                prev = time_in_millisecond()
-
-                # test LED
-
-                if tile > 15:
-                    if tile_on:
-                        tile_on = False
-                    else:
-                        tile_on = True
-                    tile = 0 
-
+            if tile > 15:
                 if tile_on:
-                    lightning_led.turn_on(tile)
-                else:
-                    lightning_led.turn_off(tile)
-                tile = tile + 1
-
-                # test valves
-                if open_trig:
-                    valve.open(valve_count)
-                    open_trig = False
-                    valve_count += 1
-                    if valve_count % 16 == 0:
-                        valve_count = 0
+                    tile_on = False
                 else:
-                    valve.close(valve_count)
-                    open_trig = True
-
-                # Test pompe
-                pump.set_speed(pump_speed)
-                pump_speed += 20
-                if pump_speed > 100.0:
-                   pump_speed = 0.0
-        
-                pot_count += 1
-                if pot_count % 16 == 0:
-                    pot_count = 0
+                    tile_on = True
+                tile = 0 
+
+            if tile_on:
+                lightning_led.turn_on(tile)
+            else:
+                lightning_led.turn_off(tile)
+            tile = tile + 1
+
+            # test valves
+            if open_trig:
+                valve.open(valve_count)
+                open_trig = False
+                valve_count += 1
+                if valve_count % 16 == 0:
+                    valve_count = 0
+            else:
+                valve.close(valve_count)
+                open_trig = True
+
+            # Test pompe
+            pump.set_speed(pump_speed)
+            pump_speed += 20
+            if pump_speed > 100.0:
+                pump_speed = 0.0
+
+            pot_count += 1
+            if pot_count % 16 == 0:
+                pot_count = 0
+
+        # The controllers and services registered their own jobs (connectivity, rollup,
+        # storage budget, status indicator, valves...)
+        scheduler.every(config["main_loop"]["sensors_interval"], read_sensors, "sensors")
+        scheduler.every(1000, test_actuators, "actuators_test")
+
+        logger.debug("Main loop startig...")
+        logger.debug("You can stop the program using Ctrl + C safely ;)")
+
+        # Sleep until the next job is due instead of polling every component
+        scheduler.run()
 
     except KeyboardInterrupt:
-        # Stopping all the controllers and services
+        # Stopping all the controllers and services, in the reverse order of their start
         logger.debug("Turning off the program")
+        # The actuators first, the water must not keep flowing during the shutdown
+        pump.stop()
+        actuation.stop()
+        lightning_led.turn_off_all()
         status_indicator_service.turn_off()
-        DatabaseService.instance().close()
-        internet_connection_controller.stop()
+        # Then the controllers, which can still be writing to the database
+        sensor_recorder.flush()
+        storage_budget_controller.stop()
+        data_rollup_controller.stop()
         data_synchronization_controller.stop()
-        lightning_led.turn_off_all()
-        pump.stop()
-        GPIO.cleanup()
+        internet_connection_controller.stop()
+        HttpTransportService.instance().close()
+        # The database last, once nothing writes to it anymore
+        DatabaseService.instance().close()
+        metrics.stop()
+        hardware().gpio.cleanup()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Actuation process: drives the valves and the pump with the orders of the main
+process, started by the ActuationService. Usage:
+python3 -m src.actuation --commands NAME --events NAME --commands-fd N --events-fd N
+"""
+import argparse
+import os
+import signal
+import threading
+from functools import partial
+
+from src.utils import config, get_logger
+
+_ACTUATION_TAG = "actuation"
+_CONFIG_TAG = "actuation"
+_PROCESS_TAG = "process"
+_PRIORITY_TAG = "priority"
+
+# Without the permission to use the real-time scheduling
+_NICE_INCREMENT = -10
+_READ_SIZE = 4096
+
+_logger = get_logger(_ACTUATION_TAG)
+
+
+def run(commands_name, events_name, commands_fd, events_fd):
+    """
+    Apply the commands of the main process until it stops the process or exits
+    :param commands_name: shared memory of the ring of the commands
+    :type commands_name: str
+    :param events_name: shared memory of the ring of the events
+    :type events_name: str
+    :param commands_fd: pipe woken up after each command
+    :type commands_fd: int
+    :param events_fd: pipe to wake the main process up after each event
+    :type events_fd: int
+    """
+    # The threads started below inherit the scheduling of the process
+    scheduling = _raise_priority(config[_CONFIG_TAG][_PRIORITY_TAG])
+    # This process is the one driving the hardware, the summary of its loop would mix
+    # with the one of the main process
+    config[_CONFIG_TAG][_PROCESS_TAG] = False
+    config["main_loop"]["summary_interval"] = 0
+
+    # pylint: disable=import-outside-toplevel
+    from src.services import PumpService, SchedulerService, ValveService
+    from src.services.actuation_service import (
+        COMMAND_CLOSE_VALVE,
+        COMMAND_OPEN_VALVE,
+        COMMAND_PUMP_SPEED,
+        COMMAND_STOP,
+        EVENT_APPLIED,
+        EVENT_PUMP,
+        EVENT_VALVE_MOVED,
+        RECORD_FORMAT,
+        monotonic_time,
+    )
+    from src.utils.shared_ring import SharedRing
+
+    commands = SharedRing(RECORD_FORMAT, name=commands_name)
+    events = SharedRing(RECORD_FORMAT, name=events_name)
+    scheduler = SchedulerService.instance()
+    valve = ValveService.instance()
+    pump = PumpService.instance()
+    pump.stop()
+
+    def publish(*record):
+        if not events.put(*record):
+            _logger.error("Event %s dropped, the main process is behind", record)
+            return
+        try:
+            os.write(events_fd, b"\0")
+        except OSError:
+            pass
+
+    def on_valve_moved(position, state, duration, error):
+        opened = 1.0 if state == "open" else 0.0
+        publish(EVENT_VALVE_MOVED, position, opened, duration, error)
+
+    def apply(command, position, value, sent_at):
+        if command == COMMAND_OPEN_VALVE:
+            valve.open(position)
+        elif command == COMMAND_CLOSE_VALVE:
+            valve.close(position)
+        elif command == COMMAND_PUMP_SPEED:
+            pump.set_speed(value)
+            publish(EVENT_PUMP, 0, pump.duty_cycle, 0.0, 0.0)
+        elif command == COMMAND_STOP:
+            pump.stop()
+            publish(EVENT_PUMP, 0, pump.duty_cycle, 0.0, 0.0)
+            scheduler.stop()
+        publish(EVENT_APPLIED, command, value, monotonic_time() - sent_at, 0.0)
+
+    def receive():
+        # The commands are applied on the thread of the scheduler, like the movements
+        while True:
+            try:
+                wakeups = os.read(commands_fd, _READ_SIZE)
+            except OSError:
+                wakeups = b""
+            record = commands.get()
+            while record is not None:
+                scheduler.once(0, partial(apply, *record[:4]), _ACTUATION_TAG)
+                record = commands.get()
+            if len(wakeups) == 0:
+                # The main process exited without stopping this one
+                stop = partial(apply, COMMAND_STOP, 0, 0.0, monotonic_time())
+                scheduler.once(0, stop, _ACTUATION_TAG)
+                return
+
+    valve.add_listener(on_valve_moved)
+    threading.Thread(target=receive, name="actuation-commands", daemon=True).start()
+    _logger.info("Actuation process running (%s)", scheduling)
+    scheduler.run()
+    commands.close()
+    events.close()
+    _logger.info("Actuation process stopped")
+
+
+def _raise_priority(priority):
+    """
+    Run the process before the others of the device: the real-time scheduling when it
+    is allowed, a lower nice value otherwise
+    :param priority: SCHED_FIFO priority [1-99], 0 to keep the default scheduling
+    :type priority: int
+    :return: scheduling of the process
+    :rtype: str
+    """
+    if priority <= 0:
+        return "default scheduling"
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        return f"SCHED_FIFO priority {priority}"
+    except (AttributeError, OSError) as error:
+        _logger.warning("Real-time scheduling not available: %s", error)
+    try:
+        os.nice(_NICE_INCREMENT)
+        return f"nice {os.nice(0)}"
+    except OSError as error:
+        _logger.warning("Unable to raise the priority: %s", error)
+    return "default scheduling"
+
+
+def main():
+    """Parse the arguments and run the process"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commands", required=True, help="ring of the commands")
+    parser.add_argument("--events", required=True, help="ring of the events")
+    parser.add_argument(
+        "--commands-fd", type=int, required=True, help="pipe woken up by the commands"
+    )
+    parser.add_argument(
+        "--events-fd", type=int, required=True, help="pipe woken up by the events"
+    )
+    arguments = parser.parse_args()
+    # Ctrl+C reaches the whole process group: the main process stops this one after
+    # its own shutdown, and this one stops itself if the main process exits first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run(arguments.commands, arguments.events, arguments.commands_fd, arguments.events_fd)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,5 @@ from .internet_connection_controller import InternetConnectionController
 from .data_synchronization_controller import DataSynchronizationController
 from .hygrometry_regulation_controller import HygrometryRegulationController
 from .luminosity_regulation_controller import LuminosityRegulationController
+from .data_rollup_controller import DataRollupController
+from .storage_budget_controller import StorageBudgetController
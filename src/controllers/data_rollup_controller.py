@@ -0,0 +1,123 @@
+"""Controller that aggregates the sensors data and enforces the retention policy"""
+import sqlite3 as sqlite
+from concurrent.futures import ThreadPoolExecutor
+from src.services import DatabaseService, SchedulerService
+from src.utils import (
+    get_logger,
+    GET_SENSORS_DATA_LAST_ROWID,
+    GET_WATERMARK,
+    UPDATE_WATERMARK,
+    ROLLUP_SENSORS_DATA_BY_MINUTE,
+    ROLLUP_SENSORS_DATA_BY_HOUR,
+    DELETE_SENSORS_EXPIRED,
+    DELETE_SENSORS_MINUTE_EXPIRED,
+)
+
+_CONTROLLER_TAG = "controllers.DataRollupController"
+_CONFIG_TAG = "sensors_data_rollup"
+_CONFIG_INTERVAL_TAG = "interval"
+_CONFIG_BATCH_SIZE_TAG = "batch_size"
+_CONFIG_RAW_RETENTION_TAG = "raw_retention"
+_CONFIG_MINUTE_RETENTION_TAG = "minute_retention"
+_WATERMARK_NAME = "sensors_data_rollup"
+
+
+class DataRollupController:
+    """
+    Controller that aggregates the new sensors data into the per-minute and per-hour
+    tables and removes the raw rows and the per-minute rows that are too old.
+    """
+
+    _logger = get_logger(_CONTROLLER_TAG)
+
+    _db_service = DatabaseService.instance()
+
+    def __init__(self, config):
+        """Create the controller"""
+        rollup_config = config[_CONFIG_TAG]
+        self._interval = rollup_config[_CONFIG_INTERVAL_TAG] * 1000
+        self._batch_size = rollup_config[_CONFIG_BATCH_SIZE_TAG]
+        self._raw_retention = f"-{rollup_config[_CONFIG_RAW_RETENTION_TAG]} days"
+        self._minute_retention = (
+            f"-{rollup_config[_CONFIG_MINUTE_RETENTION_TAG]} days"
+        )
+
+        # Only one run at a time, outside of the main loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = None
+        SchedulerService.instance().every(self._interval, self.update, "data_rollup")
+        self._logger.debug("initialized")
+
+    def update(self):
+        """Start a rollup, unless the previous one is still running"""
+        if self._future is not None and not self._future.done():
+            return
+        self._future = self._executor.submit(self._run)
+
+    def _run(self):
+        """Aggregate the new rows, then apply the retention policy"""
+        try:
+            while self.rollup() == self._batch_size:
+                pass
+            self.apply_retention()
+        except sqlite.Error as error:
+            self._logger.error("Rollup failed: %s", error)
+
+    def rollup(self):
+        """
+        Aggregate the sensors data that arrived since the last rollup, at most batch_size rows.
+        :return: number of rows aggregated
+        :rtype: int
+        """
+        result = self._db_service.execute(
+            GET_WATERMARK, [_WATERMARK_NAME], commit=False
+        )
+        watermark = result[0]["last_rowid"] if len(result) > 0 else 0
+        last_rowid = self._db_service.execute(
+            GET_SENSORS_DATA_LAST_ROWID, commit=False
+        )[0][0]
+
+        if last_rowid is None or last_rowid <= watermark:
+            return 0
+
+        upper_rowid = min(last_rowid, watermark + self._batch_size)
+        self._db_service.execute_transaction(
+            [
+                (ROLLUP_SENSORS_DATA_BY_MINUTE, [watermark, upper_rowid]),
+                (ROLLUP_SENSORS_DATA_BY_HOUR, [watermark, upper_rowid]),
+                (UPDATE_WATERMARK, [_WATERMARK_NAME, upper_rowid]),
+            ]
+        )
+        self._logger.debug("Rows %d to %d aggregated", watermark + 1, upper_rowid)
+        return upper_rowid - watermark
+
+    def apply_retention(self):
+        """
+        Delete the raw rows that are transmitted, aggregated and older than the raw
+        retention, then the per-minute rows older than the minute retention.
+        """
+        result = self._db_service.execute(
+            GET_WATERMARK, [_WATERMARK_NAME], commit=False
+        )
+        watermark = result[0]["last_rowid"] if len(result) > 0 else 0
+
+        # Delete by batches to keep the write transactions short
+        deleted = self._batch_size
+        while deleted == self._batch_size:
+            deleted = self._db_service.execute_transaction(
+                [
+                    (
+                        DELETE_SENSORS_EXPIRED,
+                        [watermark, self._raw_retention, self._batch_size],
+                    )
+                ]
+            )
+        self._db_service.execute_transaction(
+            [(DELETE_SENSORS_MINUTE_EXPIRED, [self._minute_retention])]
+        )
+
+    def stop(self):
+        """Wait for the current run to finish"""
+        self._logger.debug("Stopping controller")
+        self._executor.shutdown(wait=True)
+        self._logger.debug("Controller stopped")
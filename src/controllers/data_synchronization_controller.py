@@ -1,20 +1,41 @@
 """Controller that manage the data synchronization"""
+import asyncio
+import heapq
+import sqlite3 as sqlite
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 from src.services import (
     ApiService,
     DatabaseService,
     InternetConnectionService,
+    MetricsService,
+    OutboxService,
+    PlantRegistryService,
 )
+from src.services.outbox_service import (
+    OPERATION_ADD_PLANT,
+    OPERATION_REMOVE_PLANT,
+    OPERATION_SEND_LOGS,
+)
+from src.services.plant_registry_service import PLANT_ADDED, PLANT_REMOVED
 from src.utils import (
     get_logger,
-    GET_UNTRANSMITTED_SENSORS_DATA,
-    GET_UNTRANSMITTED_ACTUATORS_ORDERS,
-    UPDATE_SENSORS_TRANSMITTED_FROM_DATE,
-    UPDATE_ACTUATORS_TRANSMITTED_FROM_DATE,
-    UPDATE_PLANT,
+    GET_UNTRANSMITTED_SENSORS_DATA_PAGE_END,
+    GET_UNTRANSMITTED_SENSORS_DATA_PAGE,
+    GET_UNTRANSMITTED_SENSORS_DATA_COLUMNAR_PAGE,
+    GET_UNTRANSMITTED_ACTUATORS_ORDERS_PAGE_END,
+    GET_UNTRANSMITTED_ACTUATORS_ORDERS_PAGE,
+    GET_UNTRANSMITTED_ACTUATORS_ORDERS_COLUMNAR_PAGE,
+    GET_SENSORS_DATA_LAST_ROWID,
+    GET_ACTUATORS_LAST_ROWID,
+    UPDATE_SENSORS_TRANSMITTED_UP_TO,
+    UPDATE_ACTUATORS_TRANSMITTED_UP_TO,
+    GET_WATERMARK,
+    UPDATE_WATERMARK,
     GET_UNTRANSMITTED_PLANT,
     GET_REMOVED_UNTRANSMITTED_PLANT,
-    UPDATE_PLANT_INFO,
+    GET_ACTIVE_PLANT_BY_POSITION,
     UPDATE_PLANT_TRANSMITTED,
     time_in_millisecond,
 )
@@ -23,6 +44,38 @@ _CONTROLLER_TAG = "controllers.DataSynchronizationController"
 _CONFIG_TAG = "data_synchronization_task"
 _CONFIG_INTERVAL_TAG = "interval"
 _CONFIG_DELAY_TAG = "delay"
+_CONFIG_PAGE_SIZE_TAG = "page_size"
+_CONFIG_TIMEOUT_TAG = "timeout"
+_CONFIG_MIN_INTERVAL_TAG = "min_interval"
+
+_WORKER_COUNT = 2
+# Maximum time between two checks of the tasks, in ms, so a connection that comes
+# back is noticed quickly
+_MAX_SCHEDULER_SLEEP = 1000
+# Maximum factor applied to the interval of a task that keeps failing
+_MAX_FAILURE_BACKOFF = 16
+
+# Prefix of the idempotency keys of the logs pages, followed by the rowid bounds
+_SEND_LOGS_KEY = "send_logs"
+
+# Logs tables uploaded by _send_logs with the queries to find the end of a page, read a
+# page in each encoding, get the last rowid and mark the rows as transmitted.
+_LOGS_TABLES = {
+    "sensors_data": {
+        "page_end": GET_UNTRANSMITTED_SENSORS_DATA_PAGE_END,
+        "page": GET_UNTRANSMITTED_SENSORS_DATA_PAGE,
+        "columnar_page": GET_UNTRANSMITTED_SENSORS_DATA_COLUMNAR_PAGE,
+        "last_rowid": GET_SENSORS_DATA_LAST_ROWID,
+        "mark": UPDATE_SENSORS_TRANSMITTED_UP_TO,
+    },
+    "actuators": {
+        "page_end": GET_UNTRANSMITTED_ACTUATORS_ORDERS_PAGE_END,
+        "page": GET_UNTRANSMITTED_ACTUATORS_ORDERS_PAGE,
+        "columnar_page": GET_UNTRANSMITTED_ACTUATORS_ORDERS_COLUMNAR_PAGE,
+        "last_rowid": GET_ACTUATORS_LAST_ROWID,
+        "mark": UPDATE_ACTUATORS_TRANSMITTED_UP_TO,
+    },
+}
 
 
 class DataSynchronizationController:
@@ -30,152 +83,485 @@ class DataSynchronizationController:
 
     _logger = get_logger(_CONTROLLER_TAG)
 
-    _api_service = ApiService.instance()
+    # pylint: disable=too-many-instance-attributes
 
-    _db_service = DatabaseService.instance()
-
-    _internet_connection_service = InternetConnectionService.instance()
-
-    _send_logs_last_update = 0
-    _new_plant_last_update = 0
-    _removed_plant_last_update = 0
-    _update_local_last_update = 0
+    def __init__(self, config):
+        """Create the controller and start the synchronization engine"""
+        # The services are created with the controller, not when the module is imported
+        self._api_service = ApiService.instance()
+        self._db_service = DatabaseService.instance()
+        self._internet_connection_service = InternetConnectionService.instance()
+        # The API and database calls are blocking, they run on a small pool of workers
+        # driven by a single event loop thread.
+        self._executor = ThreadPoolExecutor(
+            max_workers=_WORKER_COUNT, thread_name_prefix="sync-worker"
+        )
+        self._plant_registry = PlantRegistryService.instance()
+        # The pages of logs are queued one at a time, by the task and by the drain
+        self._queue_logs_lock = threading.Lock()
 
-    _tasks = []
+        # Every mutation goes through the outbox, the tasks below only queue them and
+        # drain_outbox sends them while the API is reachable.
+        self._outbox = OutboxService.instance()
+        self._outbox.register_handler(OPERATION_ADD_PLANT, self._notify_new_plant)
+        self._outbox.register_handler(
+            OPERATION_REMOVE_PLANT, self._notify_removed_plant
+        )
+        self._outbox.register_handler(OPERATION_SEND_LOGS, self._send_logs)
+        self._plant_registry.add_listener(self._on_plant_changed)
 
-    def __init__(self, config):
-        """Create the controller"""
-        self._executor = ThreadPoolExecutor(max_workers=8)
+        self._metrics = MetricsService.instance()
 
         task_config = config[_CONFIG_TAG]
+        self._logs_page_size = task_config["send_logs"][_CONFIG_PAGE_SIZE_TAG]
 
+        # Function of each task, and the function giving its backlog with the backlog
+        # above which its interval is shortened, 0 to only export it
         functions = {
-            "send_logs": self._send_logs,
-            "update_data": self._update_local_plants,
-            "check_new_plant": self._notify_new_plant,
-            "check_removed_plant": self._notify_removed_plant,
+            "send_logs": (self._queue_logs, self._logs_backlog, self._logs_page_size),
+            "update_data": (self._update_local_plants, None, 0),
+            "check_new_plant": (self._queue_new_plants, None, 0),
+            "check_removed_plant": (self._queue_removed_plants, None, 0),
+            "drain_outbox": (self._outbox.drain, self._outbox.pending, 0),
         }
 
-        for key, value in functions.items():
+        # Tasks ordered by deadline, a task is out of the queue while it is running
+        self._tasks = []
+        self._queue = []
+        for index, (key, (function, backlog, backlog_threshold)) in enumerate(
+            functions.items()
+        ):
             interval = task_config[key][_CONFIG_INTERVAL_TAG] * 1000
             delay = task_config[key][_CONFIG_DELAY_TAG] * 1000
 
-            self._tasks.append(
-                {
-                    "interval": interval,
-                    "last_update": time_in_millisecond() - interval + delay,
-                    "function": value,
-                }
-            )
-        # self._logger.debug(self._tasks)
+            task = {
+                "name": key,
+                "index": index,
+                "interval": interval,
+                "min_interval": task_config[key].get(
+                    _CONFIG_MIN_INTERVAL_TAG, task_config[key][_CONFIG_INTERVAL_TAG]
+                )
+                * 1000,
+                "current_interval": interval,
+                "timeout": task_config[key][_CONFIG_TIMEOUT_TAG],
+                "last_update": time_in_millisecond() - interval + delay,
+                "function": function,
+                "backlog": backlog,
+                "backlog_threshold": backlog_threshold,
+                "failures": 0,
+                "running": False,
+                "duration": self._metrics.histogram(
+                    "sync_task_seconds", "Duration of the synchronization tasks", task=key
+                ),
+                "pending": None,
+            }
+            if backlog is not None:
+                task["pending"] = self._metrics.gauge(
+                    "sync_backlog",
+                    "Work pending after the last run of a task: logs rows or outbox "
+                    "entries",
+                    task=key,
+                )
+            self._tasks.append(task)
+            heapq.heappush(self._queue, (task["last_update"] + interval, index, task))
+
+        # Created by _schedule: before Python 3.10 an Event is bound to the loop of the
+        # thread creating it, not to the loop of the engine
+        self._wakeup = None
+        self._loop = asyncio.new_event_loop()
+        self._scheduler = self._loop.create_task(self._schedule())
+        self._thread = threading.Thread(
+            target=self._run_loop, name="sync-engine", daemon=True
+        )
+        self._thread.start()
         self._logger.debug("initialized")
 
-    def update(self):
-        """Check and update the different API call (if needed)"""
+    def _run_loop(self):
+        """Run the event loop of the synchronization engine until stop is called"""
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._scheduler)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
 
-        current_time = time_in_millisecond()
-        for task in self._tasks:
-            time_elapsed = current_time - task["last_update"]
-            if (
-                time_elapsed > task["interval"]
-                and self._internet_connection_service.last_connection_check
-            ):
-                self._executor.submit(task["function"])
-                task["last_update"] = current_time
-
-    def _send_logs(self):
-        """Transmit all the un-transmitted logs from the API"""
-        self._logger.info("Start send logs to the API.")
-        _sensors_data = self._db_service.execute(
-            GET_UNTRANSMITTED_SENSORS_DATA, commit=False
-        )
-        _actuators_data = self._db_service.execute(
-            GET_UNTRANSMITTED_ACTUATORS_ORDERS, commit=False
-        )
+    async def _schedule(self):
+        """
+        Start the tasks when their deadline is reached. A running task is out of the
+        queue, so it can't be started twice, and is pushed back when it is done.
+        """
+        self._wakeup = asyncio.Event()
+        running = set()
+        try:
+            while True:
+                current_time = time_in_millisecond()
+                while len(self._queue) > 0 and self._queue[0][0] <= current_time:
+                    _, index, task = heapq.heappop(self._queue)
+                    if not self._internet_connection_service.last_connection_check:
+                        # Try again soon, the connection may come back
+                        heapq.heappush(
+                            self._queue,
+                            (current_time + _MAX_SCHEDULER_SLEEP, index, task),
+                        )
+                        continue
+                    task["running"] = True
+                    task["last_update"] = current_time
+                    run = asyncio.ensure_future(self._run_task(task))
+                    running.add(run)
+                    run.add_done_callback(running.discard)
 
-        if self._api_service.send_logs(_sensors_data, _actuators_data):
-            if len(_sensors_data) > 0:
-                self._db_service.execute(
-                    UPDATE_SENSORS_TRANSMITTED_FROM_DATE,
-                    parameters=[
-                        _sensors_data[0]["timestamp"],
-                        _sensors_data[-1]["timestamp"],
-                    ],
+                next_update = current_time + _MAX_SCHEDULER_SLEEP
+                if len(self._queue) > 0:
+                    next_update = min(next_update, self._queue[0][0])
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), max(next_update - current_time, 1) / 1000
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            for run in running:
+                run.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+
+    async def _run_task(self, task):
+        """
+        Run a task on a worker. When the timeout is reached, the task is reported but
+        stays running until the worker returns, so it can't be started twice. The task
+        is then pushed back in the queue with an interval adapted to the result.
+        :param task: task to run
+        :type task: dict
+        """
+        start = time.perf_counter()
+        future = self._loop.run_in_executor(self._executor, self._execute, task)
+        succeeded, backlog = False, 0
+        try:
+            try:
+                succeeded, backlog = await asyncio.wait_for(
+                    asyncio.shield(future), task["timeout"]
                 )
-            if len(_actuators_data) > 0:
-                self._db_service.execute(
-                    UPDATE_ACTUATORS_TRANSMITTED_FROM_DATE,
-                    parameters=[
-                        _actuators_data[0]["timestamp"],
-                        _actuators_data[-1]["timestamp"],
-                    ],
+            except asyncio.TimeoutError:
+                self._logger.warning(
+                    "Task %s exceeded its timeout of %d s",
+                    task["name"],
+                    task["timeout"],
                 )
-            self._logger.info("Logs successfully transmitted to the API.")
-        else:
-            self._logger.info("Logs unsuccessfully transmitted to the API.")
+                succeeded, backlog = await future
+        # A cancellation is not an Exception, it goes through to the scheduler
+        except Exception as error:  # pylint: disable=broad-except
+            self._logger.error("Task %s failed: %s", task["name"], error)
+        finally:
+            task["running"] = False
+            task["duration"].observe(time.perf_counter() - start)
+
+        self._metrics.counter(
+            "sync_task_runs_total",
+            "Runs of the synchronization tasks by result",
+            task=task["name"],
+            result="succeeded" if succeeded else "failed",
+        ).inc()
+        if task["pending"] is not None:
+            task["pending"].set(backlog)
+        # The deadlines missed while the task was running are coalesced in one run
+        task["current_interval"] = self._next_interval(task, succeeded, backlog)
+        due_at = max(
+            task["last_update"] + task["current_interval"], time_in_millisecond()
+        )
+        heapq.heappush(self._queue, (due_at, task["index"], task))
+        self._wakeup.set()
 
-    def _notify_new_plant(self):
-        """Notify the API when a new plant is detected"""
-        self._logger.info("Start send new plant to the API.")
-        new_plant = self._db_service.execute(GET_UNTRANSMITTED_PLANT)
+    @staticmethod
+    def _execute(task):
+        """
+        Run the function of a task then measure its backlog, on a worker.
+        :param task: task to run
+        :type task: dict
+        :return: False if the task failed, and the backlog
+        :rtype: (bool, int)
+        """
+        succeeded = task["function"]() is not False
+        backlog = task["backlog"]() if task["backlog"] is not None else 0
+        return succeeded, backlog
 
-        if len(new_plant) == 0:
-            self._logger.info("There is no plant to transmit.")
+    def _next_interval(self, task, succeeded, backlog):
+        """
+        Interval before the next run of a task: doubled on each consecutive failure,
+        shortened, down to min_interval, when the backlog is above its threshold.
+        :param task: task that just ran
+        :type task: dict
+        :param succeeded: False if the task failed
+        :type succeeded: bool
+        :param backlog: amount of work pending for the task
+        :type backlog: int
+        :return: interval in ms
+        :rtype: float
+        """
+        task["failures"] = 0 if succeeded else task["failures"] + 1
+        interval = task["interval"]
+        if task["failures"] > 0:
+            interval *= min(2 ** task["failures"], _MAX_FAILURE_BACKOFF)
+        elif 0 < task["backlog_threshold"] < backlog:
+            interval = max(
+                task["min_interval"], interval * task["backlog_threshold"] / backlog
+            )
+        if interval != task["current_interval"]:
+            self._logger.debug(
+                "Task %s interval set to %d s", task["name"], interval / 1000
+            )
+        return interval
+
+    def _queue_logs(self):
+        """
+        Queue the next page of logs, unless one is already waiting. The page dead-lettered
+        last is queued again as it was, if nothing was transmitted since.
+        """
+        with self._queue_logs_lock:
+            if self._outbox.pending(OPERATION_SEND_LOGS) > 0:
+                return
+            watermarks = {table: self._get_watermark(table) for table in _LOGS_TABLES}
+            dead_letter = self._outbox.last_dead_letter(OPERATION_SEND_LOGS)
+            if dead_letter is not None and all(
+                dead_letter[0].get(table, [None])[0] == watermarks[table]
+                for table in _LOGS_TABLES
+            ):
+                self._outbox.enqueue(OPERATION_SEND_LOGS, *dead_letter)
+                return
+            self._queue_logs_page(watermarks)
+
+    def _queue_logs_page(self, watermarks):
+        """
+        Queue the page of logs following the watermarks. Its rowid bounds are saved in
+        the entry and identify the page, so a retry sends the same rows with the same
+        idempotency key, even if new rows were written since.
+        :param watermarks: last rowid transmitted for each table
+        :type watermarks: dict
+        """
+        bounds = {}
+        for table, queries in _LOGS_TABLES.items():
+            end = self._db_service.execute(
+                queries["page_end"],
+                [watermarks[table], self._logs_page_size],
+                commit=False,
+            )[0][0]
+            bounds[table] = [watermarks[table], end or watermarks[table]]
+        if all(start == end for start, end in bounds.values()):
             return
-        new_plant = new_plant[0]
+        page_key = ":".join(
+            [_SEND_LOGS_KEY] + [f"{start}-{end}" for start, end in bounds.values()]
+        )
+        self._outbox.enqueue(OPERATION_SEND_LOGS, bounds, page_key)
 
-        plant = self._api_service.add_plant(
-            new_plant["planted_at"], new_plant["position"]
+    def _send_logs(self, payload, idempotency_key):
+        """
+        Transmit a page of logs to the API, read from the rowid bounds of the entry. The
+        last rowid acknowledged by the API is saved for each table and the next page is
+        queued, so the whole backlog is sent by the same drain, one page after the other.
+        :param payload: rowid bounds of the page for each table, the start excluded
+        :type payload: dict
+        :return: True if the page was transmitted
+        :rtype: bool
+        """
+        if any(table not in payload for table in _LOGS_TABLES):
+            # Queued by a previous version, for all the logs: replaced by their first page
+            with self._queue_logs_lock:
+                self._queue_logs_page(
+                    {table: self._get_watermark(table) for table in _LOGS_TABLES}
+                )
+            return True
+        bounds = {table: tuple(payload[table]) for table in _LOGS_TABLES}
+        # The columnar encoding needs the timestamps as epoch
+        page_query = "columnar_page" if self._api_service.columnar_logs else "page"
+        pages = {
+            table: (
+                dict(row)
+                for row in self._db_service.stream(queries[page_query], bounds[table])
+            )
+            for table, queries in _LOGS_TABLES.items()
+        }
+
+        # The rows are read from the database while the request body is sent
+        try:
+            sent = self._api_service.send_logs(
+                pages["sensors_data"], pages["actuators"], idempotency_key
+            )
+        finally:
+            for page in pages.values():
+                page.close()
+        if not sent:
+            self._logger.info("Logs page %s unsuccessfully transmitted.", idempotency_key)
+            return False
+
+        statements = []
+        for table, (start, end) in bounds.items():
+            if end == start:
+                continue
+            statements.append((_LOGS_TABLES[table]["mark"], [start, end]))
+            statements.append((UPDATE_WATERMARK, [table, end]))
+        self._db_service.execute_transaction(statements)
+        self._logger.info("Logs page %s transmitted to the API.", idempotency_key)
+
+        with self._queue_logs_lock:
+            self._queue_logs_page({table: end for table, (_, end) in bounds.items()})
+        return True
+
+    def _logs_backlog(self):
+        """
+        :return: number of rows waiting to be sent, approximated from the rowids
+        :rtype: int
+        """
+        backlog = 0
+        for table, queries in _LOGS_TABLES.items():
+            last_rowid = self._db_service.execute(
+                queries["last_rowid"], commit=False
+            )[0][0]
+            backlog += max((last_rowid or 0) - self._get_watermark(table), 0)
+        return backlog
+
+    def _get_watermark(self, table):
+        """
+        Get the last rowid transmitted for a table.
+        :param table: name of the table
+        :type table: str
+        :rtype: int
+        """
+        result = self._db_service.execute(GET_WATERMARK, [table], commit=False)
+        watermark = result[0]["last_rowid"] if len(result) > 0 else 0
+
+        # SQLite reuses the rowids once the last rows of a table are deleted
+        last_rowid = self._db_service.execute(
+            _LOGS_TABLES[table]["last_rowid"], commit=False
+        )[0][0]
+        if last_rowid is None or last_rowid < watermark:
+            self._logger.debug("Rowids of %s were reused, resetting watermark", table)
+            watermark = 0
+        return watermark
+
+    def _on_plant_changed(self, event, plant):
+        """Queue the notification of a plant added or removed as soon as it happens"""
+        if event == PLANT_ADDED:
+            rows = self._db_service.execute(
+                GET_ACTIVE_PLANT_BY_POSITION, [plant.position], commit=False
+            )
+            if len(rows) > 0:
+                self._queue_new_plant(rows[0])
+        elif event == PLANT_REMOVED and plant.uuid is not None:
+            self._queue_removed_plant(plant.uuid)
+
+    def _queue_new_plants(self):
+        """Queue the plants not transmitted yet, e.g. detected before a restart"""
+        for row in self._db_service.execute(GET_UNTRANSMITTED_PLANT, commit=False):
+            self._queue_new_plant(row)
+
+    def _queue_new_plant(self, row):
+        """
+        :param row: row of the plant table
+        :type row: sqlite3.Row
+        """
+        self._outbox.enqueue(
+            OPERATION_ADD_PLANT,
+            {"planted_at": row["planted_at"], "position": row["position"]},
+            f"add_plant:{row['position']}:{row['planted_at']}",
         )
 
-        if plant:
-            self._db_service.execute(
-                UPDATE_PLANT,
-                [
-                    plant.uuid,
-                    plant.moisture_goal,
-                    plant.light_exposure_min_duration,
-                    plant.position,
-                ],
+    def _queue_removed_plants(self):
+        """Queue the removed plants not transmitted yet"""
+        for row in self._db_service.execute(
+            GET_REMOVED_UNTRANSMITTED_PLANT, commit=False
+        ):
+            self._queue_removed_plant(row["uuid"])
+
+    def _queue_removed_plant(self, uuid):
+        """
+        :param uuid: universal unique identifier of the plant removed
+        :type uuid: str
+        """
+        self._outbox.enqueue(
+            OPERATION_REMOVE_PLANT, {"uuid": uuid}, f"remove_plant:{uuid}"
+        )
+
+    def _notify_new_plant(self, payload, idempotency_key):
+        """
+        Notify the API when a new plant is detected
+        :return: True if the API created the plant or the plant is gone
+        :rtype: bool
+        """
+        current = self._plant_registry.get_by_position(payload["position"])
+        if current is None or current.uuid is not None:
+            self._logger.info(
+                "Plant at position %d removed before being transmitted.",
+                payload["position"],
             )
-            self._logger.info("Plant successfully transmitted.")
-        else:
-            self._logger.info("Plant unsuccessfully transmitted.")
+            return True
 
-    def _notify_removed_plant(self):
-        """Notify the API about the plants that was removed"""
-        self._logger.info("Start send removed plant to the API.")
-        plant = self._db_service.execute(GET_REMOVED_UNTRANSMITTED_PLANT)
+        plant = self._api_service.add_plant(
+            payload["planted_at"], payload["position"], idempotency_key
+        )
 
-        if len(plant) == 0:
-            self._logger.info("There is no plant removed to transmit.")
-            return
-        plant = plant[0]
+        if plant:
+            if not self._plant_registry.update_plant(plant):
+                # Removed while the API created it, the API must forget it too
+                self._logger.info(
+                    "Plant at position %d removed while being transmitted.",
+                    payload["position"],
+                )
+                self._queue_removed_plant(plant.uuid)
+                return True
+            self._logger.info("Plant successfully transmitted.")
+            return True
+        self._logger.info("Plant unsuccessfully transmitted.")
+        return False
 
-        if self._api_service.remove_plant(plant["uuid"]):
-            self._db_service.execute(UPDATE_PLANT_TRANSMITTED, [plant["uuid"]])
-            self._logger.info("Removed plant (%s) was successfully transmitted.")
-        else:
-            self._logger.info("Removed plant (%s) unsuccessfully transmitted.")
+    def _notify_removed_plant(self, payload, idempotency_key):
+        """
+        Notify the API about a plant that was removed
+        :return: True if the API acknowledged the removal
+        :rtype: bool
+        """
+        uuid = payload["uuid"]
+        if self._api_service.remove_plant(uuid, idempotency_key):
+            self._db_service.execute(UPDATE_PLANT_TRANSMITTED, [uuid])
+            self._logger.info("Removed plant (%s) was successfully transmitted.", uuid)
+            return True
+        self._logger.info("Removed plant (%s) unsuccessfully transmitted.", uuid)
+        return False
 
     def _update_local_plants(self):
-        """Update the plants data from the API"""
+        """
+        Update the plants data from the API. Only the plants that changed are written,
+        and nothing at all when the API answers that the greenhouse is not modified.
+        :return: False if the API couldn't be reached
+        :rtype: bool
+        """
         self._logger.info("Start gathering plants data from the API.")
         plants = self._api_service.get_greenhouse()
 
-        for plant in plants:
-            self._db_service.execute(
-                UPDATE_PLANT_INFO,
-                parameters=[
-                    plant.moisture_goal,
-                    plant.light_exposure_min_duration,
-                    plant.uuid,
-                ],
-            )
-        self._logger.info("Gathering plants data from the API was successfully.")
+        if plants is None:
+            self._logger.info("Plants data not modified since the last gathering.")
+            return True
+        if plants is False:
+            self._logger.info("Gathering plants data from the API was unsuccessful.")
+            return False
+
+        try:
+            changed = self._plant_registry.update_plants_info(plants)
+        except sqlite.Error:
+            # Get the whole greenhouse again next time
+            self._api_service.reset_greenhouse_cache()
+            raise
+        self._logger.info(
+            "Gathering plants data from the API was successfully (%d plants updated).",
+            len(changed),
+        )
+        return True
 
     def stop(self):
-        """Stop every current future"""
+        """Cancel the scheduled tasks and wait for the workers to finish"""
         self._logger.debug("Stopping controller")
+        self._plant_registry.remove_listener(self._on_plant_changed)
+        self._loop.call_soon_threadsafe(self._scheduler.cancel)
+        self._thread.join()
         self._executor.shutdown(wait=True)
         self._logger.debug("Controller stopped")
@@ -1,8 +1,14 @@
 """HygrometryRegulationController"""
+import time
+
 from src.services import (
+    ActuatorJournalService,
     ADCService,
-    DatabaseService,
+    MetricsService,
+    PlantRegistryService,
     PumpService,
+    SchedulerService,
+    SensorRecorderService,
     ValveService
 )
 from src.utils.configuration import config
@@ -10,11 +16,6 @@ from src.utils import (
     get_logger,
     time_in_millisecond,
 )
-from src.utils.sql_queries import (
-    INSERT_MOISTURE_LEVEL_FOR_PLANT,
-    INSERT_NEW_PLANT,
-    REMOVE_PLANT, INSERT_VALVE_ORDER, INSERT_PUMP_ORDER
-)
 
 _CONTROLLER_TAG = "controllers.HygromertyRegulationController"
 _CONFIG_TAG = "hygrometry"
@@ -37,12 +38,14 @@ class HygrometryRegulationController:
     _adc_service = ADCService.instance()
     _valve_service = ValveService.instance()
     _pump_service = PumpService.instance()
-    _db_service = DatabaseService.instance()
+    _recorder_service = SensorRecorderService.instance()
+    _journal_service = ActuatorJournalService.instance()
 
     def __init__(self):
         """Initialize the Controller"""
 
         hygro_config = config[_CONFIG_TAG]
+        self._plant_registry = PlantRegistryService.instance()
 
         # Hygrometry regulation, one value per plant position
         self._cummulative = [0.0] * 16
@@ -52,7 +55,6 @@ class HygrometryRegulationController:
         self._interval_update = hygro_config[_INTERVAL_UPDATE]
         self._delta_detection = hygro_config[_DELTA_DETECTION]
         self._max_sample_regulation = hygro_config[_MAX_SAMPLE_REGULATION]
-        self._previous_read_time = 0
 
         # water Shot
         self._shot_duration = hygro_config[_SHOT_DURATION]
@@ -68,31 +70,41 @@ class HygrometryRegulationController:
             self._last_read[i] = hygro_value
             self._average[i] = hygro_value
             self._nb_sample[i] = 1
+
+        self._update_duration = MetricsService.instance().histogram(
+            "regulation_update_seconds",
+            "Duration of the updates of the regulations",
+            controller="hygrometry",
+        )
+
+        # The sensors are read on each interval, a shot is ended by a one-shot job when
+        # its duration is elapsed
+        self._scheduler = SchedulerService.instance()
+        self._scheduler.every(
+            self._interval_update,
+            self.update,
+            "hygrometry",
+        )
         self._logger.debug("initialized")
 
-    def update(self, plants):
+    def update(self):
         """
         Execute the following updates:
         - Check for add or removed plants
         - Check for Hygrometry
-        - Give some water shots for hygrometry regulation
-        :param plants: plant list - 16 elements by ASC position
-        :type plants: list of Plant
+        - Plan some water shots for hygrometry regulation
         """
-        self._shot_update(plants)
+        start = time.perf_counter()
+        self._hygrometric_update()
+        self._update_duration.observe(time.perf_counter() - start)
 
-        if time_in_millisecond() - self._previous_read_time > self._interval_update:
-            self._hygrometric_update(plants)
-            self._previous_read_time = time_in_millisecond()
-
-    def _hygrometric_update(self, plants):
+    def _hygrometric_update(self):
         """
-        Check for the added or removed plants and ask for hygrometric regulation
-        :param plants: plant list - 16 elements by ASC position, but it doesn't matter
-        :type plants: list of Plant
+        Check for the added or removed plants and ask for hygrometric regulation. Every
+        position is read, a pot can be placed at an empty one.
         """
-        for plant in plants:
-            i = plant.position
+        for i in range(config[_PLANT_COUNT]):
+            plant = self._plant_registry.get_by_position(i)
             hygro_val = self._adc_service.get_plant_hygrometry_value(i)
 
             # Si on a détecté une diférence d'hygrométrie spontannée on conjuge avec la dernière mesure 
@@ -104,13 +116,13 @@ class HygrometryRegulationController:
                     (difference_last_read >= -self._delta_detection) and (
                     difference_last_read <= self._delta_detection)):
 
-                # If it was an adding
+                # If it was an adding, at a position without plant
                 if hygro_val >= (self._average[i] + self._delta_detection):
-                    # Add to DB
-                    self._db_service.execute(INSERT_NEW_PLANT, [i])
-                else:
-                    # Remove from DB
-                    self._db_service.execute(REMOVE_PLANT, [plants[i].uuid, i])
+                    if plant is None:
+                        plant = self._plant_registry.add_plant(i)
+                elif plant is not None:
+                    self._plant_registry.remove_plant(plant)
+                    plant = None
 
                 # Redo the cumulative for a new average value
                 self._cummulative[i] = self._last_read[i]
@@ -123,9 +135,9 @@ class HygrometryRegulationController:
             # Hygrometric regulation at every MAX SAMPLE BEFORE REGULATION acquisition cycle
             if self._nb_sample[i] == self._max_sample_regulation:
                 self._average[i] = self._cummulative[i] / self._nb_sample[i]
-                if plant.moisture_goal is not None:
-                    # Database Communication
-                    self._db_service.execute(INSERT_MOISTURE_LEVEL_FOR_PLANT, [self._average[i], plants[i].uuid])
+                if plant is not None and plant.moisture_goal is not None:
+                    # Database Communication, only the significant changes are written
+                    self._recorder_service.record_moisture(i, plant.uuid, self._average[i])
                     # Regulation
                     if self._average[i] < plant.moisture_goal:
                         self._query_shot(i)
@@ -140,27 +152,43 @@ class HygrometryRegulationController:
         """
         self._shot_query_queue.append(plant_position)
         self._logger.debug("Shot planned for plant %d", plant_position)
+        self._start_shot()
 
-    def _shot_update(self, plants):
+    def _start_shot(self):
         """
-        Execute the shot query line. Each shot is done one by one.
-        Must be executed as quickly as possible.
-        :param plants: plant list - 16 elements by ASC position, but it doesn't matter
-        :type plants: list of Plant
+        Start the next shot of the query line, unless one is in progress. Each shot is
+        done one by one, its end is scheduled after the shot duration.
+        """
+        if len(self._shot_query_queue) > 0 and not self._query_status:
+            self._previous_shot_time = time_in_millisecond()
+            self._journal_service.record_valve(
+                self._shot_query_queue[0], self._plant_uuid(self._shot_query_queue[0]), True
+            )
+            self._valve_service.open(self._shot_query_queue[0])
+            self._journal_service.record_pump(True)
+            self._pump_service.set_speed(self._pump_speed)
+            self._query_status = True
+            self._scheduler.once(self._shot_duration, self._end_shot, "hygrometry")
+
+    def _end_shot(self):
+        """End the shot in progress, then start the next one"""
+        self._journal_service.record_valve(
+            self._shot_query_queue[0], self._plant_uuid(self._shot_query_queue[0]), False
+        )
+        self._valve_service.close(self._shot_query_queue[0])
+        self._journal_service.record_pump(False)
+        self._pump_service.stop()
+        self._query_status = False
+        self._logger.debug(f"{_CONTROLLER_TAG} Shot Done for plant {self._shot_query_queue[0]}")
+        self._shot_query_queue.pop(0)
+        self._start_shot()
+
+    def _plant_uuid(self, plant_position):
+        """
+        :param plant_position: plant position [0-15]
+        :type plant_position: int
+        :return: uuid of the plant at this position, None if unknown
+        :rtype: str
         """
-        if len(self._shot_query_queue) > 0:
-            if not self._query_status:
-                self._previous_shot_time = time_in_millisecond()
-                self._db_service.execute(INSERT_VALVE_ORDER, [1, plants[self._shot_query_queue[0]].uuid])
-                self._valve_service.open(self._shot_query_queue[0])
-                self._db_service.execute(INSERT_PUMP_ORDER, [1])
-                self._pump_service.set_speed(self._pump_speed)
-                self._query_status = True
-            elif (time_in_millisecond() - self._previous_shot_time) > self._shot_duration:
-                self._db_service.execute(INSERT_VALVE_ORDER, [0, plants[self._shot_query_queue[0]].uuid])
-                self._valve_service.close(self._shot_query_queue[0])
-                self._db_service.execute(INSERT_PUMP_ORDER, [0])
-                self._pump_service.stop()
-                self._query_status = False
-                self._logger.debug(f"{_CONTROLLER_TAG} Shot Done for plant {self._shot_query_queue[0]}")
-                self._shot_query_queue.pop(0)
+        plant = self._plant_registry.get_by_position(plant_position)
+        return plant.uuid if plant is not None else None
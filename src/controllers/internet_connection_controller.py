@@ -6,22 +6,20 @@ from src.bluetooth import DeviceInformationService, SetupDeviceService
 from src.services import (
     BleService,
     InternetConnectionService,
+    SchedulerService,
     StatusIndicatorService,
 )
 from src.utils import (
     get_logger,
-    time_in_millisecond,
     INTERNET_CONNECTION_UNHEALTHY_PATTERN,
 )
 
 _CONTROLLER_TAG = "controllers.InternetConnectionController"
-_TICK_HEALTHY = 10 * 60 * 1000  # wait 10min between each update
-_TICK_UNHEALTHY = (
-    60 * 1000
-)  # wait 1 min between each update when there is no connection
 _WIFI_CREDENTIALS_FILE_PATH = os.getenv(
     "WIFI_CREDENTIALS_YAML_FILE", ".wifi_credentials.yaml"
 )
+# Interval, in ms, between two checks of the result published by the prober
+_UPDATE_INTERVAL = 1000
 
 
 class InternetConnectionController:
@@ -29,9 +27,7 @@ class InternetConnectionController:
 
     _logger = get_logger(_CONTROLLER_TAG)
 
-    _last_update = 0
     _connection_is_healthy = False
-    _tick = _TICK_HEALTHY
 
     def __init__(self, config, config_ble):
         """Create the controller"""
@@ -63,38 +59,36 @@ class InternetConnectionController:
                     )
                     file.close()
 
+        # The connection is probed in the background, update only reads the result
+        self._internet_connection_service.start()
+        SchedulerService.instance().every(
+            _UPDATE_INTERVAL, self.update, "internet_connection"
+        )
         self._logger.debug("Initialization finished")
 
     def update(self):
         """Update the controller"""
-        time_elapsed = time_in_millisecond() - self._last_update
-        if time_elapsed > self._tick:
-            self._logger.debug("running update")
-            # Check connection status
-            connection_is_healthy = self._internet_connection_service.check_connection()
-
-            if connection_is_healthy != self._connection_is_healthy:
-                self._logger.info(
-                    "Connection is %s",
-                    "healthy" if connection_is_healthy is True else "unhealthy",
+        connection_is_healthy = self._internet_connection_service.last_connection_check
+
+        if connection_is_healthy != self._connection_is_healthy:
+            self._logger.info(
+                "Connection is %s",
+                "healthy" if connection_is_healthy is True else "unhealthy",
+            )
+            self._connection_is_healthy = connection_is_healthy
+            self._device_info_service.update_connection_status(
+                self._connection_is_healthy
+            )
+
+            if self._connection_is_healthy is True:
+                StatusIndicatorService.instance().remove_status(
+                    INTERNET_CONNECTION_UNHEALTHY_PATTERN
                 )
-                self._connection_is_healthy = connection_is_healthy
-                self._device_info_service.update_connection_status(
-                    self._connection_is_healthy
+            else:
+                StatusIndicatorService.instance().add_status(
+                    INTERNET_CONNECTION_UNHEALTHY_PATTERN
                 )
 
-                if self._connection_is_healthy is True:
-                    self._tick = _TICK_HEALTHY
-                    StatusIndicatorService.instance().remove_status(
-                        INTERNET_CONNECTION_UNHEALTHY_PATTERN
-                    )
-                else:
-                    self._tick = _TICK_UNHEALTHY
-                    StatusIndicatorService.instance().add_status(
-                        INTERNET_CONNECTION_UNHEALTHY_PATTERN
-                    )
-            self._last_update = time_in_millisecond()
-
     def connect_to_wifi(self, ssid, password, save=True):
         """
         Try to connect to a new wifi network
@@ -109,7 +103,6 @@ class InternetConnectionController:
 
         if result:
             self._logger.info("Connection to %s is successful", ssid)
-            self._last_update = 0
             if save:
                 with open(_WIFI_CREDENTIALS_FILE_PATH, "w") as file:
                     file.write(yaml.dump({"ssid": ssid, "psk": password}))
@@ -119,4 +112,5 @@ class InternetConnectionController:
         """Discard the controller"""
         self._logger.debug("Stopping controller")
         self._ble.stop_advertising()
+        self._internet_connection_service.stop()
         self._logger.debug("Controller stopped")
@@ -1,17 +1,16 @@
 """Controller that manage the luminosity regulation"""
-from datetime import datetime
+import time
+from datetime import timedelta
 from src.services import (
+    ActuatorJournalService,
     ADCService,
-    DatabaseService,
-    LightningLedService
+    LightningLedService,
+    MetricsService,
+    PlantRegistryService,
+    SchedulerService
 )
 from src.utils.configuration import config
-from src.utils import (
-    get_logger,
-    time_in_millisecond,
-)
-
-from src.utils.sql_queries import INSERT_LIGHT_STRIP_ORDER
+from src.utils import clock, get_logger
 
 _CONTROLLER_TAG = "controllers.LuminosityRegulationController"
 _CONFIG_TAG = "luminosity"
@@ -25,7 +24,7 @@ class LuminosityRegulationController:
 
     _logger = get_logger(_CONTROLLER_TAG)
     _adc_instance = ADCService.instance()
-    _db_instance = DatabaseService.instance()
+    _journal_instance = ActuatorJournalService.instance()
     _led_instance = LightningLedService.instance()
 
     def __init__(self):
@@ -34,9 +33,18 @@ class LuminosityRegulationController:
         self._time_zone_offset = config[_TZ_OFFSET]
 
         self._update_time = lum_config["interval_update"]
-        self._time_range_center = lum_config["_TIME_RANGE_CENTER"]
-        self._previous_time = 0
+        self._time_range_center = lum_config[_TIME_RANGE_CENTER]
         self.time = 0
+        self._update_duration = MetricsService.instance().histogram(
+            "regulation_update_seconds",
+            "Duration of the updates of the regulations",
+            controller="luminosity",
+        )
+        SchedulerService.instance().every(
+            self._update_time,
+            lambda: self.update(PlantRegistryService.instance().plants),
+            "luminosity",
+        )
         self._logger.debug("initialized")
 
     def update(self, plants):
@@ -46,23 +54,26 @@ class LuminosityRegulationController:
         :param plants: plant list - 16 elements by ASC position
         :type plants: list
         """
-        if (time_in_millisecond() - self._previous_time) > self._update_time:
-            self._previous_time = time_in_millisecond()
+        start = time.perf_counter()
 
-            # What time is it ?
-            now = datetime.utcnow()
-            hour = (now.hour - self._time_zone_offset) + now.min / 6
+        # What time is it ? Local time, from the clock of the device
+        now = clock().utcnow() + timedelta(hours=self._time_zone_offset)
+        hour = now.hour + now.minute / 60
 
-            # Regulation for plants
-            for plant in plants:
-                if self._is_on(plant, hour):
-                    self._led_instance.turn_on(plant.position, -self._adc_instance.get_ambient_luminosity_value())
-                    self._logger.debug(
-                        "Turn ON Tile %d Lightning (%d %%)",
-                        plant.position, -self._adc_instance.get_ambient_luminosity_value())
-                else:
-                    self._led_instance.turn_off(plant.position)
-                    self._logger.debug("Turn OFF Tile %d Lightning", plant.position)
+        # Regulation for plants
+        for plant in plants:
+            is_on = self._is_on(plant, hour)
+            # Only the changes of state are logged
+            self._journal_instance.record_light_strip(plant.position, plant.uuid, is_on)
+            if is_on:
+                self._led_instance.turn_on(plant.position, -self._adc_instance.get_ambient_luminosity_value())
+                self._logger.debug(
+                    "Turn ON Tile %d Lightning (%d %%)",
+                    plant.position, -self._adc_instance.get_ambient_luminosity_value())
+            else:
+                self._led_instance.turn_off(plant.position)
+                self._logger.debug("Turn OFF Tile %d Lightning", plant.position)
+        self._update_duration.observe(time.perf_counter() - start)
 
     def _is_on(self, plant, hour):
         """
@@ -78,8 +89,4 @@ class LuminosityRegulationController:
                       self._time_range_center + plant.light_exposure_min_duration / 2)
 
         # if we are in the time range, turn on the lighting.
-        if time_range[0] <= hour <= time_range[1]:
-            self._db_instance.execute(INSERT_LIGHT_STRIP_ORDER, [1, plant.uuid])
-            return True
-        self._db_instance.execute(INSERT_LIGHT_STRIP_ORDER, [0, plant.uuid])
-        return False
+        return time_range[0] <= hour <= time_range[1]
@@ -0,0 +1,246 @@
+"""Controller that keeps the database within its storage budget"""
+import os
+import shutil
+import sqlite3 as sqlite
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.services import DatabaseService, SchedulerService
+from src.utils import (
+    get_logger,
+    GET_WATERMARK,
+    UPDATE_WATERMARK,
+    DELETE_SENSORS_EXPIRED,
+    DELETE_ACTUATORS_TRANSMITTED,
+    GET_SENSORS_DATA_COMPACTION_END,
+    COMPACT_SENSORS_DATA,
+    DELETE_SENSORS_DATA_COMPACTED,
+    GET_DATABASE_PAGE_COUNT,
+    GET_DATABASE_FREELIST_COUNT,
+    GET_DATABASE_PAGE_SIZE,
+    GET_DATABASE_AUTO_VACUUM,
+    GET_LOGS_ROW_COUNT,
+    SET_DATABASE_AUTO_VACUUM_INCREMENTAL,
+    VACUUM_DATABASE,
+    INCREMENTAL_VACUUM,
+)
+
+_CONTROLLER_TAG = "controllers.StorageBudgetController"
+_CONFIG_TAG = "storage_budget"
+_CONFIG_INTERVAL_TAG = "interval"
+_CONFIG_MAX_SIZE_TAG = "max_size"
+_CONFIG_MAX_ROWS_TAG = "max_rows"
+_CONFIG_THRESHOLD_TAG = "threshold"
+_CONFIG_BATCH_SIZE_TAG = "batch_size"
+_CONFIG_VACUUM_STEP_TAG = "vacuum_step"
+_ROLLUP_WATERMARK_NAME = "sensors_data_rollup"
+_COMPACTION_WATERMARK_NAME = "sensors_data_compaction"
+
+# auto_vacuum value of the incremental mode
+_AUTO_VACUUM_INCREMENTAL = 2
+# Pause between two vacuum steps, in s, so the other writers can get the database
+_VACUUM_PAUSE = 0.05
+# A full vacuum writes a copy of the database, then the journal of the copy
+_VACUUM_SPACE_FACTOR = 2
+
+
+class StorageBudgetController:
+    """
+    Controller that watches the size of the database and the number of logs. Near the
+    limit, it deletes the logs already transmitted and aggregated, then replaces the
+    oldest logs not transmitted yet by their hourly average, so nothing is lost
+    entirely. The pages released are returned to the file system by small
+    incremental vacuum steps.
+    """
+
+    _logger = get_logger(_CONTROLLER_TAG)
+
+    _db_service = DatabaseService.instance()
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, config):
+        """Create the controller"""
+        budget_config = config[_CONFIG_TAG]
+        self._interval = budget_config[_CONFIG_INTERVAL_TAG] * 1000
+        self._max_size = budget_config[_CONFIG_MAX_SIZE_TAG] * 1024 * 1024
+        self._max_rows = budget_config[_CONFIG_MAX_ROWS_TAG]
+        self._threshold = budget_config[_CONFIG_THRESHOLD_TAG]
+        self._batch_size = budget_config[_CONFIG_BATCH_SIZE_TAG]
+        self._vacuum_step = budget_config[_CONFIG_VACUUM_STEP_TAG]
+
+        # Only one run at a time, outside of the main loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = None
+        self._stopping = False
+        self._incremental_vacuum = False
+        self._vacuum_mode_checked = False
+        SchedulerService.instance().every(self._interval, self.update, "storage_budget")
+        self._logger.debug("initialized")
+
+    def update(self):
+        """Check the budget, unless the previous check is still running"""
+        if self._future is not None and not self._future.done():
+            return
+        self._future = self._executor.submit(self._run)
+
+    def _run(self):
+        """Free some space if the budget is nearly used, then shrink the file"""
+        try:
+            if not self._vacuum_mode_checked:
+                self._vacuum_mode_checked = True
+                self._enable_incremental_vacuum()
+            usage = self.usage()
+            if self._over_threshold(usage):
+                self._logger.warning("Storage budget nearly used: %s", usage)
+                self._free_space()
+                self._logger.info("Storage after compaction: %s", self.usage())
+            self.vacuum()
+        except sqlite.Error as error:
+            self._logger.error("Storage budget check failed: %s", error)
+
+    def usage(self):
+        """
+        Size of the database file, in bytes, with the part used by the data, and number
+        of logs in each table
+        :rtype: dict
+        """
+        page_size = self._db_service.execute(GET_DATABASE_PAGE_SIZE, commit=False)[0][0]
+        page_count = self._db_service.execute(GET_DATABASE_PAGE_COUNT, commit=False)[0][0]
+        freelist_count = self._db_service.execute(
+            GET_DATABASE_FREELIST_COUNT, commit=False
+        )[0][0]
+        sensors_data, actuators = self._db_service.execute(
+            GET_LOGS_ROW_COUNT, commit=False
+        )[0]
+        return {
+            "file_size": page_count * page_size,
+            "used_size": (page_count - freelist_count) * page_size,
+            "sensors_data": sensors_data,
+            "actuators": actuators,
+        }
+
+    def _over_threshold(self, usage):
+        """
+        :return: True if the data or the logs use more than the threshold of the budget
+        :rtype: bool
+        """
+        return (
+            usage["used_size"] >= self._max_size * self._threshold
+            or usage["sensors_data"] + usage["actuators"]
+            >= self._max_rows * self._threshold
+        )
+
+    def _free_space(self):
+        """
+        Delete the transmitted logs already aggregated, whatever their age, then
+        compact the oldest logs not transmitted until the usage is under the threshold
+        """
+        rollup_watermark = self._get_watermark(_ROLLUP_WATERMARK_NAME)
+        deleted = self._batch_size
+        while deleted == self._batch_size and not self._stopping:
+            deleted = self._db_service.execute_transaction(
+                [(DELETE_SENSORS_EXPIRED, [rollup_watermark, "-0 days", self._batch_size])]
+            )
+        self._db_service.execute_transaction([(DELETE_ACTUATORS_TRANSMITTED, [])])
+
+        while self._over_threshold(self.usage()) and not self._stopping:
+            if self.compact(rollup_watermark) == 0:
+                self._logger.warning("Nothing left to compact, storage budget exceeded")
+                return
+
+    def compact(self, rollup_watermark):
+        """
+        Replace the oldest logs not transmitted, at most batch_size, by their hourly
+        average. Only the logs already aggregated by the rollup are compacted, and the
+        averages aren't aggregated again.
+        :param rollup_watermark: last rowid aggregated by the rollup
+        :type rollup_watermark: int
+        :return: number of rows changed, 0 when there is nothing left to compact
+        :rtype: int
+        """
+        watermark = self._get_watermark(_COMPACTION_WATERMARK_NAME)
+        upper_rowid = self._db_service.execute(
+            GET_SENSORS_DATA_COMPACTION_END,
+            [watermark, rollup_watermark, self._batch_size],
+            commit=False,
+        )[0][0]
+        if upper_rowid is None:
+            return 0
+
+        compacted = self._db_service.execute_transaction(
+            [
+                (COMPACT_SENSORS_DATA, [watermark, upper_rowid]),
+                (DELETE_SENSORS_DATA_COMPACTED, [watermark, upper_rowid]),
+                (UPDATE_WATERMARK, [_COMPACTION_WATERMARK_NAME, upper_rowid]),
+            ]
+        )
+        self._logger.debug("Rows %d to %d compacted", watermark + 1, upper_rowid)
+        return compacted
+
+    def vacuum(self):
+        """Return the free pages to the file system, a few pages at a time"""
+        if not self._incremental_vacuum:
+            return
+        released = 0
+        while not self._stopping:
+            free_pages = self._db_service.execute(
+                GET_DATABASE_FREELIST_COUNT, commit=False
+            )[0][0]
+            if free_pages == 0:
+                break
+            self._db_service.execute_script(
+                INCREMENTAL_VACUUM.format(min(free_pages, self._vacuum_step))
+            )
+            released += min(free_pages, self._vacuum_step)
+            time.sleep(_VACUUM_PAUSE)
+        if released > 0:
+            self._logger.info("%d pages released by the incremental vacuum", released)
+
+    def _enable_incremental_vacuum(self):
+        """
+        Check that the database uses the incremental auto vacuum, the new databases are
+        created with it. A database created without it needs one full vacuum, which
+        blocks the writers while the database is rebuilt: it is only done when the
+        disk has room for the copy, the free pages are kept in the file otherwise.
+        Checked once after each start.
+        """
+        mode = self._db_service.execute(GET_DATABASE_AUTO_VACUUM, commit=False)[0][0]
+        if mode == _AUTO_VACUUM_INCREMENTAL:
+            self._incremental_vacuum = True
+            return
+        file_size = self.usage()["file_size"]
+        free_space = shutil.disk_usage(
+            os.path.dirname(os.path.abspath(self._db_service.path))
+        ).free
+        if free_space < file_size * _VACUUM_SPACE_FACTOR:
+            self._logger.warning(
+                "Incremental vacuum not enabled, a full vacuum of the %d MiB database "
+                "needs %d MiB of free space (%d MiB left)",
+                file_size // (1024 * 1024),
+                file_size * _VACUUM_SPACE_FACTOR // (1024 * 1024),
+                free_space // (1024 * 1024),
+            )
+            return
+        self._logger.info(
+            "Enabling the incremental vacuum, the %d MiB database is rebuilt",
+            file_size // (1024 * 1024),
+        )
+        self._db_service.execute(SET_DATABASE_AUTO_VACUUM_INCREMENTAL)
+        self._db_service.execute(VACUUM_DATABASE)
+        self._incremental_vacuum = True
+
+    def _get_watermark(self, name):
+        """
+        :param name: name of the watermark
+        :type name: str
+        :rtype: int
+        """
+        result = self._db_service.execute(GET_WATERMARK, [name], commit=False)
+        return result[0]["last_rowid"] if len(result) > 0 else 0
+
+    def stop(self):
+        """Interrupt the current run and wait for it to finish"""
+        self._logger.debug("Stopping controller")
+        self._stopping = True
+        self._executor.shutdown(wait=True)
+        self._logger.debug("Controller stopped")
@@ -0,0 +1,5 @@
+from src.errors.http_error import HttpError
+
+
+class CircuitOpenError(HttpError):
+    """The request wasn't sent because the circuit breaker is open."""
@@ -0,0 +1,2 @@
+"""Hardware abstraction layer module"""
+from .hardware import hardware, BACKEND_RASPBERRY_PI, BACKEND_SIMULATED
@@ -0,0 +1,48 @@
+"""Selection of the hardware backend, the Raspberry Pi or its simulation"""
+import threading
+
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+
+_HAL_TAG = "hal.Hardware"
+_CONFIG_TAG = "hal"
+_BACKEND_TAG = "backend"
+
+BACKEND_RASPBERRY_PI = "raspberry_pi"
+BACKEND_SIMULATED = "simulated"
+
+_logger = get_logger(_HAL_TAG)
+_lock = threading.Lock()
+_hardware = None
+
+
+def hardware():
+    """
+    Get the hardware of the device, created on first use with the configured backend.
+    Both backends expose:
+    - gpio: setup(pin), output(pin, high), pwm(pin, frequency) and cleanup(), the PWM
+    has start(duty_cycle) and change_duty_cycle(duty_cycle);
+    - adc: channel(number), the channel has a voltage property read over I2C;
+    - neopixel(pin, count): a strip supporting fill, brightness, item assignment and
+    show().
+    The modules of a backend are only imported when it is selected, the simulation
+    runs without the libraries of the Raspberry Pi.
+    :rtype: RaspberryPi or Simulation
+    """
+    global _hardware  # pylint: disable=global-statement
+    with _lock:
+        if _hardware is None:
+            backend = config[_CONFIG_TAG][_BACKEND_TAG]
+            # pylint: disable=import-outside-toplevel
+            if backend == BACKEND_SIMULATED:
+                from src.hal.simulated import Simulation
+
+                _hardware = Simulation(config)
+            elif backend == BACKEND_RASPBERRY_PI:
+                from src.hal.raspberry_pi import RaspberryPi
+
+                _hardware = RaspberryPi(config)
+            else:
+                raise ValueError(f"Unknown hardware backend: {backend}")
+            _logger.info("initialized (backend: %s)", backend)
+        return _hardware
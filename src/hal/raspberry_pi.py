@@ -0,0 +1,177 @@
+"""Hardware of the Raspberry Pi: GPIO, ADS1115 over I2C and NeoPixel strips"""
+import threading
+
+from RPi import GPIO
+import board
+import busio
+import adafruit_ads1x15.ads1115 as ads
+from adafruit_ads1x15.analog_in import AnalogIn
+from neopixel import NeoPixel
+
+_ADC_CONFIG_TAG = "adc_config"
+_I2C_PIN_SDA = "i2c_sda"
+_I2C_PIN_SCL = "i2c_scl"
+
+
+class RaspberryPi:
+    """
+    Hardware of the device, the I2C bus is opened when the ADC is first used
+    """
+
+    def __init__(self, config):
+        """
+        :param config: configuration of the device
+        :type config: dict
+        """
+        adc_config = config[_ADC_CONFIG_TAG]
+        self._i2c_pins = (adc_config[_I2C_PIN_SCL], adc_config[_I2C_PIN_SDA])
+        self.gpio = RaspberryPiGpio()
+        self._adc = None
+        self._lock = threading.Lock()
+
+    @property
+    def adc(self):
+        """
+        :rtype: RaspberryPiAdc
+        """
+        with self._lock:
+            if self._adc is None:
+                self._adc = RaspberryPiAdc(*self._i2c_pins)
+            return self._adc
+
+    @staticmethod
+    def neopixel(pin, count):
+        """
+        :param pin: number of the GPIO of the data line
+        :type pin: int
+        :param count: number of LEDs
+        :type count: int
+        :return: the strip, written on show() only
+        :rtype: NeoPixel
+        """
+        return NeoPixel(pin_number_to_digital_gpio(pin), count, auto_write=False)
+
+
+class RaspberryPiGpio:
+    """GPIO of the Raspberry Pi, used as outputs"""
+
+    @staticmethod
+    def setup(pin):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        """
+        GPIO.setup(pin, GPIO.OUT)
+
+    @staticmethod
+    def output(pin, high):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        :param high: True for the high level
+        :type high: bool
+        """
+        GPIO.output(pin, GPIO.HIGH if high else GPIO.LOW)
+
+    @staticmethod
+    def pwm(pin, frequency):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        :param frequency: frequency in Hz
+        :type frequency: float
+        :rtype: RaspberryPiPwm
+        """
+        return RaspberryPiPwm(GPIO.PWM(pin, frequency))
+
+    @staticmethod
+    def cleanup():
+        """Release the GPIO"""
+        GPIO.cleanup()
+
+
+class RaspberryPiPwm:
+    """Software PWM of a GPIO"""
+
+    def __init__(self, pwm):
+        """
+        :param pwm: PWM of RPi.GPIO
+        """
+        self._pwm = pwm
+
+    def start(self, duty_cycle):
+        """
+        :param duty_cycle: duty cycle in percent [0.0-100.0]
+        :type duty_cycle: float
+        """
+        self._pwm.start(duty_cycle)
+
+    def change_duty_cycle(self, duty_cycle):
+        """
+        :param duty_cycle: duty cycle in percent [0.0-100.0]
+        :type duty_cycle: float
+        """
+        self._pwm.ChangeDutyCycle(duty_cycle)
+
+
+class RaspberryPiAdc:
+    """ADS1115 on the I2C bus"""
+
+    def __init__(self, scl, sda):
+        """
+        :param scl: GPIO of the clock line
+        :param sda: GPIO of the data line
+        """
+        self._adc = ads.ADS1115(busio.I2C(scl, sda))
+
+    def channel(self, number):
+        """
+        :param number: input of the ADC [0-3]
+        :type number: int
+        :return: the channel, its voltage is converted on each read
+        :rtype: AnalogIn
+        """
+        return AnalogIn(self._adc, number)
+
+
+def pin_number_to_digital_gpio(pin):
+    """
+    Convert a number into a digital GPIO
+    :param pin: number of the GPIO
+    :type pin: int
+    :return: GPIO Pin
+    :rtype: Pin
+    """
+
+    pins = [
+        board.D0,
+        board.D1,
+        board.D2,
+        board.D3,
+        board.D4,
+        board.D5,
+        board.D6,
+        board.D7,
+        board.D8,
+        board.D9,
+        board.D10,
+        board.D11,
+        board.D12,
+        board.D13,
+        board.D14,
+        board.D15,
+        board.D16,
+        board.D17,
+        board.D18,
+        board.D19,
+        board.D20,
+        board.D21,
+        board.D22,
+        board.D23,
+        board.D24,
+        board.D25,
+        board.D26,
+        board.D27,
+    ]
+
+    return pins[pin]
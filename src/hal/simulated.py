@@ -0,0 +1,485 @@
+"""Simulated hardware, to run and profile the device without the Raspberry Pi"""
+import math
+import random
+import threading
+from datetime import timedelta
+
+from src.utils.clock import clock
+
+_CONFIG_TAG = "hal"
+_SIMULATED_TAG = "simulated"
+_I2C_CONVERSION_TIME_TAG = "i2c_conversion_time"
+_SHOW_TIME_PER_LED_TAG = "show_time_per_led"
+_SENSOR_NOISE_TAG = "sensor_noise"
+_TANK_VOLUME_TAG = "tank_volume"
+_PUMP_FLOW_TAG = "pump_flow"
+_POT_CAPACITY_TAG = "pot_capacity"
+_MOISTURE_TAG = "moisture"
+_DRYING_RATE_TAG = "drying_rate"
+_MAX_LIGHT_TAG = "max_light"
+_SUNRISE_TAG = "sunrise"
+_SUNSET_TAG = "sunset"
+_TZ_OFFSET = "time_zone_offset"
+
+_ADC_CONFIG_TAG = "adc_config"
+_ADC_CHANNEL_WATER_LEVEL = "adc_channel_water_level"
+_ADC_CHANNEL_AMBIENT_LUMINOSITY = "adc_channel_ambient_luminosity"
+_ADC_CHANNEL_PLANT_HYGROMETRY = "adc_channel_plant_hygrometry"
+_VALVE_CONFIG_TAG = "valve"
+_VALVE_PIN_CONFIG_KEY = "gpio_position_out"
+_VALVE_POSITION_OFF = "position_off"
+_VALVE_POSITION_ON = "position_on"
+_PUMP_CONFIG_TAG = "pump"
+_PUMP_PIN_CONFIG_KEY = "gpio_speed_out"
+# Selectors of the multiplexers, from the least significant bit
+_SELECTOR_PINS = (
+    "gpio_selector_pin_S0",
+    "gpio_selector_pin_S1",
+    "gpio_selector_pin_S2",
+    "gpio_selector_pin_S3",
+)
+
+_POSITIONS = 16
+_HOUR_TO_MILLISECONDS = 3600 * 1000
+# Range of the level sensor, in mL
+_TANK_MIN_VOLUME = 160
+_TANK_MAX_VOLUME = 1150
+# Darkest luminosity given to the ADC conversion, in %, which can't convert 0
+_MIN_LUMINOSITY = 0.01
+# Full scale of the ADS1115 with a gain of 1, in V
+_ADC_FULL_SCALE = 4.096
+
+
+class Simulation:
+    """
+    Simulated hardware of the device. The GPIO drive a physical model of the
+    greenhouse which is read back by the ADC, the I2C conversions and the NeoPixel
+    writes take as long as on the device. Everything follows the clock of the device,
+    a virtual clock runs the model faster than real time.
+    """
+
+    def __init__(self, config):
+        """
+        :param config: configuration of the device
+        :type config: dict
+        """
+        simulated_config = config[_CONFIG_TAG][_SIMULATED_TAG]
+        self._show_time_per_led = simulated_config[_SHOW_TIME_PER_LED_TAG] / 1000
+        self.gpio = SimulatedGpio()
+        self.greenhouse = Greenhouse(config, self.gpio)
+        self.adc = SimulatedAdc(
+            self.greenhouse, simulated_config[_I2C_CONVERSION_TIME_TAG] / 1000
+        )
+
+    def neopixel(self, pin, count):  # pylint: disable=unused-argument
+        """
+        :param pin: number of the GPIO of the data line
+        :type pin: int
+        :param count: number of LEDs
+        :type count: int
+        :rtype: SimulatedNeoPixel
+        """
+        return SimulatedNeoPixel(count, self._show_time_per_led)
+
+
+class SimulatedGpio:
+    """GPIO kept in memory, the changes of duty cycle are sent to the watchers"""
+
+    def __init__(self):
+        self._levels = {}
+        self._duty_cycles = {}
+        self._watchers = []
+        self._lock = threading.Lock()
+
+    def setup(self, pin):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        """
+        with self._lock:
+            self._levels.setdefault(pin, False)
+
+    def output(self, pin, high):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        :param high: True for the high level
+        :type high: bool
+        """
+        with self._lock:
+            self._levels[pin] = bool(high)
+
+    def pwm(self, pin, frequency):  # pylint: disable=unused-argument
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        :param frequency: frequency in Hz
+        :type frequency: float
+        :rtype: SimulatedPwm
+        """
+        return SimulatedPwm(self, pin)
+
+    def cleanup(self):
+        """Reset every GPIO"""
+        with self._lock:
+            self._levels.clear()
+            self._duty_cycles.clear()
+
+    def level(self, pin):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        :return: True if the GPIO is high
+        :rtype: bool
+        """
+        with self._lock:
+            return self._levels.get(pin, False)
+
+    def duty_cycle(self, pin):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        :return: duty cycle of the PWM in percent, 0 without PWM
+        :rtype: float
+        """
+        with self._lock:
+            return self._duty_cycles.get(pin, 0.0)
+
+    def watch(self, watcher):
+        """
+        :param watcher: function called with the pin and the duty cycle each time a
+        duty cycle changes
+        :type watcher: Callable[[int, float], None]
+        """
+        self._watchers.append(watcher)
+
+    def set_duty_cycle(self, pin, duty_cycle):
+        """
+        :param pin: number of the GPIO
+        :type pin: int
+        :param duty_cycle: duty cycle in percent [0.0-100.0]
+        :type duty_cycle: float
+        """
+        with self._lock:
+            self._duty_cycles[pin] = duty_cycle
+        for watcher in self._watchers:
+            watcher(pin, duty_cycle)
+
+
+class SimulatedPwm:
+    """PWM of a simulated GPIO"""
+
+    def __init__(self, gpio, pin):
+        """
+        :type gpio: SimulatedGpio
+        :type pin: int
+        """
+        self._gpio = gpio
+        self._pin = pin
+
+    def start(self, duty_cycle):
+        """
+        :param duty_cycle: duty cycle in percent [0.0-100.0]
+        :type duty_cycle: float
+        """
+        self._gpio.set_duty_cycle(self._pin, duty_cycle)
+
+    def change_duty_cycle(self, duty_cycle):
+        """
+        :param duty_cycle: duty cycle in percent [0.0-100.0]
+        :type duty_cycle: float
+        """
+        self._gpio.set_duty_cycle(self._pin, duty_cycle)
+
+
+class SimulatedAdc:
+    """ADC reading the greenhouse, each read waits for the conversion time"""
+
+    def __init__(self, greenhouse, conversion_time):
+        """
+        :type greenhouse: Greenhouse
+        :param conversion_time: duration of a read, in s
+        :type conversion_time: float
+        """
+        self._greenhouse = greenhouse
+        self._conversion_time = conversion_time
+
+    def channel(self, number):
+        """
+        :param number: input of the ADC [0-3]
+        :type number: int
+        :rtype: SimulatedAnalogIn
+        """
+        return SimulatedAnalogIn(self, number)
+
+    def read(self, number):
+        """
+        :param number: input of the ADC [0-3]
+        :type number: int
+        :return: voltage of the input
+        :rtype: float
+        """
+        clock().sleep(self._conversion_time)
+        return self._greenhouse.voltage(number)
+
+
+class SimulatedAnalogIn:
+    """Input of the simulated ADC"""
+
+    def __init__(self, adc, number):
+        """
+        :type adc: SimulatedAdc
+        :type number: int
+        """
+        self._adc = adc
+        self._number = number
+
+    @property
+    def voltage(self):
+        """
+        :rtype: float
+        """
+        return self._adc.read(self._number)
+
+
+class SimulatedNeoPixel:
+    """NeoPixel strip kept in memory, a write lasts the time to send every LED"""
+
+    def __init__(self, count, show_time_per_led):
+        """
+        :param count: number of LEDs
+        :type count: int
+        :param show_time_per_led: duration of the write of one LED, in s
+        :type show_time_per_led: float
+        """
+        self._pixels = [(0, 0, 0)] * count
+        self._show_time = count * show_time_per_led
+        self.brightness = 1.0
+        # Colors and brightness of the last write
+        self._written = (list(self._pixels), self.brightness)
+        self.shows = 0
+
+    def __len__(self):
+        return len(self._pixels)
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def __setitem__(self, index, color):
+        self._pixels[index] = tuple(color)
+
+    def fill(self, color):
+        """
+        :param color: color of every LED
+        :type color: tuple
+        """
+        self._pixels = [tuple(color)] * len(self._pixels)
+
+    def show(self):
+        """Write the colors to the strip"""
+        clock().sleep(self._show_time)
+        self._written = (list(self._pixels), self.brightness)
+        self.shows += 1
+
+    @property
+    def shown(self):
+        """
+        :return: colors of the last write, with the brightness applied
+        :rtype: list of tuple
+        """
+        pixels, brightness = self._written
+        return [
+            tuple(round(component * brightness) for component in color)
+            for color in pixels
+        ]
+
+
+class Greenhouse:
+    """
+    Physical model of the greenhouse. The pump draws the water of the tank into the
+    pots behind the open valves, the soil dries over time and the ambient light
+    follows the sun, at the local time of the clock. The model is advanced to the current time before each change of
+    the actuators and each read of the sensors, the voltages read are the ones the
+    ADCService converts back to the values of the model.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, config, gpio):
+        """
+        :param config: configuration of the device
+        :type config: dict
+        :param gpio: GPIO driving the pump and the valves
+        :type gpio: SimulatedGpio
+        """
+        simulated_config = config[_CONFIG_TAG][_SIMULATED_TAG]
+        adc_config = config[_ADC_CONFIG_TAG]
+        valve_config = config[_VALVE_CONFIG_TAG]
+        self._gpio = gpio
+        self._noise = simulated_config[_SENSOR_NOISE_TAG]
+        # mL/ms at full speed
+        self._pump_flow = simulated_config[_PUMP_FLOW_TAG] / 1000
+        self._pot_capacity = simulated_config[_POT_CAPACITY_TAG]
+        # %/ms
+        self._drying_rate = simulated_config[_DRYING_RATE_TAG] / _HOUR_TO_MILLISECONDS
+        self._max_luminosity = simulated_config[_MAX_LIGHT_TAG]
+        self._sunrise = simulated_config[_SUNRISE_TAG]
+        self._sunset = simulated_config[_SUNSET_TAG]
+        self._time_zone_offset = timedelta(hours=config[_TZ_OFFSET])
+
+        self._channels = {
+            adc_config[_ADC_CHANNEL_AMBIENT_LUMINOSITY]: self._luminosity_voltage,
+            adc_config[_ADC_CHANNEL_WATER_LEVEL]: self._water_level_voltage,
+            adc_config[_ADC_CHANNEL_PLANT_HYGROMETRY]: self._hygrometry_voltage,
+        }
+        self._plant_selectors = [adc_config[pin] for pin in _SELECTOR_PINS]
+        self._valve_selectors = [valve_config[pin] for pin in _SELECTOR_PINS]
+        self._valve_pin = valve_config[_VALVE_PIN_CONFIG_KEY]
+        self._pump_pin = config[_PUMP_CONFIG_TAG][_PUMP_PIN_CONFIG_KEY]
+        self._valve_positions = {
+            valve_config[_VALVE_POSITION_ON]: True,
+            valve_config[_VALVE_POSITION_OFF]: False,
+        }
+
+        self._tank_volume = simulated_config[_TANK_VOLUME_TAG]
+        self._moisture = [float(simulated_config[_MOISTURE_TAG])] * _POSITIONS
+        self._valves = [False] * _POSITIONS
+        self._pump_duty_cycle = 0.0
+        self._updated_at = clock().monotonic()
+        self._lock = threading.Lock()
+        gpio.watch(self._on_duty_cycle)
+
+    @property
+    def state(self):
+        """
+        Volume of the tank in mL, moisture of each pot in %, valves open and duty cycle
+        of the pump
+        :rtype: dict
+        """
+        with self._lock:
+            self._advance()
+            return {
+                "tank_volume": self._tank_volume,
+                "moisture": list(self._moisture),
+                "valves": list(self._valves),
+                "pump_duty_cycle": self._pump_duty_cycle,
+            }
+
+    def voltage(self, channel):
+        """
+        :param channel: input of the ADC
+        :type channel: int
+        :return: voltage of the sensor connected to the input, with its noise
+        :rtype: float
+        """
+        with self._lock:
+            self._advance()
+            voltage = self._channels[channel]()
+        voltage += random.gauss(0.0, self._noise)
+        return min(max(voltage, 0.0), _ADC_FULL_SCALE)
+
+    def _on_duty_cycle(self, pin, duty_cycle):
+        """Start or stop the pump, open or close the valve selected"""
+        if pin == self._pump_pin:
+            self.set_pump(duty_cycle)
+        elif pin == self._valve_pin and duty_cycle in self._valve_positions:
+            self.set_valve(
+                self._selected(self._valve_selectors), self._valve_positions[duty_cycle]
+            )
+
+    def set_pump(self, duty_cycle):
+        """
+        Drive the pump without the GPIO, e.g. from the state reported by the actuation
+        process
+        :param duty_cycle: duty cycle of the PWM of the pump, in %
+        :type duty_cycle: float
+        """
+        with self._lock:
+            self._advance()
+            self._pump_duty_cycle = duty_cycle
+
+    def set_valve(self, position, opened):
+        """
+        Open or close a valve without the GPIO
+        :param position: position of the valve [0-15]
+        :type position: int
+        :param opened: True if the valve is open
+        :type opened: bool
+        """
+        with self._lock:
+            self._advance()
+            self._valves[position] = opened
+
+    def refill(self, volume):
+        """
+        Fill the tank
+        :param volume: volume of water in the tank, in mL
+        :type volume: float
+        """
+        with self._lock:
+            self._advance()
+            self._tank_volume = volume
+
+    def _advance(self):
+        """Water the pots and dry the soil since the last update"""
+        now = clock().monotonic()
+        elapsed = now - self._updated_at
+        if elapsed <= 0:
+            return
+        self._updated_at = now
+
+        open_valves = [position for position, opened in enumerate(self._valves) if opened]
+        if self._pump_duty_cycle > 0 and len(open_valves) > 0:
+            pumped = min(
+                self._pump_flow * self._pump_duty_cycle / 100 * elapsed,
+                self._tank_volume,
+            )
+            self._tank_volume -= pumped
+            for position in open_valves:
+                self._moisture[position] += (
+                    pumped / len(open_valves) / self._pot_capacity * 100
+                )
+        self._moisture = [
+            min(max(moisture - self._drying_rate * elapsed, 0.0), 100.0)
+            for moisture in self._moisture
+        ]
+
+    def _selected(self, selectors):
+        """
+        :param selectors: GPIO of the selectors of a multiplexer, S0 first
+        :type selectors: list of int
+        :return: position selected by the multiplexer [0-15]
+        :rtype: int
+        """
+        return sum(
+            1 << bit for bit, pin in enumerate(selectors) if self._gpio.level(pin)
+        )
+
+    def _luminosity_voltage(self):
+        """
+        :return: voltage of the light sensor, inverse of the conversion of the ADCService
+        :rtype: float
+        """
+        now = clock().utcnow() + self._time_zone_offset
+        hour = now.hour + now.minute / 60 + now.second / 3600
+        luminosity = _MIN_LUMINOSITY
+        if self._sunrise < hour < self._sunset:
+            daylight = (hour - self._sunrise) / (self._sunset - self._sunrise)
+            luminosity = max(self._max_luminosity * math.sin(math.pi * daylight), luminosity)
+        return math.log(luminosity / 2.62e-6) / 5.78
+
+    def _water_level_voltage(self):
+        """
+        :return: voltage of the level sensor, inverse of the conversion of the ADCService
+        :rtype: float
+        """
+        volume = min(max(self._tank_volume, _TANK_MIN_VOLUME), _TANK_MAX_VOLUME)
+        return (volume / 3469) ** (-1 / 2.91)
+
+    def _hygrometry_voltage(self):
+        """
+        :return: voltage of the hygrometer selected, inverse of the conversion of the
+        ADCService
+        :rtype: float
+        """
+        return (140 - self._moisture[self._selected(self._plant_selectors)]) / 38.3
@@ -46,3 +46,19 @@ class Plant:
             if "override_light_exposure_min_duration" in data
             else data["type"]["light_exposure_min_duration"],
         )
+
+    @staticmethod
+    def create_from_row(row):
+        """
+        Instantiate a plant from a row of the plant table
+        :param row: row of the plant table
+        :type row: sqlite3.Row|dict
+        :return instance of the plant
+        :rtype: Plant
+        """
+        return Plant(
+            row["uuid"],
+            row["position"],
+            row["moisture_goal"],
+            row["light_exposure_min_duration"],
+        )
@@ -8,3 +8,11 @@ from .internet_connection_service import InternetConnectionService
 from .adc_service import ADCService
 from .database_service import DatabaseService
 from .api_service import ApiService
+from .plant_registry_service import PlantRegistryService
+from .outbox_service import OutboxService
+from .actuator_journal_service import ActuatorJournalService
+from .sensor_recorder_service import SensorRecorderService
+from .http_transport_service import HttpTransportService
+from .metrics_service import MetricsService
+from .scheduler_service import SchedulerService
+from .actuation_service import ActuationService
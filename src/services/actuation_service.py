@@ -0,0 +1,364 @@
+"""Service sending the orders of the valves and the pump to the actuation process"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from src.hal import hardware
+from src.services.metrics_service import MetricsService
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+from src.utils.shared_ring import SharedRing
+
+_SERVICE_TAG = "services.ActuationService"
+_CONFIG_TAG = "actuation"
+_PROCESS_TAG = "process"
+_RING_CAPACITY_TAG = "ring_capacity"
+_RESTART_DELAY_TAG = "restart_delay"
+
+_PROCESS_MODULE = "src.actuation"
+_STOP_TIMEOUT = 5  # s
+_WAKEUP = b"\0"
+_READ_SIZE = 4096
+
+# Records of both rings: kind, position, value, duration in ms, error in ms
+RECORD_FORMAT = "<Bb6xddd"
+
+# Commands, the duration is the monotonic time of the order, in ms
+COMMAND_OPEN_VALVE = 1
+COMMAND_CLOSE_VALVE = 2
+COMMAND_PUMP_SPEED = 3  # value: speed in %
+COMMAND_STOP = 4
+
+# Events reported by the actuation process
+EVENT_APPLIED = 1  # position: command, duration: latency of the command
+EVENT_VALVE_MOVED = 2  # value: 1 open / 0 closed, duration: PWM held, error: beyond it
+EVENT_PUMP = 3  # value: duty cycle of the pump
+
+
+def monotonic_time():
+    """
+    :return: monotonic time in ms, the same in every process of the device
+    :rtype: float
+    """
+    return time.monotonic() * 1000
+
+
+class ActuationService:
+    """
+    Drive the valves and the pump from a separate process, so the timing of their PWM
+    doesn't depend on the uploads, the BLE callbacks and the database sharing the
+    interpreter of the main process. The orders are written to a ring in shared
+    memory, the process reports the movements and the state of the pump in another
+    one. A byte written on a pipe wakes the reader up after each record, the records
+    themselves never go through a lock shared with the other process.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: ActuationService
+        """
+        if ActuationService.__instance is None:
+            ActuationService.__instance = ActuationService()
+        return ActuationService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        actuation_config = config[_CONFIG_TAG]
+        self._enabled = actuation_config[_PROCESS_TAG]
+        self._ring_capacity = actuation_config[_RING_CAPACITY_TAG]
+        self._restart_delay = actuation_config[_RESTART_DELAY_TAG]
+
+        self._process = None
+        self._commands = None
+        self._events = None
+        self._commands_wakeup = None
+        self._events_wakeup = None
+        self._reader = None
+        self._stopping = False
+        # The threads of the main process are all producers of the commands ring
+        self._send_lock = threading.Lock()
+        # Between stop() and the reader starting the process again after a crash
+        self._lifecycle_lock = threading.Lock()
+
+        # Last state reported by the process
+        self._valves = ["close"] * 16
+        self._pump_duty_cycle = 0.0
+
+        metrics = MetricsService.instance()
+        self._latency = metrics.histogram(
+            "actuation_command_latency_seconds",
+            "Delay between an order of the main process and its execution",
+        )
+        self._timing_error = metrics.histogram(
+            "valve_timing_error_seconds",
+            "Time the valve PWM is held beyond its opening or closing time",
+        )
+        self._dropped = metrics.counter(
+            "actuation_commands_dropped_total",
+            "Orders dropped because the actuation process is not running or behind",
+        )
+        self._restarts = metrics.counter(
+            "actuation_process_restarts_total",
+            "Times the actuation process was started again after exiting on its own",
+        )
+        metrics.gauge(
+            "actuation_process_up",
+            "1 if the actuation process is running",
+            lambda: 1 if self.running else 0,
+        )
+        self._logger.info("initialized (separate process: %s)", self._enabled)
+
+    @property
+    def enabled(self):
+        """
+        :return: True if the valves and the pump are driven by the actuation process
+        :rtype: bool
+        """
+        return self._enabled
+
+    @property
+    def running(self):
+        """
+        :rtype: bool
+        """
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def valves(self):
+        """
+        :return: position of each valve, "open" or "close", reported by the process
+        :rtype: list of str
+        """
+        return list(self._valves)
+
+    @property
+    def pump_duty_cycle(self):
+        """
+        :return: duty cycle of the pump reported by the process, in %
+        :rtype: float
+        """
+        return self._pump_duty_cycle
+
+    @property
+    def statistics(self):
+        """
+        Latency of the commands and timing error of the valves, in ms
+        :rtype: dict
+        """
+        latency = self._latency.snapshot()
+        timing_error = self._timing_error.snapshot()
+        return {
+            "commands": latency["count"],
+            "dropped": self._dropped.value,
+            "mean_latency": latency["mean"] * 1000,
+            "max_latency": latency["max"] * 1000,
+            "movements": timing_error["count"],
+            "mean_timing_error": timing_error["mean"] * 1000,
+            "max_timing_error": timing_error["max"] * 1000,
+        }
+
+    def start(self):
+        """Start the actuation process, if enabled"""
+        with self._lifecycle_lock:
+            if not self._enabled or self._process is not None:
+                return
+            self._stopping = False
+            self._spawn()
+        self._reader = threading.Thread(
+            target=self._receive, name="actuation-events", daemon=True
+        )
+        self._reader.start()
+
+    def stop(self):
+        """Stop the pump, then the actuation process"""
+        with self._lifecycle_lock:
+            if self._process is None:
+                return
+            self._stopping = True
+        self._send(COMMAND_STOP)
+        try:
+            self._process.wait(_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._logger.error("The actuation process didn't stop, killing it")
+            self._process.kill()
+            self._process.wait()
+        self._reader.join()
+        self._release()
+        self._process = None
+        self._reader = None
+
+    def open_valve(self, position):
+        """
+        :param position: tile number [0-15]
+        :type position: int
+        """
+        self._send(COMMAND_OPEN_VALVE, position)
+
+    def close_valve(self, position):
+        """
+        :param position: tile number [0-15]
+        :type position: int
+        """
+        self._send(COMMAND_CLOSE_VALVE, position)
+
+    def set_pump_speed(self, speed):
+        """
+        :param speed: in percentage [0.0-100.0]
+        :type speed: float
+        """
+        self._send(COMMAND_PUMP_SPEED, value=speed)
+
+    def _send(self, command, position=0, value=0.0):
+        """
+        Write a command to the ring and wake the process up
+        :param command: one of the COMMAND_ constants
+        :type command: int
+        :param position: valve of the command
+        :type position: int
+        :param value: value of the command
+        :type value: float
+        """
+        with self._send_lock:
+            sent = self._commands is not None and self._commands.put(
+                command, position, value, monotonic_time(), 0.0
+            )
+            if sent:
+                try:
+                    os.write(self._commands_wakeup, _WAKEUP)
+                except BlockingIOError:
+                    # The process has wakeups to read, it will find the command
+                    pass
+                except OSError as error:
+                    # Broken pipe: the process exited, the command will never be read
+                    self._logger.debug("Unable to wake the actuation process: %s", error)
+                    sent = False
+        if not sent:
+            self._dropped.inc()
+            self._logger.error(
+                "Command %d (%d, %s) dropped, the actuation process is %s",
+                command,
+                position,
+                value,
+                "behind" if self.running else "not running",
+            )
+
+    def _spawn(self):
+        """Create the rings and the pipes, then start the process"""
+        commands = SharedRing(RECORD_FORMAT, self._ring_capacity)
+        self._events = SharedRing(RECORD_FORMAT, self._ring_capacity)
+        commands_read, commands_wakeup = os.pipe()
+        self._events_wakeup, events_write = os.pipe()
+        # A full pipe means the process has wakeups pending already
+        os.set_blocking(commands_wakeup, False)
+        self._process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                _PROCESS_MODULE,
+                "--commands",
+                commands.name,
+                "--events",
+                self._events.name,
+                "--commands-fd",
+                str(commands_read),
+                "--events-fd",
+                str(events_write),
+            ],
+            pass_fds=(commands_read, events_write),
+        )
+        # Only the process keeps these ends, the pipes are closed when it exits
+        os.close(commands_read)
+        os.close(events_write)
+        with self._send_lock:
+            self._commands = commands
+            self._commands_wakeup = commands_wakeup
+        self._logger.info("Actuation process started (pid %d)", self._process.pid)
+
+    def _release(self):
+        """Close the rings and the pipes of a process which exited"""
+        if self._events is None:
+            return
+        with self._send_lock:
+            os.close(self._commands_wakeup)
+            self._commands.close()
+            self._commands = None
+            self._commands_wakeup = None
+        os.close(self._events_wakeup)
+        self._events.close()
+        self._events = None
+        self._events_wakeup = None
+
+    def _receive(self):
+        """
+        Read the events of the process until it is stopped, starting it again when it
+        exits on its own, the valves and the pump being left without a driver otherwise
+        """
+        while True:
+            try:
+                wakeups = os.read(self._events_wakeup, _READ_SIZE)
+            except OSError:
+                wakeups = b""
+            record = self._events.get()
+            while record is not None:
+                self._handle(*record)
+                record = self._events.get()
+            if len(wakeups) == 0 and not self._restart():
+                return
+
+    def _restart(self):
+        """
+        Start the process again after it exited, unless it is being stopped
+        :return: True if the process was started again
+        :rtype: bool
+        """
+        if self._stopping:
+            return False
+        self._logger.error(
+            "The actuation process exited (code %s), starting it again in %s s",
+            self._process.wait(),
+            self._restart_delay,
+        )
+        self._release()
+        time.sleep(self._restart_delay)
+        with self._lifecycle_lock:
+            if self._stopping:
+                return False
+            self._restarts.inc()
+            self._spawn()
+        return True
+
+    def _handle(self, event, position, value, duration, error):
+        """
+        Update the state of the actuators with an event of the process
+        :param event: one of the EVENT_ constants
+        :type event: int
+        """
+        if event == EVENT_APPLIED:
+            self._latency.observe(duration / 1000)
+        elif event == EVENT_VALVE_MOVED:
+            self._valves[position] = "open" if value == 1 else "close"
+            self._timing_error.observe(error / 1000)
+            self._logger.debug(
+                "Valve %d moved to position %s in %.0f ms (%.1f ms late)",
+                position,
+                self._valves[position],
+                duration,
+                error,
+            )
+        elif event == EVENT_PUMP:
+            self._pump_duty_cycle = value
+        # The greenhouse of the simulated hardware follows the actuators of the process
+        greenhouse = getattr(hardware(), "greenhouse", None)
+        if greenhouse is not None:
+            if event == EVENT_VALVE_MOVED:
+                greenhouse.set_valve(position, value == 1)
+            elif event == EVENT_PUMP:
+                greenhouse.set_pump(value)
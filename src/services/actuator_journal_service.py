@@ -0,0 +1,142 @@
+"""Service that logs the state changes of the actuators"""
+import threading
+
+from src.services.database_service import DatabaseService
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+from src.utils import time_in_millisecond, utc_timestamp
+from src.utils.sql_queries import (
+    INSERT_VALVE_ORDER,
+    INSERT_LIGHT_STRIP_ORDER,
+    INSERT_PUMP_ORDER,
+)
+
+_SERVICE_TAG = "services.ActuatorJournalService"
+_CONFIG_TAG = "actuator_journal"
+_KEYFRAME_INTERVAL_TAG = "keyframe_interval"
+
+# Types of the actuators table
+_VALVE = "V"
+_LIGHT_STRIP = "L"
+_PUMP = "P"
+
+
+class ActuatorJournalService:
+    """
+    Service that keeps the last state logged for each valve, light tile and the pump,
+    and only writes an actuators row when the state changes. The current state is
+    written again every keyframe interval, so the logs show it even if it doesn't change.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: ActuatorJournalService
+        """
+        if ActuatorJournalService.__instance is None:
+            ActuatorJournalService.__instance = ActuatorJournalService()
+        return ActuatorJournalService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        # 0 disables the keyframes
+        self._keyframe_interval = config[_CONFIG_TAG][_KEYFRAME_INTERVAL_TAG] * 1000
+        self._db_service = DatabaseService.instance()
+
+        # (type, position) -> (status, plant uuid, time of the last row in ms)
+        self._states = {}
+        self._recorded = 0
+        self._skipped = 0
+        self._lock = threading.Lock()
+        self._logger.info("initialized")
+
+    def record_valve(self, position, plant_uuid, status):
+        """
+        Log the state of a valve
+        :param position: position of the valve
+        :type position: int
+        :param plant_uuid: uuid of the plant watered by the valve
+        :type plant_uuid: str
+        :param status: True if the valve is open
+        :type status: bool
+        :return: True if a row was written
+        :rtype: bool
+        """
+        return self._record(_VALVE, position, plant_uuid, status)
+
+    def record_light_strip(self, position, plant_uuid, status):
+        """
+        Log the state of a light tile
+        :param position: position of the tile
+        :type position: int
+        :param plant_uuid: uuid of the plant under the tile
+        :type plant_uuid: str
+        :param status: True if the tile is on
+        :type status: bool
+        :return: True if a row was written
+        :rtype: bool
+        """
+        return self._record(_LIGHT_STRIP, position, plant_uuid, status)
+
+    def record_pump(self, status):
+        """
+        Log the state of the pump
+        :param status: True if the pump is running
+        :type status: bool
+        :return: True if a row was written
+        :rtype: bool
+        """
+        return self._record(_PUMP, None, None, status)
+
+    @property
+    def statistics(self):
+        """
+        Number of states written and skipped because they didn't change
+        :rtype: dict
+        """
+        return {"recorded": self._recorded, "skipped": self._skipped}
+
+    def _record(self, actuator_type, position, plant_uuid, status):
+        """
+        Write the state of an actuator if it changed or if the keyframe interval elapsed
+        :rtype: bool
+        """
+        with self._lock:
+            return self._record_locked(actuator_type, position, plant_uuid, status)
+
+    def _record_locked(self, actuator_type, position, plant_uuid, status):
+        """Write the state of an actuator, the lock must be held"""
+        status = 1 if status else 0
+        now = time_in_millisecond()
+        key = (actuator_type, position)
+        previous = self._states.get(key)
+        if (
+            previous is not None
+            and previous[0] == status
+            and previous[1] == plant_uuid
+            and (
+                self._keyframe_interval == 0
+                or now - previous[2] < self._keyframe_interval
+            )
+        ):
+            self._skipped += 1
+            return False
+
+        if actuator_type == _PUMP:
+            self._db_service.enqueue(INSERT_PUMP_ORDER, [status, utc_timestamp()])
+        elif actuator_type == _VALVE:
+            self._db_service.enqueue(
+                INSERT_VALVE_ORDER, [status, plant_uuid, utc_timestamp()]
+            )
+        else:
+            self._db_service.enqueue(
+                INSERT_LIGHT_STRIP_ORDER, [status, plant_uuid, utc_timestamp()]
+            )
+        self._states[key] = (status, plant_uuid, now)
+        self._recorded += 1
+        return True
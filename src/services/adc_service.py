@@ -1,16 +1,14 @@
 """Service to interact with the ADC in order to get Analog Values"""
+import time
+import threading
 from math import exp
-from RPi import GPIO
-import busio
-import adafruit_ads1x15.ads1115 as ads
-from adafruit_ads1x15.analog_in import AnalogIn
+from src.hal import hardware
+from src.services.metrics_service import MetricsService
 from src.utils import get_logger
 from src.utils.configuration import config
 
 _SERVICE_TAG = "service.AdcService"
 _CONFIG_TAG = "adc_config"
-_I2C_PIN_SDA = "i2c_sda"
-_I2C_PIN_SCL = "i2c_scl"
 _ADC_CHANNEL_WATER_LEVEL = "adc_channel_water_level"
 _ADC_CHANNEL_AMBIENT_LUMINOSITY = "adc_channel_ambient_luminosity"
 _ADC_CHANNEL_PLANT_HYGROMETRY = "adc_channel_plant_hygrometry"
@@ -40,20 +38,31 @@ class ADCService:
     def __init__(self):
         """Initialize the service"""
         adc_config = config[_CONFIG_TAG]
-        self._i2c = busio.I2C(adc_config[_I2C_PIN_SCL], adc_config[_I2C_PIN_SDA])
-        self._adc = ads.ADS1115(self._i2c)
-        self._water_level_channel = AnalogIn(self._adc, adc_config[_ADC_CHANNEL_WATER_LEVEL])
-        self._ambient_luminosity_channel = AnalogIn(self._adc, adc_config[_ADC_CHANNEL_AMBIENT_LUMINOSITY])
-        self._plant_hygrometry_channel = AnalogIn(self._adc, adc_config[_ADC_CHANNEL_PLANT_HYGROMETRY])
+        self._adc = hardware().adc
+        self._water_level_channel = self._adc.channel(adc_config[_ADC_CHANNEL_WATER_LEVEL])
+        self._ambient_luminosity_channel = self._adc.channel(adc_config[_ADC_CHANNEL_AMBIENT_LUMINOSITY])
+        self._plant_hygrometry_channel = self._adc.channel(adc_config[_ADC_CHANNEL_PLANT_HYGROMETRY])
 
         self._plant_s0 = adc_config[_PLANT_HYGROMETRY_SELECTOR_PIN_S0]
         self._plant_s1 = adc_config[_PLANT_HYGROMETRY_SELECTOR_PIN_S1]
         self._plant_s2 = adc_config[_PLANT_HYGROMETRY_SELECTOR_PIN_S2]
         self._plant_s3 = adc_config[_PLANT_HYGROMETRY_SELECTOR_PIN_S3]
-        GPIO.setup(self._plant_s0, GPIO.OUT)
-        GPIO.setup(self._plant_s1, GPIO.OUT)
-        GPIO.setup(self._plant_s2, GPIO.OUT)
-        GPIO.setup(self._plant_s3, GPIO.OUT)
+        self._gpio = hardware().gpio
+        self._gpio.setup(self._plant_s0)
+        self._gpio.setup(self._plant_s1)
+        self._gpio.setup(self._plant_s2)
+        self._gpio.setup(self._plant_s3)
+
+        # The I2C bus and the multiplexer are shared by the components reading the ADC
+        self._lock = threading.RLock()
+
+        metrics = MetricsService.instance()
+        self._read_durations = {
+            channel: metrics.histogram(
+                "i2c_read_seconds", "Duration of the ADC reads over I2C", channel=channel
+            )
+            for channel in ("water_level", "ambient_luminosity", "plant_hygrometry")
+        }
         self._logger.info("initialized")
 
     def get_water_level_value(self):
@@ -69,7 +78,7 @@ class ADCService:
         Also the minimum is 200mL but its not the absolute minimum. 
         In that way we can technicaly go below 0% and conserve a better R^2 in the expression.
         """
-        value = self._water_level_channel.voltage
+        value = self._read_voltage(self._water_level_channel, "water_level")
         value = 3469 * value ** -2.91
         value = 0.125 * value - 25
         self._logger.debug(
@@ -85,7 +94,7 @@ class ADCService:
         In the report we have indicate the luminosity level expression.
         Considering the 0% is 40 lux and 100% is 1000 lux.
         """
-        value = self._ambient_luminosity_channel.voltage
+        value = self._read_voltage(self._ambient_luminosity_channel, "ambient_luminosity")
         value = 2.62e-6 * exp(5.78 * value)
         self._logger.debug(
             f"Amb. Lum. : {value} %"
@@ -109,29 +118,32 @@ class ADCService:
         for i in range(4 - len(bin_plant_nb)):
             bin_plant_nb = zero + bin_plant_nb
 
-        if bin_plant_nb[0] == "1":
-            GPIO.output(self._plant_s3, GPIO.HIGH)
-        else:
-            GPIO.output(self._plant_s3, GPIO.LOW)
+        # The multiplexer stays on this plant until its value is read
+        with self._lock:
+            self._gpio.output(self._plant_s3, bin_plant_nb[0] == "1")
+            self._gpio.output(self._plant_s2, bin_plant_nb[1] == "1")
+            self._gpio.output(self._plant_s1, bin_plant_nb[2] == "1")
+            self._gpio.output(self._plant_s0, bin_plant_nb[3] == "1")
 
-        if bin_plant_nb[1] == "1":
-            GPIO.output(self._plant_s2, GPIO.HIGH)
-        else:
-            GPIO.output(self._plant_s2, GPIO.LOW)
-
-        if bin_plant_nb[2] == "1":
-            GPIO.output(self._plant_s1, GPIO.HIGH)
-        else:
-            GPIO.output(self._plant_s1, GPIO.LOW)
-
-        if bin_plant_nb[3] == "1":
-            GPIO.output(self._plant_s0, GPIO.HIGH)
-        else:
-            GPIO.output(self._plant_s0, GPIO.LOW)
-
-        value = self._plant_hygrometry_channel.voltage
+            value = self._read_voltage(self._plant_hygrometry_channel, "plant_hygrometry")
         value = -38.3 * value + 140
         self._logger.debug(
             f"Plant Hygro. ({plant_nb}) : {value} %"
         )
         return value
+
+    def _read_voltage(self, channel, name):
+        """
+        Read the voltage of a channel over I2C, the duration of the read is measured
+        :param channel: channel of the ADC
+        :type channel: AnalogIn or SimulatedAnalogIn
+        :param name: name of the channel in the metrics
+        :type name: str
+        :rtype: float
+        """
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                return channel.voltage
+            finally:
+                self._read_durations[name].observe(time.perf_counter() - start)
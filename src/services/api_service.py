@@ -1,5 +1,8 @@
 """Service to interact with the API"""
-import requests
+import hashlib
+import json
+import time
+import zlib
 
 from src.constants import (
     get_greenhouse_url,
@@ -7,8 +10,11 @@ from src.constants import (
     greenhouse_notify_added_plant_url,
     greenhouse_remove_plant_url,
 )
+from src.errors.circuit_open_error import CircuitOpenError
 from src.errors.http_error import HttpError
 from src.models import Plant
+from src.services.http_transport_service import HttpTransportService
+from src.services.metrics_service import MetricsService
 from src.utils.logger import get_logger
 from src.utils import (
     HTTP_GET,
@@ -20,6 +26,26 @@ from src.utils import config
 _SERVICE_TAG = "services.APIService"
 _CONFIG_TAG = "api"
 
+# Status of a conditional request when the resource didn't change
+_HTTP_NOT_MODIFIED = 304
+
+# Status returned by an API that doesn't support the encoding of the body
+_HTTP_UNSUPPORTED_MEDIA_TYPE = 415
+
+# Characters of the body of an error response written to the logs
+_LOGGED_BODY_SIZE = 200
+
+# Header announcing the encoding of the send_logs body, 1 is rows and 2 is columnar
+_LOGS_VERSION_HEADER = "X-Logs-Version"
+_LOGS_VERSION_ROWS = 1
+_LOGS_VERSION_COLUMNAR = 2
+
+# Header used by the API to detect the mutations already applied
+_IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+# Size of the compressed chunks sent when streaming a request body
+_STREAM_CHUNK_SIZE = 16 * 1024
+
 
 class ApiService:
     """Service to interact with the API"""
@@ -41,18 +67,32 @@ class ApiService:
     def __init__(self):
         self._base_url = config[_CONFIG_TAG]["base_url"]
         self._api_key = config[_CONFIG_TAG]["api_key"]
+        # Opt-in, disabled again if the API rejects it
+        self._columnar_logs = config[_CONFIG_TAG]["columnar_logs"]
 
-        self._session = requests.sessions.Session()
+        # Connection pool and circuit breaker shared with the other services
+        self._transport = HttpTransportService.instance()
+        self._metrics = MetricsService.instance()
+
+        # Validators of the last greenhouse received: the ETag sent back in
+        # If-None-Match and the hash of the body, if the API doesn't send an ETag.
+        self._greenhouse_etag = None
+        self._greenhouse_hash = None
 
         self._logger.info("initialized")
 
-    def _request(self, method, endpoint, payload=None):
+    def _request(
+        self, method, endpoint, payload=None, data=None, headers=None, name=None
+    ):
         """
 
         Args:
             method: HTTP method of the request e.g. 'GET'
             endpoint: url of the endpoint to call (without the baseUrl)
             payload: serialization object to send.
+            data: raw body to send instead of the payload, an iterable is sent chunked.
+            headers: additional headers of the request.
+            name: name of the endpoint in the transport metrics.
 
         Returns:
             Decoded JSON received
@@ -60,78 +100,195 @@ class ApiService:
         Raises:
             HttpError when the responses code is superior or equals to 400
         """
+        return self._send(method, endpoint, payload, data, headers, name).json()
+
+    def _send(self, method, endpoint, payload=None, data=None, headers=None, name=None):
+        """
+
+        Args:
+            method: HTTP method of the request e.g. 'GET'
+            endpoint: url of the endpoint to call (without the baseUrl)
+            payload: serialization object to send.
+            data: raw body to send instead of the payload, an iterable is sent chunked.
+            headers: additional headers of the request.
+            name: name of the endpoint in the transport metrics.
+
+        Returns:
+            Response received, the body may be empty e.g. for a 304
+
+        Raises:
+            HttpError when the responses code is superior or equals to 400
+            CircuitOpenError when the API failed too many times recently
+        """
         self._logger.debug(
             "Sending: %s %s",
             method,
             endpoint,
         )
-        answer = self._session.request(
-            method,
-            self._base_url + endpoint,
-            headers={"X-API-Key": self._api_key},
-            json=payload,
-            timeout=5,
-        )
+        status = "failed"
+        start = time.perf_counter()
+        try:
+            answer = self._transport.request(
+                method,
+                self._base_url + endpoint,
+                name=name,
+                headers={"X-API-Key": self._api_key, **(headers or {})},
+                json=payload,
+                data=data,
+            )
+            status = str(answer.status_code)
+        finally:
+            self._metrics.histogram(
+                "api_request_seconds",
+                "Duration of the API requests, body upload included",
+                endpoint=name or endpoint,
+            ).observe(time.perf_counter() - start)
+            self._metrics.counter(
+                "api_requests_total",
+                "API requests by status code, failed when no response was received",
+                endpoint=name or endpoint,
+                status=status,
+            ).inc()
 
         if answer.status_code >= 400:
+            # The body may not be JSON, e.g. the error page of a proxy
             self._logger.error(
                 "Request: %s %s - Response: %d %s",
                 method,
                 endpoint,
                 answer.status_code,
-                answer.json(),
+                answer.text[:_LOGGED_BODY_SIZE],
             )
             raise HttpError(answer.status_code)
 
+        # The body is decoded by the caller if needed, not for every response here
         self._logger.debug(
-            "Request: %s %s - Response: %d %s",
+            "Request: %s %s - Response: %d (%d bytes)",
             method,
             endpoint,
             answer.status_code,
-            answer.json(),
+            len(answer.content),
         )
-        return answer.json()
+        return answer
 
     def get_greenhouse(self):
         """
-        Retrieve the greenhouse plants
+        Retrieve the greenhouse plants. The request is conditional: when the greenhouse
+        didn't change since the last call, None is returned without decoding anything.
 
+        :return the plants, None if not modified, False if the request failed
         :rtype: list[Plant]
         """
         plants = []
 
         try:
-            response = self._request(
-                HTTP_GET, get_greenhouse_url(config["device_uuid"])
+            headers = {}
+            if self._greenhouse_etag is not None:
+                headers["If-None-Match"] = self._greenhouse_etag
+            answer = self._send(
+                HTTP_GET,
+                get_greenhouse_url(config["device_uuid"]),
+                headers=headers,
+                name="greenhouse",
             )
+            if answer.status_code == _HTTP_NOT_MODIFIED:
+                return None
+
+            content_hash = hashlib.sha256(answer.content).hexdigest()
+            if content_hash == self._greenhouse_hash:
+                return None
 
-            for plant_data in response["plants"]:
+            for plant_data in answer.json()["plants"]:
                 plants.append(Plant.create_from_dict(plant_data))
 
+            self._greenhouse_etag = answer.headers.get("ETag")
+            self._greenhouse_hash = content_hash
             return plants
         except HttpError:
             return False
 
-    def send_logs(self, sensors_data, actuators_data):
+    def reset_greenhouse_cache(self):
+        """
+        Forget the last greenhouse received, so the next get_greenhouse returns the
+        plants even if they didn't change. Used when they couldn't be applied.
+        """
+        self._greenhouse_etag = None
+        self._greenhouse_hash = None
+
+    @property
+    def columnar_logs(self):
+        """
+        :return: True if send_logs uses the columnar encoding, the timestamps of the
+        logs must then be epoch in seconds
+        :rtype: bool
         """
-        Send logs of the reading of one or multiple sensors and actuators
+        return self._columnar_logs
 
+    def send_logs(self, sensors_data, actuators_data, idempotency_key=None):
+        """
+        Send logs of the reading of one or multiple sensors and actuators. The JSON body
+        is encoded and gzip compressed while it is sent, so the logs can be streamed
+        from a database cursor. If the API answers that it doesn't support the columnar
+        encoding, the next calls send rows.
+        :param sensors_data: logs of the sensors
+        :type sensors_data: Iterable of dict
+        :param actuators_data: logs of the actuators
+        :type actuators_data: Iterable of dict
+        :param idempotency_key: key identifying these logs if the request is retried
+        :type idempotency_key: str
         :rtype: boolean
         """
+        if self._columnar_logs:
+            version = _LOGS_VERSION_COLUMNAR
+            body = _GzipColumnarLogsBody(sensors_data, actuators_data)
+        else:
+            version = _LOGS_VERSION_ROWS
+            body = _GzipJsonLogsBody(sensors_data, actuators_data)
         try:
             self._logger.debug("Sending request for send_logs")
             self._request(
                 HTTP_PUT,
                 greenhouse_send_data_url(config["device_uuid"]),
-                payload={"sensors": sensors_data, "actuators": actuators_data},
+                data=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip",
+                    _LOGS_VERSION_HEADER: str(version),
+                    **_idempotency_headers(idempotency_key),
+                },
+                name="logs",
             )
-        except HttpError:
+        except CircuitOpenError:
+            # Not sent, the outbox keeps the logs for when the API is reachable again
+            raise
+        except HttpError as error:
+            if version == _LOGS_VERSION_COLUMNAR and error.args == (
+                _HTTP_UNSUPPORTED_MEDIA_TYPE,
+            ):
+                self._logger.warning("Columnar logs not supported by the API")
+                self._columnar_logs = False
             return False
+        finally:
+            self._logger.debug(
+                "send_logs body: %d bytes, %d bytes compressed",
+                body.raw_size,
+                body.compressed_size,
+            )
+            self._metrics.counter(
+                "api_upload_bytes_total", "Bytes of logs sent, compressed", endpoint="logs"
+            ).inc(body.compressed_size)
+            self._metrics.counter(
+                "api_upload_uncompressed_bytes_total",
+                "Bytes of logs sent, before the compression",
+                endpoint="logs",
+            ).inc(body.raw_size)
         return True
 
-    def add_plant(self, planted_at, position):
+    def add_plant(self, planted_at, position, idempotency_key=None):
         """
         Notify the API a when plant have been added to a greenhouse
+        :param idempotency_key: key identifying this plant if the request is retried
+        :type idempotency_key: str
 
         :return UUID of the new plant
         :rtype: Plant
@@ -141,21 +298,161 @@ class ApiService:
                 HTTP_PUT,
                 greenhouse_notify_added_plant_url(config["device_uuid"]),
                 payload={"planted_at": planted_at, "position": position},
+                headers=_idempotency_headers(idempotency_key),
+                name="plant",
             )
 
             return Plant.create_from_dict(result)
+        except CircuitOpenError:
+            raise
         except HttpError:
             return False
 
-    def remove_plant(self, uuid):
+    def remove_plant(self, uuid, idempotency_key=None):
         """
         Update the details of a plant
         :param uuid
         :type uuid str
+        :param idempotency_key: key identifying this removal if the request is retried
+        :type idempotency_key: str
         :rtype: bool
         """
         try:
-            self._request(HTTP_DELETE, greenhouse_remove_plant_url(uuid))
+            self._request(
+                HTTP_DELETE,
+                greenhouse_remove_plant_url(uuid),
+                headers=_idempotency_headers(idempotency_key),
+                name="plant",
+            )
+        except CircuitOpenError:
+            raise
         except HttpError:
             return False
         return True
+
+
+def _idempotency_headers(idempotency_key):
+    """
+    :param idempotency_key: key of the mutation, None to not send it
+    :type idempotency_key: str
+    :rtype: dict
+    """
+    if idempotency_key is None:
+        return {}
+    return {_IDEMPOTENCY_KEY_HEADER: idempotency_key}
+
+
+class _GzipJsonLogsBody:
+    """
+    Body of the send_logs request: {"sensors": [...], "actuators": [...]} encoded
+    log by log and gzip compressed on the fly.
+    """
+
+    def __init__(self, sensors_data, actuators_data):
+        """
+        :param sensors_data: logs of the sensors
+        :type sensors_data: Iterable of dict
+        :param actuators_data: logs of the actuators
+        :type actuators_data: Iterable of dict
+        """
+        self._sensors_data = sensors_data
+        self._actuators_data = actuators_data
+        self.raw_size = 0
+        self.compressed_size = 0
+
+    def __iter__(self):
+        # wbits=31 produces a gzip container instead of a raw zlib stream
+        compressor = zlib.compressobj(wbits=31)
+        buffer = bytearray()
+
+        for text in self._json_parts():
+            data = text.encode("utf-8")
+            self.raw_size += len(data)
+            buffer += compressor.compress(data)
+            if len(buffer) >= _STREAM_CHUNK_SIZE:
+                self.compressed_size += len(buffer)
+                yield bytes(buffer)
+                buffer.clear()
+
+        buffer += compressor.flush()
+        self.compressed_size += len(buffer)
+        yield bytes(buffer)
+
+    def _json_parts(self):
+        """
+        :return: pieces of the JSON document
+        :rtype: Iterator[str]
+        """
+        yield '{"sensors": ['
+        yield from self._json_items(self._sensors_data)
+        yield '], "actuators": ['
+        yield from self._json_items(self._actuators_data)
+        yield "]}"
+
+    @staticmethod
+    def _json_items(logs):
+        """
+        :return: the logs encoded in JSON and separated by commas
+        :rtype: Iterator[str]
+        """
+        separator = ""
+        for log in logs:
+            yield separator + json.dumps(log)
+            separator = ", "
+
+
+class _GzipColumnarLogsBody(_GzipJsonLogsBody):
+    """
+    Body of the send_logs request in the columnar encoding, gzip compressed on the fly:
+    {"version": 2, "sensors": {...}, "actuators": {...}, "plants": [uuid, ...]}
+    Each table is a set of parallel arrays: "type" is a string with one character per
+    log, "timestamp" the difference in seconds with the previous log (the first one
+    is the epoch), "value" or "status", and "plant" the index of the uuid in "plants",
+    -1 if the log has no plant.
+    The logs of a page are kept in memory to build the columns.
+    """
+
+    def _json_parts(self):
+        """
+        :return: pieces of the JSON document
+        :rtype: Iterator[str]
+        """
+        plants = {}
+        yield f'{{"version": {_LOGS_VERSION_COLUMNAR}, "sensors": '
+        yield json.dumps(self._columns(self._sensors_data, "value", plants))
+        yield ', "actuators": '
+        yield json.dumps(self._columns(self._actuators_data, "status", plants))
+        yield ', "plants": ' + json.dumps(list(plants)) + "}"
+
+    @staticmethod
+    def _columns(logs, value_key, plants):
+        """
+        :param logs: logs with their timestamp as epoch
+        :type logs: Iterable of dict
+        :param value_key: name of the value column, "value" or "status"
+        :type value_key: str
+        :param plants: index of each plant uuid, completed with the new ones
+        :type plants: dict
+        :return: the columns of the logs
+        :rtype: dict
+        """
+        types = []
+        timestamps = []
+        values = []
+        plant_indexes = []
+        previous_timestamp = 0
+        for log in logs:
+            types.append(log["type"])
+            timestamps.append(log["timestamp"] - previous_timestamp)
+            previous_timestamp = log["timestamp"]
+            values.append(log[value_key])
+            uuid = log["plant_uuid"]
+            plant_indexes.append(
+                -1 if uuid is None else plants.setdefault(uuid, len(plants))
+            )
+        return {
+            "type": "".join(types),
+            "timestamp": timestamps,
+            value_key: values,
+            "plant": plant_indexes,
+        }
@@ -2,15 +2,36 @@
 import os
 import sqlite3 as sqlite
 import threading
+import time
+from contextlib import contextmanager
+from itertools import groupby
 
+from src.services.metrics_service import MetricsService
+from src.utils.configuration import config
 from src.utils.logger import get_logger
+from src.utils import time_in_millisecond
+from src.utils.metrics import Histogram
 
 _SERVICE_TAG = "services.DatabaseService"
+_CONFIG_TAG = "database"
+_WRITE_BEHIND_TAG = "write_behind"
+_POOLED_TAG = "pooled"
+_JOURNAL_MODE_TAG = "journal_mode"
+_SYNCHRONOUS_TAG = "synchronous"
+_CACHE_SIZE_TAG = "cache_size"
+_AUTO_VACUUM_TAG = "auto_vacuum"
+_SLOW_QUERY_THRESHOLD_TAG = "slow_query_threshold"
+_MAX_RETRY_DELAY = 60000  # ms
+_CLOSE_FLUSH_ATTEMPTS = 3
+# Errors of a row that would fail again, the other ones (locked or busy database, I/O
+# error, full disk) are worth writing the rows again later
+_REJECTED_ROW_ERRORS = (sqlite.IntegrityError, sqlite.DataError, sqlite.ProgrammingError)
 _db_path = os.getenv("DB_FILE", ".database.db")
 _db_init_scripts_dir = os.path.join(
     os.path.dirname(__file__), "../../database/upgrades"
 )
 
+# Only used when the connection is shared between the threads (pooled mode disabled)
 lock = threading.Lock()
 
 
@@ -21,6 +42,8 @@ class DatabaseService:
 
     _logger = get_logger(_SERVICE_TAG)
 
+    # pylint: disable=too-many-instance-attributes
+
     @staticmethod
     def instance():
         """
@@ -33,9 +56,197 @@ class DatabaseService:
 
     def __init__(self):
         """Initialize the service"""
-        self._db = sqlite.connect(_db_path, timeout=10, check_same_thread=False)
+        db_config = config[_CONFIG_TAG]
+        self._pooled = db_config[_POOLED_TAG]
+        self._auto_vacuum = db_config[_AUTO_VACUUM_TAG]
+        self._pragmas = {
+            "journal_mode": db_config[_JOURNAL_MODE_TAG],
+            "synchronous": db_config[_SYNCHRONOUS_TAG],
+            "cache_size": db_config[_CACHE_SIZE_TAG],
+        }
+
+        # In pooled mode each thread gets its own connection, created on first use
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._db = self._connect()
+        self._local.connection = self._db
+
+        # Statistics by SQL statement
+        self._slow_query_threshold = db_config[_SLOW_QUERY_THRESHOLD_TAG]
+        self._query_stats = {}
+        self._query_stats_lock = threading.Lock()
 
-        self._logger.info("initialized")
+        # Write-behind queue: rows waiting to be inserted as (query, parameters)
+        write_behind_config = db_config[_WRITE_BEHIND_TAG]
+        self._write_behind_enabled = write_behind_config["enabled"]
+        self._max_batch_size = write_behind_config["max_batch_size"]
+        self._max_delay = write_behind_config["max_delay"]
+        self._retry_delay = write_behind_config["retry_delay"]
+        self._pending_rows = []
+        self._oldest_pending_at = None
+        self._failed_flushes = 0
+        self._retry_at = 0
+        self._pending_condition = threading.Condition()
+        self._flusher = None
+        self._closing = False
+        self._write_behind_stats = {
+            "flush_count": 0,
+            "rows_flushed": 0,
+            "rows_dropped": 0,
+            "failed_flushes": 0,
+            "last_flush_latency": 0,
+            "max_flush_latency": 0,
+            "max_queue_depth": 0,
+        }
+
+        self._metrics = MetricsService.instance()
+        self._metrics.gauge(
+            "database_write_behind_depth",
+            "Rows waiting in the write-behind queue",
+            function=lambda: len(self._pending_rows),
+        )
+        self._metrics.gauge(
+            "database_file_bytes",
+            "Size of the database file",
+            function=lambda: os.path.getsize(_db_path),
+        )
+        self._rows_written = self._metrics.counter(
+            "database_rows_written_total", "Rows written by the write-behind flusher"
+        )
+        self._flush_duration = self._metrics.histogram(
+            "database_flush_seconds", "Duration of the write-behind flushes"
+        )
+
+        if self._write_behind_enabled:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="database-flusher", daemon=True
+            )
+            self._flusher.start()
+
+        self._logger.info("initialized (pooled: %s)", self._pooled)
+
+    def _connect(self):
+        """
+        Open a new connection and apply the configured pragmas
+        :rtype: sqlite.Connection
+        """
+        connection = sqlite.connect(_db_path, timeout=10, check_same_thread=False)
+        connection.row_factory = sqlite.Row
+        # Only applied to a new database, before its first page is written (the journal
+        # mode writes it), an existing one keeps its mode until a full vacuum
+        connection.execute(f"pragma auto_vacuum={self._auto_vacuum}")
+        if self._pooled:
+            for pragma, value in self._pragmas.items():
+                connection.execute(f"pragma {pragma}={value}")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    def _connection(self):
+        """
+        Connection to use for the current thread
+        :rtype: sqlite.Connection
+        """
+        if not self._pooled:
+            return self._db
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _locked(self):
+        """
+        Serialize the access to the shared connection when the pooled mode is disabled.
+        Yields the time waited for the lock in milliseconds.
+        """
+        if self._pooled:
+            yield 0.0
+            return
+        start = time.perf_counter()
+        lock.acquire(blocking=True)
+        try:
+            yield (time.perf_counter() - start) * 1000
+        finally:
+            lock.release()
+
+    def _record(self, query, latency, rows, lock_wait=0.0, error=False):
+        """
+        Update the statistics of a SQL statement and log it if it is slow
+        :param query: SQL statement executed
+        :type query: str
+        :param latency: execution time in milliseconds, without the lock wait
+        :type latency: float
+        :param rows: number of rows returned or affected
+        :type rows: int
+        :param lock_wait: time waited for the lock in milliseconds
+        :type lock_wait: float
+        :param error: did the statement fail
+        :type error: bool
+        """
+        with self._query_stats_lock:
+            stats = self._query_stats.get(query)
+            if stats is None:
+                stats = {
+                    "count": 0,
+                    "errors": 0,
+                    "rows": 0,
+                    "latency": Histogram(),
+                    "lock_wait": Histogram(),
+                }
+                self._query_stats[query] = stats
+            stats["count"] += 1
+            stats["errors"] += 1 if error else 0
+            stats["rows"] += rows
+        stats["latency"].observe(latency)
+        stats["lock_wait"].observe(lock_wait)
+
+        # Exported by kind of statement, the statements themselves are too many
+        operation = query.split(None, 1)[0].lower() if query.strip() else ""
+        self._metrics.histogram(
+            "database_query_seconds",
+            "Duration of the SQL statements, without the lock wait",
+            operation=operation,
+        ).observe(latency / 1000)
+        self._metrics.histogram(
+            "database_lock_wait_seconds",
+            "Time waited for the shared connection",
+            operation=operation,
+        ).observe(lock_wait / 1000)
+        if error:
+            self._metrics.counter(
+                "database_errors_total", "SQL statements failed", operation=operation
+            ).inc()
+
+        if latency >= self._slow_query_threshold:
+            self._logger.warning(
+                "Slow query (%.1f ms, %d rows, %.1f ms waiting the lock): '%s'",
+                latency,
+                rows,
+                lock_wait,
+                query,
+            )
+
+    def query_statistics(self):
+        """
+        Snapshot of the statistics by SQL statement. The latencies are in milliseconds.
+        :return: for each statement its count, errors, rows, latency and lock_wait
+        :rtype: dict
+        """
+        with self._query_stats_lock:
+            items = list(self._query_stats.items())
+        return {
+            query: {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "rows": stats["rows"],
+                "latency": stats["latency"].snapshot(),
+                "lock_wait": stats["lock_wait"].snapshot(),
+            }
+            for query, stats in items
+        }
 
     def execute(self, query, parameters=None, commit=True):
         """
@@ -49,31 +260,362 @@ class DatabaseService:
         :return the results of the query
         :rtype: list
         """
-        lock.acquire(blocking=True)
-        self._logger.debug(
-            "Executing query: '%s' with params %s.", query, str(parameters)
-        )
-        cursor = self._db.execute(query)
-        result = cursor.fetchall()
-        if commit:
-            self._db.commit()
-        lock.release()
-        self._logger.debug("Query results: %s", str(result))
+        self._logger.debug("Executing query: '%s' with params %s.", query, parameters)
+        connection = self._connection()
+        with self._locked() as lock_wait:
+            start = time.perf_counter()
+            try:
+                cursor = connection.execute(query, parameters or [])
+                result = cursor.fetchall()
+                if commit:
+                    connection.commit()
+            except sqlite.Error:
+                self._record(query, (time.perf_counter() - start) * 1000, 0, lock_wait, True)
+                raise
+            latency = (time.perf_counter() - start) * 1000
+
+        rows = len(result) if cursor.description is not None else max(cursor.rowcount, 0)
+        self._record(query, latency, rows, lock_wait)
+        self._logger.debug("Query returned %d rows in %.1f ms", rows, latency)
         return result
 
+    def stream(self, query, parameters=None, fetch_size=500):
+        """
+        Execute a SQL request and yield its rows while they are read, so the memory used
+        doesn't depend on the number of rows. Without the pooled mode the connection is
+        shared, so the rows are read at once to release the lock.
+        :param query: SQL query to execute.
+        :type query: str
+        :param parameters: all the parameters for the query.
+        :type parameters Iterable|dict
+        :param fetch_size: number of rows read from the cursor at once
+        :type fetch_size: int
+        :rtype: Iterator[sqlite.Row]
+        """
+        if not self._pooled:
+            yield from self.execute(query, parameters, commit=False)
+            return
+
+        self._logger.debug("Streaming query: '%s' with params %s.", query, parameters)
+        rows = 0
+        start = time.perf_counter()
+        cursor = self._connection().execute(query, parameters or [])
+        latency = (time.perf_counter() - start) * 1000
+        try:
+            while True:
+                start = time.perf_counter()
+                batch = cursor.fetchmany(fetch_size)
+                latency += (time.perf_counter() - start) * 1000
+                if len(batch) == 0:
+                    break
+                rows += len(batch)
+                yield from batch
+        finally:
+            cursor.close()
+            self._record(query, latency, rows)
+
+    def execute_transaction(self, statements):
+        """
+        Execute multiple SQL requests in one transaction, nothing is applied if one fails.
+        :param statements: queries to execute with their parameters
+        :type statements: list of (str, Iterable|dict)
+        :return the number of rows modified, inserted or deleted
+        :rtype: int
+        """
+        self._logger.debug("Executing %d queries in one transaction.", len(statements))
+        changes = 0
+        connection = self._connection()
+        with self._locked() as lock_wait, connection:
+            for query, parameters in statements:
+                start = time.perf_counter()
+                try:
+                    rows = max(connection.execute(query, parameters or []).rowcount, 0)
+                except sqlite.Error:
+                    self._record(query, (time.perf_counter() - start) * 1000, 0, lock_wait, True)
+                    raise
+                self._record(query, (time.perf_counter() - start) * 1000, rows, lock_wait)
+                changes += rows
+                lock_wait = 0.0
+        return changes
+
+    def execute_script(self, script):
+        """
+        Execute SQL statements until they are done, without parameters and outside of a
+        transaction. Needed by the pragmas that work by steps, e.g. incremental_vacuum,
+        which execute would only run once.
+        :param script: SQL statements to execute.
+        :type script: str
+        """
+        self._logger.debug("Executing script: '%s'.", script)
+        connection = self._connection()
+        with self._locked() as lock_wait:
+            start = time.perf_counter()
+            try:
+                connection.executescript(script)
+            except sqlite.Error:
+                self._record(script, (time.perf_counter() - start) * 1000, 0, lock_wait, True)
+                raise
+            self._record(script, (time.perf_counter() - start) * 1000, 0, lock_wait)
+
+    def enqueue(self, query, parameters):
+        """
+        Queue an insert that will be written by the flusher along with the other
+        pending rows. Falls back to execute when the write-behind mode is disabled, or
+        once the service is closing and its last flush may have run already.
+        :param query: SQL insert to execute.
+        :type query: str
+        :param parameters: all the parameters for the query.
+        :type parameters Iterable
+        """
+        with self._pending_condition:
+            queued = self._write_behind_enabled and not self._closing
+            if queued:
+                if self._oldest_pending_at is None:
+                    self._oldest_pending_at = time_in_millisecond()
+                self._pending_rows.append((query, parameters))
+                depth = len(self._pending_rows)
+                self._write_behind_stats["max_queue_depth"] = max(
+                    depth, self._write_behind_stats["max_queue_depth"]
+                )
+                if depth >= self._max_batch_size:
+                    self._pending_condition.notify()
+        if not queued:
+            self.execute(query, parameters)
+
+    def flush(self):
+        """
+        Write every pending row of the write-behind queue in one transaction. When the
+        database is busy or failing, the rows go back to the head of the queue and are
+        written again after a backoff. The rows the database rejects are dropped.
+        :return: False if the rows are back in the queue
+        :rtype: bool
+        """
+        with self._pending_condition:
+            rows = self._pending_rows
+            oldest_pending_at = self._oldest_pending_at
+            self._pending_rows = []
+            self._oldest_pending_at = None
+
+        if len(rows) == 0:
+            return True
+
+        start = time.perf_counter()
+        try:
+            dropped = self._write_rows(rows)
+        except sqlite.Error as error:
+            self._requeue(rows, oldest_pending_at, error)
+            return False
+        latency = (time.perf_counter() - start) * 1000
+
+        with self._pending_condition:
+            self._failed_flushes = 0
+            self._retry_at = 0
+        stats = self._write_behind_stats
+        stats["flush_count"] += 1
+        stats["rows_flushed"] += len(rows) - dropped
+        stats["rows_dropped"] += dropped
+        stats["last_flush_latency"] = latency
+        stats["max_flush_latency"] = max(latency, stats["max_flush_latency"])
+        self._rows_written.inc(len(rows) - dropped)
+        self._flush_duration.observe(latency / 1000)
+        self._logger.debug("Flushed %d rows in %d ms", len(rows), latency)
+        return True
+
+    def _write_rows(self, rows):
+        """
+        Insert the rows in one transaction, one row at a time if the database rejects
+        one of them, so only the rejected rows are lost
+        :param rows: (query, parameters) in insertion order
+        :type rows: list
+        :return: number of rows rejected
+        :rtype: int
+        :raises sqlite.Error: when the rows can be written again later
+        """
+        connection = self._connection()
+        try:
+            with self._locked() as lock_wait, connection:
+                # Keep the insertion order while grouping consecutive identical queries
+                for query, group in groupby(rows, key=lambda row: row[0]):
+                    parameters = [row[1] for row in group]
+                    query_start = time.perf_counter()
+                    connection.executemany(query, parameters)
+                    self._record(
+                        query,
+                        (time.perf_counter() - query_start) * 1000,
+                        len(parameters),
+                        lock_wait,
+                    )
+                    lock_wait = 0.0
+            return 0
+        except _REJECTED_ROW_ERRORS as error:
+            self._logger.warning(
+                "Batch of %d rows rejected (%s), writing them one by one", len(rows), error
+            )
+
+        dropped = 0
+        with self._locked(), connection:
+            # A statement failing on a constraint doesn't roll the transaction back
+            for query, parameters in rows:
+                try:
+                    connection.execute(query, parameters)
+                except _REJECTED_ROW_ERRORS as error:
+                    self._logger.error(
+                        "Row dropped, rejected by the database: %s %s (%s)",
+                        query,
+                        parameters,
+                        error,
+                    )
+                    dropped += 1
+        return dropped
+
+    def _requeue(self, rows, oldest_pending_at, error):
+        """
+        Put the rows of a failed flush back at the head of the queue, and delay the next
+        flush, doubling the delay after each failure
+        :param rows: rows of the failed flush
+        :type rows: list
+        :param oldest_pending_at: time the oldest of these rows was queued, in ms
+        :type oldest_pending_at: float
+        :param error: error of the flush
+        :type error: sqlite.Error
+        """
+        with self._pending_condition:
+            self._pending_rows = rows + self._pending_rows
+            self._oldest_pending_at = oldest_pending_at
+            self._failed_flushes += 1
+            delay = min(
+                self._retry_delay * 2 ** (self._failed_flushes - 1), _MAX_RETRY_DELAY
+            )
+            self._retry_at = time_in_millisecond() + delay
+            self._write_behind_stats["failed_flushes"] += 1
+        self._logger.error(
+            "Unable to flush %d rows, writing them again in %d ms: %s",
+            len(rows),
+            delay,
+            error,
+        )
+
+    def _flush_loop(self):
+        """Flush the write-behind queue when it is full or its oldest row is too old"""
+        while True:
+            with self._pending_condition:
+                while not self._closing:
+                    deadline = self._flush_deadline()
+                    if deadline is None:
+                        self._pending_condition.wait()
+                        continue
+                    remaining = deadline - time_in_millisecond()
+                    if remaining <= 0:
+                        break
+                    self._pending_condition.wait(remaining / 1000)
+                if self._closing:
+                    return
+            self.flush()
+
+    def _flush_deadline(self):
+        """
+        :return: time of the next flush in ms: once the queue is full or its oldest row
+        is too old, and not before the backoff of a failed flush. None if the queue is
+        empty.
+        :rtype: float
+        """
+        if self._oldest_pending_at is None:
+            return None
+        if len(self._pending_rows) >= self._max_batch_size:
+            deadline = 0
+        else:
+            deadline = self._oldest_pending_at + self._max_delay
+        return max(deadline, self._retry_at)
+
+    @property
+    def write_behind_stats(self):
+        """
+        Statistics of the write-behind queue, latencies are in milliseconds.
+        :rtype: dict
+        """
+        with self._pending_condition:
+            stats = dict(self._write_behind_stats)
+            stats["queue_depth"] = len(self._pending_rows)
+        return stats
+
     def close(self):
         """Closing the database connection"""
         self._logger.debug("Closing database connection")
-        self._db.close()
+        if self._flusher is not None:
+            with self._pending_condition:
+                self._closing = True
+                self._pending_condition.notify()
+            self._flusher.join()
+        for attempt in range(1, _CLOSE_FLUSH_ATTEMPTS + 1):
+            if self.flush():
+                break
+            if attempt == _CLOSE_FLUSH_ATTEMPTS:
+                self._logger.error(
+                    "%d rows lost, the database is not writable",
+                    len(self._pending_rows),
+                )
+            else:
+                time.sleep(self._retry_delay * attempt / 1000)
+        self._logger.info("Write-behind statistics: %s", self.write_behind_stats)
+        for query, stats in self.query_statistics().items():
+            self._logger.info(
+                "'%s': %d executions, %d rows, %.1f ms mean, %.1f ms max",
+                query,
+                stats["count"],
+                stats["rows"],
+                stats["latency"]["mean"],
+                stats["latency"]["max"],
+            )
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
         self._logger.info("Database connection closed")
 
+    @property
+    def path(self):
+        """
+        :return: path of the database file
+        :rtype: str
+        """
+        return _db_path
+
     def run_init_scripts(self):
-        """Run all the scripts contained in the database/upgrades folder."""
-        self._logger.debug("Run the initialization scripts")
-
-        files = os.listdir(_db_init_scripts_dir)
-        for file_path in files:
-            with open(f"{_db_init_scripts_dir}/{file_path}", "r") as file:
-                self._db.executescript(file.read())
-                self._db.commit()
-                self._logger.debug("executing %s file", file_path)
+        """
+        Apply, in numeric order, the scripts of the database/upgrades folder that are
+        newer than the database. The version applied is kept in PRAGMA user_version
+        and each script runs in its own transaction.
+        """
+        connection = self._connection()
+        with self._locked():
+            current_version = connection.execute("pragma user_version").fetchone()[0]
+            self._logger.debug("Database version: %d", current_version)
+
+            for version, file_name in self._upgrade_scripts():
+                if version <= current_version:
+                    continue
+                self._logger.info("Upgrading database to version %d (%s)", version, file_name)
+                with open(f"{_db_init_scripts_dir}/{file_name}", "r") as file:
+                    script = file.read()
+                try:
+                    connection.executescript(
+                        f"begin;\n{script}\n;pragma user_version = {version};\ncommit;"
+                    )
+                except sqlite.Error as error:
+                    if connection.in_transaction:
+                        connection.rollback()
+                    self._logger.error("Upgrade to version %d failed: %s", version, error)
+                    raise
+
+    @staticmethod
+    def _upgrade_scripts():
+        """
+        Upgrade scripts sorted by version, the version is the name of the file (e.g. 00002.sql)
+        :rtype: list of (int, str)
+        """
+        scripts = []
+        for file_name in os.listdir(_db_init_scripts_dir):
+            name, extension = os.path.splitext(file_name)
+            if extension == ".sql" and name.isdigit():
+                scripts.append((int(name), file_name))
+        return sorted(scripts)
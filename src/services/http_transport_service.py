@@ -0,0 +1,200 @@
+"""Service that sends the HTTP requests of the device"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.errors.circuit_open_error import CircuitOpenError
+from src.services.metrics_service import MetricsService
+from src.utils.clock import clock
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+from src.utils.metrics import Histogram
+
+_SERVICE_TAG = "services.HttpTransportService"
+_CONFIG_TAG = "http_transport"
+_POOL_SIZE_TAG = "pool_size"
+_TIMEOUT_TAG = "timeout"
+_FAILURE_THRESHOLD_TAG = "failure_threshold"
+_RESET_TIMEOUT_TAG = "reset_timeout"
+
+# States of the circuit breaker
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class HttpTransportService:
+    """
+    Service that owns the HTTP connection pool shared by the other services. The
+    connections are kept alive, so the TLS sessions are reused. A circuit breaker stops
+    sending requests after repeated failures, until a trial request succeeds.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: HttpTransportService
+        """
+        if HttpTransportService.__instance is None:
+            HttpTransportService.__instance = HttpTransportService()
+        return HttpTransportService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        transport_config = config[_CONFIG_TAG]
+        self._timeout = transport_config[_TIMEOUT_TAG]
+        self._failure_threshold = transport_config[_FAILURE_THRESHOLD_TAG]
+        self._reset_timeout = transport_config[_RESET_TIMEOUT_TAG]
+
+        pool_size = transport_config[_POOL_SIZE_TAG]
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._session = requests.sessions.Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        # name of the endpoint -> latencies and number of failures
+        self._latencies = {}
+        self._errors = {}
+        MetricsService.instance().gauge(
+            "http_circuit_open",
+            "1 while the circuit breaker rejects the requests to the API",
+            function=lambda: self._state != CIRCUIT_CLOSED,
+        )
+        self._logger.info("initialized")
+
+    def request(self, method, url, name=None, timeout=None, **kwargs):
+        """
+        Send a request through the circuit breaker.
+        :param method: HTTP method of the request e.g. 'GET'
+        :type method: str
+        :param url: full url of the request
+        :type url: str
+        :param name: name of the endpoint in the metrics, the url by default
+        :type name: str
+        :param timeout: timeout in seconds, the configured one by default
+        :type timeout: float
+        :param kwargs: other arguments of requests.Session.request
+        :return: the response, whatever its status code
+        :rtype: requests.Response
+        :raises CircuitOpenError: when the circuit is open
+        :raises requests.RequestException: when the request failed
+        """
+        name = f"{method} {name or url}"
+        trial = self._acquire()
+
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            answer = self._session.request(
+                method, url, timeout=timeout or self._timeout, **kwargs
+            )
+            # The server errors count as failures, the client errors don't
+            succeeded = answer.status_code < 500
+            return answer
+        finally:
+            # Whatever interrupted the request, a trial must not stay in flight
+            self._observe(name, start, succeeded, trial)
+
+    @property
+    def state(self):
+        """
+        :return: state of the circuit breaker
+        :rtype: str
+        """
+        return self._state
+
+    @property
+    def statistics(self):
+        """
+        State of the circuit breaker, and the latencies and failures of each endpoint
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "endpoints": {
+                    name: {**histogram.snapshot(), "errors": self._errors[name]}
+                    for name, histogram in self._latencies.items()
+                },
+            }
+
+    def close(self):
+        """Close the pooled connections"""
+        self._session.close()
+
+    def _acquire(self):
+        """
+        Check that a request can be sent, the first request after the reset timeout is
+        sent as a trial while the other ones are still rejected.
+        :return: True if the request is the trial of the half-open circuit
+        :rtype: bool
+        :raises CircuitOpenError: when the circuit is open
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return False
+            if (
+                self._state == CIRCUIT_OPEN
+                and clock().monotonic() / 1000 - self._opened_at >= self._reset_timeout
+            ):
+                self._state = CIRCUIT_HALF_OPEN
+                self._logger.info("Circuit half-open, sending a trial request")
+            if self._state == CIRCUIT_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        raise CircuitOpenError(503)
+
+    def _observe(self, name, start, succeeded, trial):
+        """
+        Record the result of a request and update the circuit breaker
+        :param trial: True if the request is the trial of the half-open circuit
+        :type trial: bool
+        """
+        latency = (time.perf_counter() - start) * 1000
+        with self._lock:
+            if name not in self._latencies:
+                self._latencies[name] = Histogram()
+                self._errors[name] = 0
+            self._latencies[name].observe(latency)
+            if not succeeded:
+                self._errors[name] += 1
+
+            if trial:
+                self._trial_in_flight = False
+            elif self._state != CIRCUIT_CLOSED:
+                # Sent before the circuit opened, only the trial can close it again
+                return
+
+            if succeeded:
+                if self._state != CIRCUIT_CLOSED:
+                    self._logger.info("Circuit closed")
+                self._state = CIRCUIT_CLOSED
+                self._failures = 0
+                return
+
+            self._failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or (
+                self._state == CIRCUIT_CLOSED
+                and self._failures >= self._failure_threshold
+            ):
+                self._state = CIRCUIT_OPEN
+                self._opened_at = clock().monotonic() / 1000
+                self._logger.warning(
+                    "Circuit open after %d failures, retrying in %d s",
+                    self._failures,
+                    self._reset_timeout,
+                )
@@ -1,14 +1,28 @@
 """Service to interact with wifi and check the internet"""
+import threading
+import time
+
 import requests
 from wireless import Wireless
+from src.errors.http_error import HttpError
+from src.services.http_transport_service import HttpTransportService
+from src.services.metrics_service import MetricsService
+from src.utils.configuration import config
 from src.utils.logger import get_logger
+from src.utils.metrics import Histogram
+from src.utils import utc_timestamp, HTTP_HEAD
 
 _SERVICE_TAG = "services.InternetConnectionService"
+_CONFIG_TAG = "internet_connection"
+_HEALTHY_INTERVAL_TAG = "healthy_interval"
+_UNHEALTHY_INTERVAL_TAG = "unhealthy_interval"
+_TIMEOUT_TAG = "timeout"
 
 
 class InternetConnectionService:
     """
-    Service to interact with the Wifi and check the internet connection
+    Service to interact with the Wifi and check the internet connection. The connection
+    is probed by a background thread, the other threads only read the last result.
     """
 
     _logger = get_logger(_SERVICE_TAG)
@@ -29,26 +43,106 @@ class InternetConnectionService:
 
     def __init__(self):
         """Initialize the service"""
+        connection_config = config[_CONFIG_TAG]
+        self._healthy_interval = connection_config[_HEALTHY_INTERVAL_TAG]
+        self._unhealthy_interval = connection_config[_UNHEALTHY_INTERVAL_TAG]
+        self._timeout = connection_config[_TIMEOUT_TAG]
+        self._url = config["api"]["base_url"]
+
         self._wireless = Wireless()
+        # The pooled connections to the API are reused between two probes
+        self._transport = HttpTransportService.instance()
+        self._latency = Histogram()
+        self._health = {
+            "healthy": False,
+            "last_check": None,
+            "last_healthy": None,
+            "latency": None,
+            "consecutive_failures": 0,
+        }
+        self._lock = threading.Lock()
+
+        self._wake_up = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        MetricsService.instance().gauge(
+            "internet_connection_healthy",
+            "1 if the last probe reached the API",
+            function=lambda: self._connection_is_healthy,
+        )
         self._logger.info("initialized")
 
+    def start(self):
+        """Start probing the connection in the background"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="connection-prober", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background probing"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wake_up.set()
+        self._thread.join()
+        self._thread = None
+
+    def probe_now(self):
+        """Ask the background thread to check the connection without waiting"""
+        self._wake_up.set()
+
+    def _run(self):
+        """Probe the connection, more often when it is unhealthy"""
+        while not self._stopping.is_set():
+            self.check_connection()
+            interval = (
+                self._healthy_interval
+                if self._connection_is_healthy
+                else self._unhealthy_interval
+            )
+            self._wake_up.wait(interval)
+            self._wake_up.clear()
+
     def check_connection(self):
         """
-        Check if the device has a internet access
+        Check if the device has a internet access by reaching the API. Blocking, called
+        by the background thread.
         :return: True if the device has access to internet
         :rtype: bool
         """
+        latency = None
         if self._wireless.current() is None:
-            return False
-        url = "https://httpbin.org/get"
-        timeout = 1
-        try:
-            requests.get(url, timeout=timeout)
-            self._connection_is_healthy = True
-            return True
-        except (requests.ConnectionError, requests.Timeout):
-            self._connection_is_healthy = False
-            return False
+            healthy = False
+        else:
+            start = time.perf_counter()
+            try:
+                # Any answer, even an error, means the API is reachable
+                self._transport.request(
+                    HTTP_HEAD, self._url, name="probe", timeout=self._timeout
+                )
+                latency = (time.perf_counter() - start) * 1000
+                self._latency.observe(latency)
+                healthy = True
+            except (requests.RequestException, HttpError):
+                healthy = False
+
+        with self._lock:
+            now = utc_timestamp()
+            self._health = {
+                "healthy": healthy,
+                "last_check": now,
+                "last_healthy": now if healthy else self._health["last_healthy"],
+                "latency": latency,
+                "consecutive_failures": 0
+                if healthy
+                else self._health["consecutive_failures"] + 1,
+            }
+            self._connection_is_healthy = healthy
+        return healthy
 
     def check_wifi(self):
         """
@@ -70,6 +164,8 @@ class InternetConnectionService:
         self._logger.debug(
             "Connection is successful" if successful else "Connection failed"
         )
+        if successful:
+            self.probe_now()
         return successful
 
     @property
@@ -80,3 +176,14 @@ class InternetConnectionService:
         :rtype: bool
         """
         return self._connection_is_healthy
+
+    @property
+    def health(self):
+        """
+        State of the connection published by the last check: healthy, time of the last
+        check and of the last healthy check, latency in ms, number of consecutive
+        failures, and the distribution of the latencies.
+        :rtype: dict
+        """
+        with self._lock:
+            return {**self._health, "latencies": self._latency.snapshot()}
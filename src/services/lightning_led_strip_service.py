@@ -1,6 +1,10 @@
 """Service to interact with the LED Lightning"""
-from neopixel import NeoPixel
-from src.utils import pin_number_to_digital_gpio, led_utils, get_logger
+import threading
+import time
+
+from src.hal import hardware
+from src.services.metrics_service import MetricsService
+from src.utils import led_utils, get_logger
 from src.utils.configuration import config
 
 _SERVICE_TAG = "services.LightningLedStripService"
@@ -32,11 +36,14 @@ class LightningLedService:
         light_config = config[_CONFIG_TAG]   
         self._led_count = light_config[_LED_COUNT_CONFIG_KEY]
         self._led_by_tile = light_config[_LED_BY_TILE_KEY]
-        self._strip = NeoPixel(
-            pin_number_to_digital_gpio(light_config[_LED_PIN_CONFIG_KEY]),
-            self._led_count,
-            auto_write=False,
+        self._strip = hardware().neopixel(
+            light_config[_LED_PIN_CONFIG_KEY], self._led_count
+        )
+        self._show_duration = MetricsService.instance().histogram(
+            "neopixel_show_seconds", "Duration of the NeoPixel writes", strip="lightning"
         )
+        # The tiles are set by several components, the strip is written by one at a time
+        self._show_lock = threading.Lock()
         self._logger.info("initialized")
 
     def _update_segment(self, tile_nb, color, brightness):
@@ -54,7 +61,7 @@ class LightningLedService:
                 round(color[1] * brightness / 100),
                 round(color[2] * brightness / 100),
             )
-        self._strip.show()
+        self._show()
 
     def turn_on(self, tile_nb, brightness):
         """
@@ -78,5 +85,12 @@ class LightningLedService:
         """
         for i in range(self._led_count):
             self._strip[i] = led_utils.COLOR_BLACK
-        self._strip.show()
+        self._show()
         self._logger.debug(f"Turn OFF All Tiles Lightning")
+
+    def _show(self):
+        """Write the pixels to the strip, the duration of the write is measured"""
+        with self._show_lock:
+            start = time.perf_counter()
+            self._strip.show()
+            self._show_duration.observe(time.perf_counter() - start)
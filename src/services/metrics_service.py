@@ -0,0 +1,247 @@
+"""Service that collects the metrics of the device and serves them to Prometheus"""
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+from src.utils.metrics import Counter, Gauge, Histogram, DURATION_BUCKETS
+
+_SERVICE_TAG = "services.MetricsService"
+_CONFIG_TAG = "metrics"
+_ENABLED_TAG = "enabled"
+_HOST_TAG = "host"
+_PORT_TAG = "port"
+
+# Prefix of every metric name
+_NAMESPACE = "herbarium"
+_METRICS_PATH = "/metrics"
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_COUNTER = "counter"
+_GAUGE = "gauge"
+_HISTOGRAM = "histogram"
+
+
+class MetricsService:
+    """
+    Registry of the counters, gauges and histograms of the device. The metrics are
+    served in the Prometheus text format by a small HTTP server running on a
+    background thread, e.g. http://127.0.0.1:9464/metrics.
+    A metric is identified by its name and labels, asking twice for the same one
+    returns the same object, so the services can ask for it where they use it.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: MetricsService
+        """
+        if MetricsService.__instance is None:
+            MetricsService.__instance = MetricsService()
+        return MetricsService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        metrics_config = config[_CONFIG_TAG]
+        self._enabled = metrics_config[_ENABLED_TAG]
+        self._address = (metrics_config[_HOST_TAG], metrics_config[_PORT_TAG])
+
+        # name -> {"type", "documentation", "metrics": {labels: metric}}
+        self._families = {}
+        self._lock = threading.Lock()
+
+        self._server = None
+        self._thread = None
+        self._logger.info("initialized (enabled: %s)", self._enabled)
+
+    def counter(self, name, documentation, **labels):
+        """
+        :param name: name of the metric, without the namespace, e.g. api_requests_total
+        :type name: str
+        :param documentation: description of the metric
+        :type documentation: str
+        :param labels: labels of the metric
+        :rtype: Counter
+        """
+        return self._get(name, _COUNTER, documentation, labels, Counter)
+
+    def gauge(self, name, documentation, function=None, **labels):
+        """
+        :param name: name of the metric, without the namespace
+        :type name: str
+        :param documentation: description of the metric
+        :type documentation: str
+        :param function: function returning the value when it is collected, None to set
+        the value
+        :type function: Callable[[], float]
+        :param labels: labels of the metric
+        :rtype: Gauge
+        """
+        return self._get(name, _GAUGE, documentation, labels, lambda: Gauge(function))
+
+    def histogram(self, name, documentation, buckets=DURATION_BUCKETS, **labels):
+        """
+        :param name: name of the metric, without the namespace, e.g. loop_seconds
+        :type name: str
+        :param documentation: description of the metric
+        :type documentation: str
+        :param buckets: upper bound of each bucket, the durations are in seconds
+        :type buckets: Iterable of float
+        :param labels: labels of the metric
+        :rtype: Histogram
+        """
+        return self._get(
+            name, _HISTOGRAM, documentation, labels, lambda: Histogram(buckets)
+        )
+
+    def _get(self, name, metric_type, documentation, labels, factory):
+        """Get a metric, created on first use"""
+        name = f"{_NAMESPACE}_{name}"
+        key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = {
+                    "type": metric_type,
+                    "documentation": documentation,
+                    "metrics": {},
+                }
+                self._families[name] = family
+            elif family["type"] != metric_type:
+                raise ValueError(f"{name} is already a {family['type']}")
+            metric = family["metrics"].get(key)
+            if metric is None:
+                metric = factory()
+                family["metrics"][key] = metric
+            return metric
+
+    def render(self):
+        """
+        :return: every metric in the Prometheus text format
+        :rtype: str
+        """
+        with self._lock:
+            families = [
+                (name, dict(family, metrics=list(family["metrics"].items())))
+                for name, family in sorted(self._families.items())
+            ]
+
+        lines = []
+        for name, family in families:
+            lines.append(f"# HELP {name} {_escape_help(family['documentation'])}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for labels, metric in family["metrics"]:
+                if family["type"] == _HISTOGRAM:
+                    lines.extend(_histogram_lines(name, labels, metric.snapshot()))
+                    continue
+                try:
+                    value = metric.value
+                except Exception as error:  # pylint: disable=broad-except
+                    self._logger.debug("Unable to collect %s: %s", name, error)
+                    continue
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def start(self):
+        """Start serving the metrics in the background, if enabled"""
+        if not self._enabled or self._thread is not None:
+            return
+        try:
+            self._server = ThreadingHTTPServer(self._address, _MetricsRequestHandler)
+        except OSError as error:
+            self._logger.error(
+                "Unable to serve the metrics on %s:%d: %s", *self._address, error
+            )
+            return
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        self._logger.info("Serving the metrics on %s:%d", *self._address)
+
+    def stop(self):
+        """Stop the HTTP server"""
+        if self._thread is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Answer the scrapes of the metrics path"""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Send the metrics, or a 404 for any other path"""
+        if self.path.split("?")[0] != _METRICS_PATH:
+            self.send_error(404)
+            return
+        body = MetricsService.instance().render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", _CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log the requests with the service logger instead of stderr"""
+        MetricsService._logger.debug(format, *args)
+
+
+def _histogram_lines(name, labels, snapshot):
+    """
+    :return: the cumulative buckets, sum and count of a histogram
+    :rtype: list of str
+    """
+    lines = [
+        f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}"
+        for bound, count in snapshot["buckets"].items()
+    ]
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(snapshot['sum'])}")
+    lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+    return lines
+
+
+def _format_labels(labels):
+    """
+    :param labels: labels as (name, value)
+    :type labels: tuple
+    :return: the labels between braces, empty without labels
+    :rtype: str
+    """
+    if len(labels) == 0:
+        return ""
+    escaped = (
+        (label, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for label, value in labels
+    )
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+
+def _format_value(value):
+    """
+    :rtype: str
+    """
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_help(documentation):
+    """
+    :rtype: str
+    """
+    return documentation.replace("\\", "\\\\").replace("\n", "\\n")
@@ -0,0 +1,246 @@
+"""Service that keeps the API mutations until they are acknowledged"""
+import json
+import random
+
+import requests
+
+from src.errors.circuit_open_error import CircuitOpenError
+from src.services.database_service import DatabaseService
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+from src.utils import time_in_millisecond
+from src.utils.sql_queries import (
+    INSERT_OUTBOX_ENTRY,
+    GET_DUE_OUTBOX_ENTRIES,
+    GET_LAST_DEAD_OUTBOX_ENTRY,
+    DELETE_OUTBOX_ENTRY,
+    UPDATE_OUTBOX_ENTRY_RETRY,
+    UPDATE_OUTBOX_ENTRY_DEAD,
+    GET_PENDING_OUTBOX_COUNT,
+    GET_PENDING_OUTBOX_COUNT_BY_OPERATION,
+)
+
+_SERVICE_TAG = "services.OutboxService"
+_CONFIG_TAG = "outbox"
+_MAX_ATTEMPTS_TAG = "max_attempts"
+_BASE_DELAY_TAG = "base_delay"
+_MAX_DELAY_TAG = "max_delay"
+_BATCH_SIZE_TAG = "batch_size"
+
+# Operations that can be queued
+OPERATION_ADD_PLANT = "add_plant"
+OPERATION_REMOVE_PLANT = "remove_plant"
+OPERATION_SEND_LOGS = "send_logs"
+
+# Errors of a handler that didn't reach the API: the entry is retried without using
+# one of its attempts, an outage can't dead-letter it
+_UNREACHABLE_ERRORS = (CircuitOpenError, requests.ConnectionError, requests.Timeout)
+
+
+class OutboxService:
+    """
+    Durable queue of the API mutations. Each entry has an idempotency key, so the same
+    mutation can't be queued twice, and is retried with an exponential backoff until
+    its handler succeeds or the maximum number of attempts is reached (dead letter).
+    Only the attempts that reached the API count, and queuing a dead letter again
+    gives it a new set of attempts.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: OutboxService
+        """
+        if OutboxService.__instance is None:
+            OutboxService.__instance = OutboxService()
+        return OutboxService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        outbox_config = config[_CONFIG_TAG]
+        self._max_attempts = outbox_config[_MAX_ATTEMPTS_TAG]
+        self._base_delay = outbox_config[_BASE_DELAY_TAG] * 1000
+        self._max_delay = outbox_config[_MAX_DELAY_TAG] * 1000
+        self._batch_size = outbox_config[_BATCH_SIZE_TAG]
+
+        self._db_service = DatabaseService.instance()
+        self._handlers = {}
+        self._logger.info("initialized")
+
+    def register_handler(self, operation, handler):
+        """
+        Register the function that sends the entries of an operation to the API
+        :param operation: name of the operation
+        :type operation: str
+        :param handler: function like handler(payload, idempotency_key) that returns
+        True when the API acknowledged the mutation
+        :type handler: Callable
+        """
+        self._handlers[operation] = handler
+
+    def enqueue(self, operation, payload, idempotency_key):
+        """
+        Queue a mutation, ignored if an entry with the same idempotency key is queued.
+        A dead entry with the same key is revived with the new payload.
+        :param operation: name of the operation
+        :type operation: str
+        :param payload: parameters of the operation, must be serializable in JSON
+        :type payload: dict
+        :param idempotency_key: unique key of the mutation, also sent to the API
+        :type idempotency_key: str
+        :return: True if the entry was added or revived
+        :rtype: bool
+        """
+        added = self._db_service.execute_transaction(
+            [(INSERT_OUTBOX_ENTRY, [operation, json.dumps(payload), idempotency_key])]
+        )
+        if added:
+            self._logger.debug("Queued %s (%s)", operation, idempotency_key)
+        return added > 0
+
+    def pending(self, operation=None):
+        """
+        Number of entries waiting to be sent, dead letters excluded
+        :param operation: only count the entries of this operation
+        :type operation: str
+        :rtype: int
+        """
+        if operation is None:
+            result = self._db_service.execute(GET_PENDING_OUTBOX_COUNT, commit=False)
+        else:
+            result = self._db_service.execute(
+                GET_PENDING_OUTBOX_COUNT_BY_OPERATION, [operation], commit=False
+            )
+        return result[0][0]
+
+    def last_dead_letter(self, operation):
+        """
+        :param operation: name of the operation
+        :type operation: str
+        :return: payload and idempotency key of the last entry of the operation
+        dead-lettered, None if there is none
+        :rtype: (dict, str)
+        """
+        rows = self._db_service.execute(
+            GET_LAST_DEAD_OUTBOX_ENTRY, [operation], commit=False
+        )
+        if len(rows) == 0:
+            return None
+        return json.loads(rows[0]["payload"]), rows[0]["idempotency_key"]
+
+    def drain(self):
+        """
+        Send the due entries, oldest first, until the queue is empty or an entry fails
+        :return: False if an entry failed
+        :rtype: bool
+        """
+        sent = 0
+        while True:
+            entries = self._db_service.execute(
+                GET_DUE_OUTBOX_ENTRIES,
+                [time_in_millisecond(), self._batch_size],
+                commit=False,
+            )
+            if len(entries) == 0:
+                break
+            for entry in entries:
+                if not self._send(entry):
+                    self._logger.info("Outbox drain stopped after %d entries", sent)
+                    return False
+                sent += 1
+        if sent > 0:
+            self._logger.info("Outbox drained, %d entries sent", sent)
+        return True
+
+    def _send(self, entry):
+        """
+        Call the handler of an entry and remove it, or schedule its next attempt
+        :param entry: row of the outbox table
+        :type entry: sqlite3.Row
+        :return: True if the handler succeeded
+        :rtype: bool
+        """
+        handler = self._handlers.get(entry["operation"])
+        error = None
+        try:
+            if handler is None:
+                error = f"No handler for {entry['operation']}"
+            elif handler(json.loads(entry["payload"]), entry["idempotency_key"]):
+                self._db_service.execute(DELETE_OUTBOX_ENTRY, [entry["id"]])
+                return True
+            else:
+                error = "Rejected"
+        except _UNREACHABLE_ERRORS as exception:
+            self._postpone(entry, exception)
+            return False
+        except Exception as exception:  # pylint: disable=broad-except
+            error = str(exception)
+
+        attempts = entry["attempts"] + 1
+        if attempts >= self._max_attempts:
+            self._db_service.execute(
+                UPDATE_OUTBOX_ENTRY_DEAD, [attempts, error, entry["id"]]
+            )
+            self._logger.error(
+                "%s (%s) dead-lettered after %d attempts: %s",
+                entry["operation"],
+                entry["idempotency_key"],
+                attempts,
+                error,
+            )
+        else:
+            self._db_service.execute(
+                UPDATE_OUTBOX_ENTRY_RETRY,
+                [attempts, time_in_millisecond() + self._backoff(attempts), error, entry["id"]],
+            )
+            self._logger.info(
+                "%s (%s) failed (attempt %d): %s",
+                entry["operation"],
+                entry["idempotency_key"],
+                attempts,
+                error,
+            )
+        return False
+
+    def _postpone(self, entry, error):
+        """
+        Schedule the next attempt of an entry that didn't reach the API, its number of
+        attempts is kept
+        :param entry: row of the outbox table
+        :type entry: sqlite3.Row
+        :param error: reason the API wasn't reached
+        :type error: Exception
+        """
+        attempts = entry["attempts"]
+        self._db_service.execute(
+            UPDATE_OUTBOX_ENTRY_RETRY,
+            [
+                attempts,
+                time_in_millisecond() + self._backoff(max(attempts, 1)),
+                str(error),
+                entry["id"],
+            ],
+        )
+        self._logger.info(
+            "%s (%s) postponed, the API is unreachable: %s",
+            entry["operation"],
+            entry["idempotency_key"],
+            error,
+        )
+
+    def _backoff(self, attempts):
+        """
+        Delay before the next attempt: exponential, capped and with half of it random
+        so the devices don't retry at the same time.
+        :param attempts: number of attempts already done
+        :type attempts: int
+        :return: delay in milliseconds
+        :rtype: float
+        """
+        delay = min(self._max_delay, self._base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
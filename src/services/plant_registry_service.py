@@ -0,0 +1,260 @@
+"""Service that keeps the plants of the greenhouse in memory"""
+import threading
+
+from src.models import Plant
+from src.services.database_service import DatabaseService
+from src.utils.logger import get_logger
+from src.utils.sql_queries import (
+    GET_ACTIVE_PLANTS,
+    GET_ACTIVE_PLANT_BY_POSITION,
+    INSERT_NEW_PLANT,
+    REMOVE_PLANT,
+    DELETE_UNTRANSMITTED_PLANT_BY_POSITION,
+    UPDATE_PLANT,
+    UPDATE_PLANT_INFO,
+)
+
+_SERVICE_TAG = "services.PlantRegistryService"
+
+# Events sent to the listeners
+PLANT_ADDED = "added"
+PLANT_REMOVED = "removed"
+PLANT_UPDATED = "updated"
+
+
+class PlantRegistryService:
+    """
+    Service that loads the plant table once and indexes the plants by position and
+    uuid. Every modification is written to the database then applied to the index.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: PlantRegistryService
+        """
+        if PlantRegistryService.__instance is None:
+            PlantRegistryService.__instance = PlantRegistryService()
+        return PlantRegistryService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        self._db_service = DatabaseService.instance()
+        self._lock = threading.RLock()
+        self._by_position = {}
+        self._by_uuid = {}
+        self._listeners = []
+        self.reload()
+        self._logger.info("initialized")
+
+    def reload(self):
+        """Rebuild the index from the plant table"""
+        with self._lock:
+            self._by_position.clear()
+            self._by_uuid.clear()
+            for row in self._db_service.execute(GET_ACTIVE_PLANTS, commit=False):
+                self._index(Plant.create_from_row(row))
+        self._logger.debug("%d plants loaded", len(self._by_position))
+
+    @property
+    def plants(self):
+        """
+        Plants currently in the greenhouse sorted by position
+        :rtype: list[Plant]
+        """
+        with self._lock:
+            return [self._by_position[key] for key in sorted(self._by_position)]
+
+    def get_by_position(self, position):
+        """
+        :param position: position of the plant
+        :type position: int
+        :return: the plant at this position, None if there is no plant
+        :rtype: Plant
+        """
+        return self._by_position.get(position)
+
+    def get_by_uuid(self, uuid):
+        """
+        :param uuid: universal unique identifier of the plant
+        :type uuid: str
+        :return: the plant, None if there is no plant with this uuid
+        :rtype: Plant
+        """
+        return self._by_uuid.get(uuid)
+
+    def add_plant(self, position):
+        """
+        Register a new plant detected at a position. The plant doesn't have a uuid until
+        it is transmitted to the API.
+        :param position: position of the plant
+        :type position: int
+        :rtype: Plant
+        """
+        with self._lock:
+            self._db_service.execute(INSERT_NEW_PLANT, [position])
+            row = self._db_service.execute(
+                GET_ACTIVE_PLANT_BY_POSITION, [position], commit=False
+            )[0]
+            plant = Plant.create_from_row(row)
+            self._index(plant)
+        self._notify(PLANT_ADDED, plant)
+        return plant
+
+    def remove_plant(self, plant):
+        """
+        Mark a plant as removed. A plant that was never transmitted to the API is deleted.
+        :param plant: plant removed
+        :type plant: Plant
+        """
+        with self._lock:
+            if plant.uuid is None:
+                self._db_service.execute(
+                    DELETE_UNTRANSMITTED_PLANT_BY_POSITION, [plant.position]
+                )
+            else:
+                self._db_service.execute(REMOVE_PLANT, [plant.uuid])
+            self._unindex(plant)
+        self._notify(PLANT_REMOVED, plant)
+
+    def update_plant(self, plant):
+        """
+        Save the plant created by the API for a position
+        :param plant: plant returned by the API
+        :type plant: Plant
+        :return: False if no plant of this position was waiting for its uuid, e.g. it
+        was removed while the API created it
+        :rtype: bool
+        """
+        with self._lock:
+            updated = self._db_service.execute_transaction(
+                [
+                    (
+                        UPDATE_PLANT,
+                        [
+                            plant.uuid,
+                            plant.moisture_goal,
+                            plant.light_exposure_min_duration,
+                            plant.position,
+                        ],
+                    )
+                ]
+            )
+            if updated == 0:
+                return False
+            previous = self._by_position.get(plant.position)
+            if previous is not None:
+                self._unindex(previous)
+            self._index(plant)
+        self._notify(PLANT_UPDATED, plant)
+        return True
+
+    def update_plant_info(self, uuid, moisture_goal, light_exposure_min_duration):
+        """
+        Update the goals of a plant
+        :param uuid: universal unique identifier of the plant
+        :type uuid: str
+        :param moisture_goal: percentage of moisture targeted
+        :type moisture_goal: float
+        :param light_exposure_min_duration: minimum quantity of light in hours
+        :type light_exposure_min_duration: float
+        """
+        with self._lock:
+            self._db_service.execute(
+                UPDATE_PLANT_INFO, [moisture_goal, light_exposure_min_duration, uuid]
+            )
+            previous = self._by_uuid.get(uuid)
+            if previous is None:
+                return
+            plant = Plant(
+                uuid, previous.position, moisture_goal, light_exposure_min_duration
+            )
+            self._index(plant)
+        self._notify(PLANT_UPDATED, plant)
+
+    def update_plants_info(self, plants):
+        """
+        Update the goals of the plants that changed, in one transaction. The plants
+        unknown or identical to the index are skipped.
+        :param plants: plants with their new goals, e.g. returned by the API
+        :type plants: list[Plant]
+        :return: the plants updated
+        :rtype: list[Plant]
+        """
+        with self._lock:
+            changed = []
+            for plant in plants:
+                previous = self._by_uuid.get(plant.uuid)
+                if previous is None or (
+                    previous.moisture_goal == plant.moisture_goal
+                    and previous.light_exposure_min_duration
+                    == plant.light_exposure_min_duration
+                ):
+                    continue
+                changed.append(
+                    Plant(
+                        plant.uuid,
+                        previous.position,
+                        plant.moisture_goal,
+                        plant.light_exposure_min_duration,
+                    )
+                )
+            if len(changed) == 0:
+                return changed
+
+            self._db_service.execute_transaction(
+                [
+                    (
+                        UPDATE_PLANT_INFO,
+                        [
+                            plant.moisture_goal,
+                            plant.light_exposure_min_duration,
+                            plant.uuid,
+                        ],
+                    )
+                    for plant in changed
+                ]
+            )
+            for plant in changed:
+                self._index(plant)
+        for plant in changed:
+            self._notify(PLANT_UPDATED, plant)
+        return changed
+
+    def add_listener(self, listener):
+        """
+        Register a function called with the event and the plant on every change
+        :param listener: function like listener(event, plant)
+        :type listener: Callable
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        :param listener: function previously registered
+        :type listener: Callable
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _index(self, plant):
+        """Add or replace a plant in the index"""
+        self._by_position[plant.position] = plant
+        if plant.uuid is not None:
+            self._by_uuid[plant.uuid] = plant
+
+    def _unindex(self, plant):
+        """Remove a plant from the index"""
+        self._by_position.pop(plant.position, None)
+        self._by_uuid.pop(plant.uuid, None)
+
+    def _notify(self, event, plant):
+        """Call every listener, outside of the lock"""
+        self._logger.debug("Plant %s at position %d", event, plant.position)
+        for listener in list(self._listeners):
+            listener(event, plant)
@@ -1,5 +1,6 @@
 """Service to interact with the pump"""
-from RPi import GPIO
+from src.hal import hardware
+from src.services.actuation_service import ActuationService
 from src.utils import get_logger
 from src.utils.configuration import config
 
@@ -13,7 +14,7 @@ _MIN_SPEED = "min_speed"
 
 class PumpService:
     """
-    Service to interact with the pump
+    Service to interact with the pump, through the actuation process when it is enabled
     """
     __instance = None
     _logger = get_logger(_SERVICE_TAG)
@@ -35,14 +36,29 @@ class PumpService:
         self._pwm_freq = pump_config[_PWM_FREQ]
         self._max_speed = pump_config[_MAX_SPEED]
         self._min_speed = pump_config[_MIN_SPEED]
+        self._pwm_val = 0.0
 
-        GPIO.setup(self._pump_pin, GPIO.OUT)
-        self._pump = GPIO.PWM(self._pump_pin, self._pwm_freq)
-        self._pump.start(0)
+        self._actuation = ActuationService.instance()
+        if self._actuation.enabled:
+            self._logger.debug(f"{_SERVICE_TAG} Pump driven by the actuation process")
+            return
 
-        self._pwm_val = 0.0
+        gpio = hardware().gpio
+        gpio.setup(self._pump_pin)
+        self._pump = gpio.pwm(self._pump_pin, self._pwm_freq)
+        self._pump.start(0)
         self._logger.debug(f"{_SERVICE_TAG} Pump Initiated")
 
+    @property
+    def duty_cycle(self):
+        """
+        :return: duty cycle of the PWM of the pump, in %
+        :rtype: float
+        """
+        if self._actuation.enabled:
+            return self._actuation.pump_duty_cycle
+        return self._pwm_val
+
     def _speed_to_pwm(self, speed):
         """
         Convert speed into pwm percentage
@@ -57,24 +73,35 @@ class PumpService:
         :param speed: in percentage [0.0-100.0]
         :type speed: double
         """
-        if speed == 0.0:
+        if self._actuation.enabled:
+            self._actuation.set_pump_speed(speed)
+        elif speed == 0.0:
             self.stop()
         elif speed == 100:
             self.full_speed()
         else:
-            self._pump.ChangeDutyCycle(self._speed_to_pwm(speed))
+            self._pwm_val = self._speed_to_pwm(speed)
+            self._pump.change_duty_cycle(self._pwm_val)
             self._logger.debug(f"{_SERVICE_TAG} Pump at {speed}%")
 
     def stop(self):
         """
         Stop the pump.
         """
-        self._pump.ChangeDutyCycle(0)
+        if self._actuation.enabled:
+            self._actuation.set_pump_speed(0.0)
+            return
+        self._pwm_val = 0.0
+        self._pump.change_duty_cycle(self._pwm_val)
         self._logger.debug(f"{_SERVICE_TAG} Pump stopped")
 
     def full_speed(self):
         """
         Set Pump at 100% speed.
         """
-        self._pump.ChangeDutyCycle(self._max_speed)
+        if self._actuation.enabled:
+            self._actuation.set_pump_speed(100.0)
+            return
+        self._pwm_val = self._max_speed
+        self._pump.change_duty_cycle(self._pwm_val)
         self._logger.debug(f"{_SERVICE_TAG} Pump at full speed")
@@ -0,0 +1,420 @@
+"""Service that runs the jobs of the main loop when they are due"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.metrics_service import MetricsService
+from src.utils.clock import clock, VirtualClock
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+
+_SERVICE_TAG = "services.SchedulerService"
+_CONFIG_TAG = "main_loop"
+_RUNTIME_TAG = "runtime"
+_SUMMARY_INTERVAL_TAG = "summary_interval"
+
+# Runtimes of the main loop
+RUNTIME_SCHEDULER = "scheduler"
+RUNTIME_ASYNCIO = "asyncio"
+
+
+def _now():
+    """
+    Monotonic time in milliseconds, the deadlines don't move with the system clock
+    :rtype: float
+    """
+    return clock().monotonic()
+
+
+class SchedulerService:
+    """
+    Cooperative scheduler of the main loop. The services and controllers register
+    periodic or one-shot jobs, run sorts them by deadline and sleeps until the next one
+    is due instead of polling every component. Two runtimes are available:
+    - scheduler: the jobs run one after the other on the thread calling run, a slow job
+    delays the others;
+    - asyncio: each component runs as its own coroutine, its jobs are sent to an
+    executor of its own, so a blocking call (NeoPixel, I2C, database) only delays the
+    jobs of the same component. The jobs of a component, i.e. with the same name, never
+    run at the same time, but the components do and must be thread-safe.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: SchedulerService
+        """
+        if SchedulerService.__instance is None:
+            SchedulerService.__instance = SchedulerService()
+        return SchedulerService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        # Jobs ordered by deadline, as (due_at, sequence, job), the sequence keeps the
+        # jobs due at the same time in registration order
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._runtime = config[_CONFIG_TAG][_RUNTIME_TAG]
+
+        # Timing of each component: its metrics, and its statistics since the last
+        # summary
+        self._timings = {}
+        self._timings_lock = threading.Lock()
+        self._window_started_at = _now()
+
+        # Asyncio runtime: event loop while it runs, the coroutines of the jobs and the
+        # executor of each component
+        self._loop = None
+        self._stop_event = None
+        self._coroutines = set()
+        self._executors = {}
+
+        self._metrics = MetricsService.instance()
+        self._iteration_duration = self._metrics.histogram(
+            "loop_iteration_seconds", "Duration of the jobs run on each wake-up"
+        )
+
+        summary_interval = config[_CONFIG_TAG][_SUMMARY_INTERVAL_TAG] * 1000
+        if summary_interval > 0:
+            self.every(
+                summary_interval, self._log_summary, "scheduler", delay=summary_interval
+            )
+        self._logger.info("initialized")
+
+    def every(self, interval, function, name, delay=0):
+        """
+        Register a periodic job. A job late by more than its interval runs once, the
+        deadlines missed are not caught up.
+        :param interval: time between two runs in ms
+        :type interval: float
+        :param function: function to run, without argument
+        :type function: Callable
+        :param name: name of the component running the job
+        :type name: str
+        :param delay: time before the first run in ms
+        :type delay: float
+        :return: the job, to cancel it
+        :rtype: dict
+        """
+        return self._add(
+            {"name": name, "function": function, "interval": interval}, delay
+        )
+
+    def once(self, delay, function, name):
+        """
+        Register a job run once
+        :param delay: time before the run in ms
+        :type delay: float
+        :param function: function to run, without argument
+        :type function: Callable
+        :param name: name of the component running the job
+        :type name: str
+        :return: the job, to cancel it
+        :rtype: dict
+        """
+        return self._add({"name": name, "function": function, "interval": None}, delay)
+
+    @staticmethod
+    def cancel(job):
+        """
+        Cancel a job, it is dropped when its deadline is reached
+        :param job: job returned by every or once
+        :type job: dict
+        """
+        job["cancelled"] = True
+
+    def _add(self, job, delay):
+        """Queue a job and wake up run if it is the next one due"""
+        job["cancelled"] = False
+        with self._condition:
+            job["due_at"] = _now() + delay
+            if self._loop is not None:
+                # Any thread can register a job, the coroutine is started by the loop
+                self._loop.call_soon_threadsafe(self._start_coroutine, job)
+                return job
+            heapq.heappush(self._queue, (job["due_at"], next(self._sequence), job))
+            self._condition.notify()
+        return job
+
+    def run(self):
+        """
+        Run the jobs when they are due, with the configured runtime, until stop is
+        called. Blocking.
+        """
+        if self._runtime == RUNTIME_ASYNCIO:
+            if not isinstance(clock(), VirtualClock):
+                asyncio.run(self._run_async())
+                return
+            # The event loop sleeps in real time
+            self._logger.warning("The asyncio runtime ignores the virtual clock, not used")
+
+        self._stopping = False
+        while True:
+            with self._condition:
+                jobs = self._wait_due_jobs()
+            if jobs is None:
+                return
+            start = time.perf_counter()
+            for job in jobs:
+                self._run_job(job)
+            self._iteration_duration.observe(time.perf_counter() - start)
+
+    def stop(self):
+        """Make run return once the running jobs are done"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def _wait_due_jobs(self):
+        """
+        Sleep until jobs are due, the lock of the condition must be held
+        :return: the jobs due, None when stopping
+        :rtype: list of dict
+        """
+        while not self._stopping:
+            now = _now()
+            jobs = []
+            while len(self._queue) > 0 and self._queue[0][0] <= now:
+                _, _, job = heapq.heappop(self._queue)
+                if not job["cancelled"]:
+                    jobs.append(job)
+            if len(jobs) > 0:
+                return jobs
+            timeout = (self._queue[0][0] - now) / 1000 if len(self._queue) > 0 else None
+            clock().wait(self._condition, timeout)
+        return None
+
+    def _run_job(self, job):
+        """Run a job and queue its next run if it is periodic"""
+        self._call(job)
+
+        if job["interval"] is None or job["cancelled"]:
+            return
+        with self._condition:
+            job["due_at"] = max(job["due_at"] + job["interval"], _now())
+            heapq.heappush(self._queue, (job["due_at"], next(self._sequence), job))
+
+    async def _run_async(self):
+        """
+        Asyncio runtime: start a coroutine for each job queued, then wait for stop. The
+        coroutines are cancelled when leaving, e.g. on KeyboardInterrupt, and the jobs
+        running in the executors are waited for.
+        """
+        self._stop_event = asyncio.Event()
+        with self._condition:
+            self._loop = asyncio.get_running_loop()
+            jobs = [job for _, _, job in sorted(self._queue)]
+            self._queue.clear()
+        for job in jobs:
+            self._start_coroutine(job)
+        self._logger.info("Asyncio runtime started with %d jobs", len(jobs))
+
+        try:
+            await self._stop_event.wait()
+        finally:
+            with self._condition:
+                self._loop = None
+                coroutines = list(self._coroutines)
+            for coroutine in coroutines:
+                coroutine.cancel()
+            await asyncio.gather(*coroutines, return_exceptions=True)
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+            self._executors.clear()
+            self._logger.info("Asyncio runtime stopped")
+
+    def _start_coroutine(self, job):
+        """Start the coroutine of a job, on the event loop"""
+        if self._loop is None:
+            return
+        coroutine = self._loop.create_task(self._job_coroutine(job))
+        self._coroutines.add(coroutine)
+        coroutine.add_done_callback(self._coroutines.discard)
+
+    async def _job_coroutine(self, job):
+        """
+        Run a job in the executor of its component each time it is due
+        :param job: job to run
+        :type job: dict
+        """
+        executor = self._executors.get(job["name"])
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=job["name"])
+            self._executors[job["name"]] = executor
+
+        while not job["cancelled"]:
+            await asyncio.sleep(max(job["due_at"] - _now(), 0) / 1000)
+            if job["cancelled"]:
+                return
+            await self._loop.run_in_executor(executor, self._call, job)
+
+            if job["interval"] is None:
+                return
+            job["due_at"] = max(job["due_at"] + job["interval"], _now())
+
+    def _call(self, job):
+        """Run the function of a job and record its timing"""
+        start = _now()
+        try:
+            job["function"]()
+        except Exception as error:  # pylint: disable=broad-except
+            self._logger.error("Job %s failed: %s", job["name"], error)
+        self._record(job, start, _now())
+
+    def _record(self, job, start, end):
+        """
+        Record the duration of a run and its lateness, i.e. the jitter of the start. A
+        periodic run that ends after its next deadline is an overrun.
+        :param job: job that ran
+        :type job: dict
+        :param start: start of the run in ms
+        :type start: float
+        :param end: end of the run in ms
+        :type end: float
+        """
+        duration = end - start
+        lateness = max(start - job["due_at"], 0)
+        overrun = job["interval"] is not None and end - job["due_at"] > job["interval"]
+
+        timing = self._timing(job["name"])
+        timing["duration"].observe(duration / 1000)
+        timing["lateness"].observe(lateness / 1000)
+        if overrun:
+            timing["overruns"].inc()
+        with self._timings_lock:
+            window = timing["window"]
+            window["runs"] += 1
+            window["duration"] += duration
+            window["max_duration"] = max(window["max_duration"], duration)
+            window["lateness"] += lateness
+            window["lateness_squares"] += lateness ** 2
+            window["max_lateness"] = max(window["max_lateness"], lateness)
+            window["overruns"] += 1 if overrun else 0
+
+    def _timing(self, name):
+        """
+        :param name: name of the component
+        :type name: str
+        :return: the metrics and the statistics of the component, created on first use
+        :rtype: dict
+        """
+        with self._timings_lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = {
+                    "duration": self._metrics.histogram(
+                        "job_duration_seconds",
+                        "Duration of the jobs of each component",
+                        component=name,
+                    ),
+                    "lateness": self._metrics.histogram(
+                        "job_lateness_seconds",
+                        "Delay between the deadline of a job and its start",
+                        component=name,
+                    ),
+                    "overruns": self._metrics.counter(
+                        "job_overruns_total",
+                        "Periodic runs that ended after their next deadline",
+                        component=name,
+                    ),
+                    "window": _empty_window(),
+                }
+                self._timings[name] = timing
+            return timing
+
+    @property
+    def statistics(self):
+        """
+        Timing of each component since the last summary: number of runs, duration and
+        lateness (mean, max, and standard deviation for the jitter) in ms, number of
+        overruns, and share of the time spent running its jobs.
+        :rtype: dict
+        """
+        with self._timings_lock:
+            return self._statistics(reset=False)
+
+    def _statistics(self, reset):
+        """
+        Timing of each component since the last summary, the timings lock must be held
+        :param reset: start a new window
+        :type reset: bool
+        :rtype: dict
+        """
+        elapsed = max(_now() - self._window_started_at, 1)
+        statistics = {}
+        for name, timing in self._timings.items():
+            window = timing["window"]
+            if reset:
+                timing["window"] = _empty_window()
+            runs = max(window["runs"], 1)
+            mean_lateness = window["lateness"] / runs
+            statistics[name] = {
+                "runs": window["runs"],
+                "mean_duration": window["duration"] / runs,
+                "max_duration": window["max_duration"],
+                "mean_lateness": mean_lateness,
+                "max_lateness": window["max_lateness"],
+                "jitter": math.sqrt(
+                    max(window["lateness_squares"] / runs - mean_lateness ** 2, 0)
+                ),
+                "overruns": window["overruns"],
+                "load": window["duration"] / elapsed,
+            }
+        if reset:
+            self._window_started_at = _now()
+        return statistics
+
+    def _log_summary(self):
+        """Log the timing of the components, the busiest first, and start a new window"""
+        with self._timings_lock:
+            elapsed = _now() - self._window_started_at
+            statistics = self._statistics(reset=True)
+
+        self._logger.info("Loop timing over the last %.0f s:", elapsed / 1000)
+        for name, entry in sorted(
+            statistics.items(), key=lambda item: item[1]["load"], reverse=True
+        ):
+            self._logger.log(
+                logging.WARNING if entry["overruns"] > 0 else logging.INFO,
+                "%s: %d runs, %.2f %% busy, duration %.2f ms mean / %.2f ms max, "
+                "lateness %.2f ms mean / %.2f ms max, jitter %.2f ms, %d overruns",
+                name,
+                entry["runs"],
+                entry["load"] * 100,
+                entry["mean_duration"],
+                entry["max_duration"],
+                entry["mean_lateness"],
+                entry["max_lateness"],
+                entry["jitter"],
+                entry["overruns"],
+            )
+
+
+def _empty_window():
+    """
+    :return: the statistics of a component for a new summary window
+    :rtype: dict
+    """
+    return {
+        "runs": 0,
+        "duration": 0.0,
+        "max_duration": 0.0,
+        "lateness": 0.0,
+        "lateness_squares": 0.0,
+        "max_lateness": 0.0,
+        "overruns": 0,
+    }
@@ -0,0 +1,167 @@
+"""Service that records the sensors data"""
+import threading
+
+from src.services.database_service import DatabaseService
+from src.utils.configuration import config
+from src.utils.logger import get_logger
+from src.utils.swinging_door import SwingingDoor
+from src.utils import time_in_millisecond, utc_timestamp
+from src.utils.sql_queries import (
+    INSERT_MOISTURE_LEVEL_FOR_PLANT,
+    INSERT_TANK_LEVEL,
+    INSERT_AMBIANT_LIGHT,
+)
+
+_SERVICE_TAG = "services.SensorRecorderService"
+_CONFIG_TAG = "sensor_compression"
+_ENABLED_TAG = "enabled"
+_MAX_INTERVAL_TAG = "max_interval"
+_DEADBAND_TAG = "deadband"
+_DEVIATION_TAG = "deviation"
+
+# Configuration and type of each sensor in the sensors_data table
+_SENSORS = {
+    "moisture": "M",
+    "tank_level": "T",
+    "ambient_light": "L",
+}
+
+
+class SensorRecorderService:
+    """
+    Service that writes the sensors data through a deadband and swinging door
+    compression. Only the points needed to rebuild each series, by linear interpolation,
+    within the configured error are inserted.
+    """
+
+    __instance = None
+
+    _logger = get_logger(_SERVICE_TAG)
+
+    @staticmethod
+    def instance():
+        """
+        Get the service
+        :rtype: SensorRecorderService
+        """
+        if SensorRecorderService.__instance is None:
+            SensorRecorderService.__instance = SensorRecorderService()
+        return SensorRecorderService.__instance
+
+    def __init__(self):
+        """Initialize the service"""
+        compression_config = config[_CONFIG_TAG]
+        self._enabled = compression_config[_ENABLED_TAG]
+        self._max_interval = compression_config[_MAX_INTERVAL_TAG] * 1000
+        self._settings = {
+            sensor_type: (
+                compression_config[name][_DEVIATION_TAG],
+                compression_config[name][_DEADBAND_TAG],
+            )
+            for name, sensor_type in _SENSORS.items()
+        }
+
+        self._db_service = DatabaseService.instance()
+        # (type, position) -> (series, plant uuid)
+        self._series = {}
+        # type -> [samples, rows] of the series of the plants removed
+        self._retired = {sensor_type: [0, 0] for sensor_type in _SENSORS.values()}
+        self._lock = threading.Lock()
+        self._logger.info("initialized (compression: %s)", self._enabled)
+
+    def record_moisture(self, position, plant_uuid, value):
+        """
+        Record the moisture of a plant
+        :param position: position of the plant
+        :type position: int
+        :param plant_uuid: uuid of the plant
+        :type plant_uuid: str
+        :param value: moisture in percent
+        :type value: float
+        """
+        self._record(_SENSORS["moisture"], position, plant_uuid, value)
+
+    def record_tank_level(self, value):
+        """
+        Record the water level of the tank
+        :param value: level in percent
+        :type value: float
+        """
+        self._record(_SENSORS["tank_level"], None, None, value)
+
+    def record_ambient_light(self, value):
+        """
+        Record the ambient luminosity
+        :param value: luminosity in percent
+        :type value: float
+        """
+        self._record(_SENSORS["ambient_light"], None, None, value)
+
+    def flush(self):
+        """Write the last samples of every series, e.g. before stopping"""
+        with self._lock:
+            for (sensor_type, _), (series, plant_uuid) in self._series.items():
+                self._write(sensor_type, plant_uuid, series.flush())
+
+    @property
+    def statistics(self):
+        """
+        Number of samples received and rows written for each sensor type, with the
+        compression ratio and the maximum error of the series rebuilt
+        :rtype: dict
+        """
+        with self._lock:
+            statistics = {
+                sensor_type: {
+                    "samples": samples,
+                    "rows": rows,
+                    "max_error": self._settings[sensor_type][0]
+                    + 2 * self._settings[sensor_type][1],
+                }
+                for sensor_type, (samples, rows) in self._retired.items()
+            }
+            for (sensor_type, _), (series, _) in self._series.items():
+                statistics[sensor_type]["samples"] += series.received
+                statistics[sensor_type]["rows"] += series.archived
+        for entry in statistics.values():
+            entry["ratio"] = entry["samples"] / entry["rows"] if entry["rows"] else 0.0
+        return statistics
+
+    def _record(self, sensor_type, position, plant_uuid, value):
+        """Add a sample to its series and write the points archived"""
+        if not self._enabled:
+            self._write(sensor_type, plant_uuid, [(None, value, utc_timestamp())])
+            return
+
+        with self._lock:
+            key = (sensor_type, position)
+            series, series_uuid = self._series.get(key, (None, None))
+            if series is not None and series_uuid != plant_uuid:
+                # Another plant at this position, its series is a new one
+                self._write(sensor_type, series_uuid, series.flush())
+                self._retired[sensor_type][0] += series.received
+                self._retired[sensor_type][1] += series.archived
+                series = None
+            if series is None:
+                deviation, deadband = self._settings[sensor_type]
+                series = SwingingDoor(deviation, deadband, self._max_interval)
+                self._series[key] = (series, plant_uuid)
+
+            points = series.add(time_in_millisecond(), value, utc_timestamp())
+            self._write(sensor_type, plant_uuid, points)
+
+    def _write(self, sensor_type, plant_uuid, points):
+        """
+        Queue the insert of archived points, the payload of a point is its timestamp
+        :param points: points as (time, value, timestamp)
+        :type points: list of tuple
+        """
+        for _, value, timestamp in points:
+            if sensor_type == _SENSORS["moisture"]:
+                self._db_service.enqueue(
+                    INSERT_MOISTURE_LEVEL_FOR_PLANT, [value, plant_uuid, timestamp]
+                )
+            elif sensor_type == _SENSORS["tank_level"]:
+                self._db_service.enqueue(INSERT_TANK_LEVEL, [value, timestamp])
+            else:
+                self._db_service.enqueue(INSERT_AMBIANT_LIGHT, [value, timestamp])
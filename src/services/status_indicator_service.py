@@ -1,9 +1,13 @@
 """Service to interact with the status indicator"""
-from neopixel import NeoPixel
+import threading
+import time
+
+from src.hal import hardware
+from src.services.metrics_service import MetricsService
+from src.services.scheduler_service import SchedulerService
 from src.utils.configuration import config
 from src.utils.logger import get_logger
 from src.utils import (
-    pin_number_to_digital_gpio,
     time_in_millisecond,
     led_utils,
 )
@@ -60,10 +64,8 @@ class StatusIndicatorService:
     def __init__(self):
         """Initialize the service"""
         ring_config = config[_CONFIG_TAG]
-        self._ring = NeoPixel(
-            pin_number_to_digital_gpio(ring_config[_LED_PIN_CONFIG_KEY]),
-            ring_config[_LED_COUNT_CONFIG_KEY],
-            auto_write=False,
+        self._ring = hardware().neopixel(
+            ring_config[_LED_PIN_CONFIG_KEY], ring_config[_LED_COUNT_CONFIG_KEY]
         )
         self._led_count = ring_config[_LED_COUNT_CONFIG_KEY]
         self._maximum_time_in_display = (
@@ -76,6 +78,15 @@ class StatusIndicatorService:
 
         self._interval_update = ring_config[_INTERVAL_UPDATE]
         self._last_update = 0
+        # The patterns can be added and removed by other components than the one
+        # updating the ring
+        self._lock = threading.RLock()
+        self._show_duration = MetricsService.instance().histogram(
+            "neopixel_show_seconds", "Duration of the NeoPixel writes", strip="status"
+        )
+        SchedulerService.instance().every(
+            self._interval_update, self.update, "status_indicator"
+        )
         self._logger.info("initialized")
 
     def add_status(self, status):
@@ -87,11 +98,12 @@ class StatusIndicatorService:
         """
         if not isinstance(status, StatusPattern):
             raise TypeError("status type must be an StatusPattern")
-        if status not in self._animations_in_progress:
-            self._logger.debug("adding pattern: %s", status)
-            self._animations_in_progress.append(status)
-            if len(self._animations_in_progress) == 1:
-                self._current_animation_index = 0
+        with self._lock:
+            if status not in self._animations_in_progress:
+                self._logger.debug("adding pattern: %s", status)
+                self._animations_in_progress.append(status)
+                if len(self._animations_in_progress) == 1:
+                    self._current_animation_index = 0
 
     def remove_status(self, status):
         """
@@ -102,23 +114,29 @@ class StatusIndicatorService:
         """
         if not isinstance(status, StatusPattern):
             raise TypeError("status type must be an StatusPattern")
-        try:
-            index_removed = self._animations_in_progress.index(status)
-        except ValueError:
-            return
-        self._logger.debug("removing pattern: %s", status)
-        self._animations_in_progress.pop(index_removed)
-
-        # If the animation playing is the one that removed or is after the one removed,
-        # remove 1 to the current index
-        if self._current_animation_index >= index_removed:
-            self._current_animation_index -= 1
+        with self._lock:
+            try:
+                index_removed = self._animations_in_progress.index(status)
+            except ValueError:
+                return
+            self._logger.debug("removing pattern: %s", status)
+            self._animations_in_progress.pop(index_removed)
+
+            # If the animation playing is the one that removed or is after the one
+            # removed, remove 1 to the current index
+            if self._current_animation_index >= index_removed:
+                self._current_animation_index -= 1
 
     def update(self):
         """
         Update the status indicator
         :return:
         """
+        with self._lock:
+            self._update()
+
+    def _update(self):
+        """Update the status indicator, the lock must be held"""
         # No need to do anything
         if (
             self._current_animation_index is None
@@ -150,7 +168,7 @@ class StatusIndicatorService:
             self._current_offset = 0
             new_animation = True
 
-        if (time_in_millisecond() - self._last_update) > self._interval_modifier(
+        if (time_in_millisecond() - self._last_update) >= self._interval_modifier(
             new_animation
         ):
             self._update_animation()
@@ -174,7 +192,7 @@ class StatusIndicatorService:
             self._theatre_chase_animation(animation)
 
         # Update the pixels
-        self._ring.show()
+        self._show()
 
     def turn_off(self):
         """
@@ -182,8 +200,15 @@ class StatusIndicatorService:
         :return: void
         """
         self._logger.debug("turning off ring")
-        self._ring.brightness = 0.0
+        with self._lock:
+            self._ring.brightness = 0.0
+            self._show()
+
+    def _show(self):
+        """Write the pixels to the ring, the duration of the write is measured"""
+        start = time.perf_counter()
         self._ring.show()
+        self._show_duration.observe(time.perf_counter() - start)
 
     def _solid_animation(self, animation):
         """
@@ -1,5 +1,10 @@
 """Service to interact with the valves"""
-from RPi import GPIO
+import threading
+
+from src.hal import hardware
+from src.services.actuation_service import ActuationService
+from src.services.metrics_service import MetricsService
+from src.services.scheduler_service import SchedulerService
 from src.utils import time_in_millisecond, get_logger
 from src.utils.configuration import config
 
@@ -19,7 +24,8 @@ _VALVE_CLOSING_TIME = "closing_time"
 
 class ValveService:
     """
-    Service to interact with the valves
+    Service to interact with the valves. When the actuation process is enabled, the
+    orders are sent to the process, which drives the valves with its own ValveService.
     """
     __instance = None
     _logger = get_logger(_SERVICE_TAG)
@@ -53,14 +59,20 @@ class ValveService:
             "close": valve_config[_VALVE_CLOSING_TIME],
         }
 
-        # GPIO Assignation and configuration
-        GPIO.setup(self._valve_s0, GPIO.OUT)
-        GPIO.setup(self._valve_s1, GPIO.OUT)
-        GPIO.setup(self._valve_s2, GPIO.OUT)
-        GPIO.setup(self._valve_s3, GPIO.OUT)
+        self._actuation = ActuationService.instance()
+        if self._actuation.enabled:
+            self._logger.debug("Valves driven by the actuation process")
+            return
 
-        GPIO.setup(self._valve_pin, GPIO.OUT)
-        self._valve = GPIO.PWM(self._valve_pin, self._pwm_freq)
+        # GPIO Assignation and configuration
+        self._gpio = hardware().gpio
+        self._gpio.setup(self._valve_s0)
+        self._gpio.setup(self._valve_s1)
+        self._gpio.setup(self._valve_s2)
+        self._gpio.setup(self._valve_s3)
+
+        self._gpio.setup(self._valve_pin)
+        self._valve = self._gpio.pwm(self._valve_pin, self._pwm_freq)
         self._valve.start(0)
 
         # Valve position mechanism
@@ -71,16 +83,28 @@ class ValveService:
         self._is_moving = False
         self._previous_time = time_in_millisecond()
 
-        # Initiate valves
+        # The valves are only updated while they have requests, when the current
+        # movement is due to be finished
+        self._scheduler = SchedulerService.instance()
+        self._update_job = None
+        self._update_job_lock = threading.Lock()
+
+        # Called with the valve, its new position, the time the PWM was held and the
+        # time beyond the opening or closing time, in ms
+        self._listeners = []
+        self._timing_error = MetricsService.instance().histogram(
+            "valve_timing_error_seconds",
+            "Time the valve PWM is held beyond its opening or closing time",
+        )
+
+        # Initiate valves, the closing requests are the first ones of the line and are
+        # run by the scheduler, like the others
         self._logger.debug(
             "Valve Initialisation - Closing all the vales"
         )
-        self.close_all()
         for i in range(16):
             self._valve_state.append("open")
-        while self._valve_state[15] != "close":
-            self.update()
-        self._logger.debug("Valve Initialisation - Done !")
+        self.close_all()
 
     def _select_addr(self, valve_nb):
         """
@@ -95,25 +119,10 @@ class ValveService:
         for i in range(4 - len(bin_valve_nb)):
             bin_valve_nb = zero + bin_valve_nb
 
-        if bin_valve_nb[0] == "1":
-            GPIO.output(self._valve_s3, GPIO.HIGH)
-        else:
-            GPIO.output(self._valve_s3, GPIO.LOW)
-
-        if bin_valve_nb[1] == "1":
-            GPIO.output(self._valve_s2, GPIO.HIGH)
-        else:
-            GPIO.output(self._valve_s2, GPIO.LOW)
-
-        if bin_valve_nb[2] == "1":
-            GPIO.output(self._valve_s1, GPIO.HIGH)
-        else:
-            GPIO.output(self._valve_s1, GPIO.LOW)
-
-        if bin_valve_nb[3] == "1":
-            GPIO.output(self._valve_s0, GPIO.HIGH)
-        else:
-            GPIO.output(self._valve_s0, GPIO.LOW)
+        self._gpio.output(self._valve_s3, bin_valve_nb[0] == "1")
+        self._gpio.output(self._valve_s2, bin_valve_nb[1] == "1")
+        self._gpio.output(self._valve_s1, bin_valve_nb[2] == "1")
+        self._gpio.output(self._valve_s0, bin_valve_nb[3] == "1")
 
     def close(self, tile_nb):
         """
@@ -121,7 +130,11 @@ class ValveService:
         :param tile_nb : tile number [0-15]
         :type tile_nb: int
         """
+        if self._actuation.enabled:
+            self._actuation.close_valve(tile_nb)
+            return
         self._asked_valve_state.append((tile_nb, "close"))  # Add close request at tail
+        self._schedule_update(0)
 
     def close_all(self):
         """
@@ -136,7 +149,47 @@ class ValveService:
         :param tile_nb : tile number [0-15]
         :type tile_nb: int
         """
+        if self._actuation.enabled:
+            self._actuation.open_valve(tile_nb)
+            return
         self._asked_valve_state.append((tile_nb, "open"))  # Add open request at tail
+        self._schedule_update(0)
+
+    def add_listener(self, listener):
+        """
+        Be notified at the end of each movement of a valve
+        :param listener: called with the valve, its position, the time the PWM was
+        held and the time beyond the opening or closing time, in ms
+        :type listener: Callable[[int, str, float, float], None]
+        """
+        self._listeners.append(listener)
+
+    def _schedule_update(self, delay):
+        """
+        Run update after a delay, unless it is already planned
+        :param delay: delay in ms
+        :type delay: float
+        """
+        with self._update_job_lock:
+            if self._update_job is None:
+                self._update_job = self._scheduler.once(
+                    max(delay, 0), self._scheduled_update, "valve"
+                )
+
+    def _scheduled_update(self):
+        """Update the valves, then plan the next update while requests are waiting"""
+        with self._update_job_lock:
+            self._update_job = None
+        self.update()
+        if len(self._asked_valve_state) == 0:
+            return
+        if self._is_moving:
+            asked_state = self._asked_valve_state[0][1]
+            self._schedule_update(
+                self._previous_time + self._timing[asked_state] - time_in_millisecond()
+            )
+        else:
+            self._schedule_update(0)
 
     def update(self):
         """
@@ -168,17 +221,23 @@ class ValveService:
         # So if the movement is incomplete
         if actual_time - self._previous_time < self._timing[asked_state]:
             self._select_addr(asked_addr)  # valve selection
-            self._valve.ChangeDutyCycle(
+            self._valve.change_duty_cycle(
                 self._position[asked_state]
             )  # update valve movement
 
         # if the movement is finished
         else:
             self._select_addr(asked_addr)  # valve selection
-            self._valve.ChangeDutyCycle(0)  # stop PWM
+            self._valve.change_duty_cycle(0)  # stop PWM
             self._valve_state[asked_addr] = asked_state  # Update valve movement
             self._asked_valve_state.pop(0)  # Remove the asked position
             self._is_moving = False
+            held = actual_time - self._previous_time
+            error = held - self._timing[asked_state]
+            self._timing_error.observe(error / 1000)
             self._logger.debug(
-                f"Valve {asked_addr} moved to position {asked_state}"
+                f"Valve {asked_addr} moved to position {asked_state} "
+                f"in {held} ms ({error} ms late)"
             )
+            for listener in self._listeners:
+                listener(asked_addr, asked_state, held, error)
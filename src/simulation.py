@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Simulation of the greenhouse: the regulation runs on the simulated hardware with a
+virtual clock, days of operation in seconds. Usage:
+python3 -m src.simulation --days 30
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from src.utils import (
+    config,
+    clock,
+    get_logger,
+    generate_uuid_string,
+    set_clock,
+    VirtualClock,
+)
+
+_SIMULATION_TAG = "simulation"
+_CONFIG_TAG = "simulation"
+_DAYS_TAG = "days"
+_SENSORS_INTERVAL_TAG = "sensors_interval"
+_HYGROMETRY_INTERVAL_TAG = "hygrometry_interval"
+_LUMINOSITY_INTERVAL_TAG = "luminosity_interval"
+_PLANTS_TAG = "plants"
+_MOISTURE_GOAL_TAG = "moisture_goal"
+_LIGHT_EXPOSURE_TAG = "light_exposure_min_duration"
+_REFILL_INTERVAL_TAG = "refill_interval"
+_LOG_LEVEL_TAG = "log_level"
+
+_DAY_TO_MILLISECONDS = 24 * 3600 * 1000
+
+_logger = get_logger(_SIMULATION_TAG)
+
+
+def run(days, start=None, database=None):
+    """
+    Run the sensors, the hygrometry and luminosity regulations, the rollup and the
+    storage budget on the simulated greenhouse. The network, the BLE and the status
+    indicator are left out.
+    :param days: number of days simulated
+    :type days: float
+    :param start: UTC date and time of the start, now by default
+    :type start: datetime
+    :param database: file of the database, a new temporary one by default
+    :type database: str
+    :return: the report of the simulation
+    :rtype: dict
+    """
+    simulation_config = config[_CONFIG_TAG]
+    # Everything below reads the configuration and the clock when it is created
+    set_clock(VirtualClock(start))
+    config["hal"]["backend"] = "simulated"
+    # The actuation process would run in real time
+    config["actuation"]["process"] = False
+    config["main_loop"]["runtime"] = "scheduler"
+    config["main_loop"]["summary_interval"] = 0
+    config["main_loop"]["sensors_interval"] = simulation_config[_SENSORS_INTERVAL_TAG]
+    config["hygrometry"]["interval_update"] = simulation_config[_HYGROMETRY_INTERVAL_TAG]
+    config["luminosity"]["interval_update"] = simulation_config[_LUMINOSITY_INTERVAL_TAG]
+    os.environ["DB_FILE"] = (
+        database
+        if database is not None
+        else os.path.join(tempfile.mkdtemp(), "simulation.db")
+    )
+
+    # pylint: disable=import-outside-toplevel
+    from src.hal import hardware
+    from src.models import Plant
+    from src.services import (
+        ADCService,
+        DatabaseService,
+        PlantRegistryService,
+        SchedulerService,
+        SensorRecorderService,
+    )
+    from src.controllers import (
+        DataRollupController,
+        HygrometryRegulationController,
+        LuminosityRegulationController,
+        StorageBudgetController,
+    )
+
+    # The loggers are created with the modules, the debug logs would take most of the
+    # time of the simulation
+    for logger in logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger):
+            logger.setLevel(simulation_config[_LOG_LEVEL_TAG])
+
+    scheduler = SchedulerService.instance()
+    DatabaseService.instance().run_init_scripts()
+    plant_registry = PlantRegistryService.instance()
+    for position in range(simulation_config[_PLANTS_TAG]):
+        plant_registry.add_plant(position)
+        plant_registry.update_plant(
+            Plant(
+                generate_uuid_string(),
+                position,
+                simulation_config[_MOISTURE_GOAL_TAG],
+                simulation_config[_LIGHT_EXPOSURE_TAG],
+            )
+        )
+
+    greenhouse = hardware().greenhouse
+    tank_volume = config["hal"]["simulated"]["tank_volume"]
+    adc = ADCService.instance()
+    sensor_recorder = SensorRecorderService.instance()
+    HygrometryRegulationController()
+    LuminosityRegulationController()
+    data_rollup_controller = DataRollupController(config)
+    storage_budget_controller = StorageBudgetController(config)
+
+    # Position of the plants -> lowest and highest moisture
+    moisture_range = {plant.position: [100.0, 0.0] for plant in plant_registry.plants}
+    refilled = [0.0]
+
+    def read_sensors():
+        sensor_recorder.record_ambient_light(adc.get_ambient_luminosity_value())
+        sensor_recorder.record_tank_level(adc.get_water_level_value())
+        moisture = greenhouse.state["moisture"]
+        for position, extremes in moisture_range.items():
+            extremes[0] = min(extremes[0], moisture[position])
+            extremes[1] = max(extremes[1], moisture[position])
+
+    def refill_tank():
+        refilled[0] += tank_volume - greenhouse.state["tank_volume"]
+        greenhouse.refill(tank_volume)
+
+    scheduler.every(simulation_config[_SENSORS_INTERVAL_TAG], read_sensors, "sensors")
+    refill_interval = simulation_config[_REFILL_INTERVAL_TAG] * _DAY_TO_MILLISECONDS
+    scheduler.every(refill_interval, refill_tank, "tank", delay=refill_interval)
+    scheduler.once(days * _DAY_TO_MILLISECONDS, scheduler.stop, _SIMULATION_TAG)
+
+    _logger.info("Simulating %s days from %s UTC", days, clock().utcnow())
+    started_at = time.perf_counter()
+    cpu_started_at = time.process_time()
+    scheduler.run()
+    wall_time = time.perf_counter() - started_at
+    cpu_time = time.process_time() - cpu_started_at
+
+    sensor_recorder.flush()
+    data_rollup_controller.stop()
+    storage_budget_controller.stop()
+    DatabaseService.instance().flush()
+    state = greenhouse.state
+    report = {
+        "days": days,
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "speed": days * _DAY_TO_MILLISECONDS / 1000 / max(wall_time, 1e-9),
+        "water_used": tank_volume + refilled[0] - state["tank_volume"],
+        "tank_volume": state["tank_volume"],
+        "moisture": {
+            position: {
+                "goal": simulation_config[_MOISTURE_GOAL_TAG],
+                "min": extremes[0],
+                "max": extremes[1],
+                "final": state["moisture"][position],
+            }
+            for position, extremes in moisture_range.items()
+        },
+        "storage": storage_budget_controller.usage(),
+        "components": scheduler.statistics,
+    }
+    DatabaseService.instance().close()
+    _log_report(report)
+    return report
+
+
+def _log_report(report):
+    """
+    :param report: report of the simulation
+    :type report: dict
+    """
+    _logger.info(
+        "%s days simulated in %.1f s (%.1f s of CPU), %.0f times faster than real time",
+        report["days"],
+        report["wall_time"],
+        report["cpu_time"],
+        report["speed"],
+    )
+    _logger.info(
+        "Water used: %.0f mL, left in the tank: %.0f mL",
+        report["water_used"],
+        report["tank_volume"],
+    )
+    for position, moisture in report["moisture"].items():
+        _logger.info(
+            "Plant %d: moisture goal %.1f %%, %.1f %% min / %.1f %% max / %.1f %% final",
+            position,
+            moisture["goal"],
+            moisture["min"],
+            moisture["max"],
+            moisture["final"],
+        )
+    _logger.info("Storage: %s", report["storage"])
+    for name, entry in sorted(report["components"].items()):
+        _logger.info(
+            "%s: %d runs, duration %.2f ms mean / %.2f ms max, %d overruns",
+            name,
+            entry["runs"],
+            entry["mean_duration"],
+            entry["max_duration"],
+            entry["overruns"],
+        )
+
+
+def main():
+    """Parse the arguments and run the simulation"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--days", type=float, default=config[_CONFIG_TAG][_DAYS_TAG], help="days simulated"
+    )
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        default=None,
+        help="UTC date and time of the start, e.g. 2022-06-01T00:00, now by default",
+    )
+    parser.add_argument(
+        "--database", default=None, help="database file, a temporary one by default"
+    )
+    arguments = parser.parse_args()
+    run(arguments.days, arguments.start, arguments.database)
+
+
+if __name__ == "__main__":
+    main()
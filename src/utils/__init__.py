@@ -1,5 +1,6 @@
 """Utils module"""
 from .configuration import config, config_ble
+from .clock import clock, set_clock, SystemClock, VirtualClock
 from .utils import *
 from .logger import get_logger
 from .led_utils import *
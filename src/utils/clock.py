@@ -0,0 +1,144 @@
+"""Clock of the device, the system clock or a virtual one for the simulations"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class SystemClock:
+    """Time of the system, the sleeps and waits block the thread"""
+
+    @staticmethod
+    def time():
+        """
+        :return: epoch in milliseconds
+        :rtype: float
+        """
+        return time.time() * 1000
+
+    @staticmethod
+    def monotonic():
+        """
+        :return: monotonic time in milliseconds, doesn't move with the system clock
+        :rtype: float
+        """
+        return time.monotonic() * 1000
+
+    @staticmethod
+    def utcnow():
+        """
+        :return: current UTC date and time
+        :rtype: datetime
+        """
+        return datetime.utcnow()
+
+    @staticmethod
+    def sleep(duration):
+        """
+        :param duration: duration in s
+        :type duration: float
+        """
+        time.sleep(duration)
+
+    @staticmethod
+    def wait(condition, timeout=None):
+        """
+        Wait for a notification of a condition, its lock must be held
+        :type condition: threading.Condition
+        :param timeout: maximum wait in s, None to wait for the notification
+        :type timeout: float
+        :return: False if the timeout expired
+        :rtype: bool
+        """
+        return condition.wait(timeout)
+
+
+class VirtualClock:
+    """
+    Clock that only moves when it is advanced. A sleep, or a wait with a timeout,
+    returns at once with the clock moved forward by the duration, so the main loop
+    jumps from one deadline to the next and simulates days in seconds. The threads not
+    driven by the scheduler keep waiting in real time.
+    """
+
+    def __init__(self, start=None):
+        """
+        :param start: UTC date and time of the start, now by default
+        :type start: datetime
+        """
+        start = start if start is not None else datetime.utcnow()
+        self._now = (start - _EPOCH) / timedelta(milliseconds=1)
+        self._lock = threading.Lock()
+
+    def time(self):
+        """
+        :return: epoch in milliseconds
+        :rtype: float
+        """
+        return self._now
+
+    def monotonic(self):
+        """
+        :return: monotonic time in milliseconds, the epoch of the virtual time
+        :rtype: float
+        """
+        return self._now
+
+    def utcnow(self):
+        """
+        :return: current UTC date and time
+        :rtype: datetime
+        """
+        return _EPOCH + timedelta(milliseconds=self._now)
+
+    def sleep(self, duration):
+        """
+        :param duration: duration in s
+        :type duration: float
+        """
+        self.advance(duration * 1000)
+
+    def wait(self, condition, timeout=None):
+        """
+        Move the clock to the end of the timeout, without waiting. Without timeout, wait
+        for the notification of the condition, its lock must be held.
+        :type condition: threading.Condition
+        :param timeout: duration in s, None to wait for the notification
+        :type timeout: float
+        :return: False if the timeout expired
+        :rtype: bool
+        """
+        if timeout is None:
+            return condition.wait()
+        self.advance(timeout * 1000)
+        return False
+
+    def advance(self, duration):
+        """
+        :param duration: duration in ms, ignored if negative
+        :type duration: float
+        """
+        with self._lock:
+            self._now += max(duration, 0)
+
+
+_clock = SystemClock()
+
+
+def clock():
+    """
+    Get the clock used by the services and the controllers
+    :rtype: SystemClock or VirtualClock
+    """
+    return _clock
+
+
+def set_clock(new_clock):
+    """
+    Replace the clock, before the services and the controllers are created
+    :param new_clock: clock to use
+    :type new_clock: SystemClock or VirtualClock
+    """
+    global _clock  # pylint: disable=global-statement
+    _clock = new_clock
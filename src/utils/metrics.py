@@ -0,0 +1,131 @@
+"""Metrics helpers"""
+import threading
+
+# Upper bounds, in milliseconds, of the buckets used for the latencies
+LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Same buckets in seconds, the unit of the durations exported to Prometheus
+DURATION_BUCKETS = tuple(bound / 1000 for bound in LATENCY_BUCKETS)
+
+# Upper bounds, in bytes, of the buckets used for the sizes
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Counter:
+    """
+    Value that only goes up, e.g. a number of requests or of bytes sent.
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """
+        Increase the counter
+        :param amount: amount added, positive
+        :type amount: float
+        """
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        """
+        :rtype: float
+        """
+        return self._value
+
+
+class Gauge:
+    """
+    Value that goes up and down, e.g. the depth of a queue. The value can be read from
+    a function when it is collected instead of being set.
+    """
+
+    def __init__(self, function=None):
+        """
+        :param function: function returning the current value, None to set it
+        :type function: Callable[[], float]
+        """
+        self._function = function
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        """
+        :param value: new value
+        :type value: float
+        """
+        self._value = value
+
+    def inc(self, amount=1):
+        """
+        :param amount: amount added, negative to decrease the gauge
+        :type amount: float
+        """
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        """
+        :rtype: float
+        """
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class Histogram:
+    """
+    Distribution of observed values, counted in cumulative buckets.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        :param buckets: upper bound of each bucket, an overflow bucket is added
+        :type buckets: Iterable of float
+        """
+        self._bounds = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Record a value
+        :param value: value observed
+        :type value: float
+        """
+        index = len(self._bounds)
+        for i, bound in enumerate(self._bounds):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def snapshot(self):
+        """
+        Current state of the histogram, the buckets are cumulative like in Prometheus
+        :rtype: dict
+        """
+        with self._lock:
+            buckets = {}
+            cumulative = 0
+            for bound, count in zip(self._bounds + ("+Inf",), self._counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "mean": self._sum / self._count if self._count > 0 else 0.0,
+                "max": self._max,
+                "buckets": buckets,
+            }
@@ -0,0 +1,115 @@
+"""Ring of fixed-size records in shared memory, between two processes"""
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+# capacity, head (next record read), tail (next record written)
+_HEADER = struct.Struct("<QQQ")
+_HEAD_OFFSET = 8
+_TAIL_OFFSET = 16
+_COUNTER = struct.Struct("<Q")
+
+
+class SharedRing:
+    """
+    Ring buffer in shared memory with one producer and one consumer, without lock. The
+    producer only moves the tail and the consumer only moves the head. Each slot starts
+    with the sequence number of its record, written after the record, and the consumer
+    only takes a slot holding the sequence it expects, so a record being written is
+    never read. A process is either the producer or the consumer of a ring, several
+    threads using the same side must share a lock.
+    """
+
+    def __init__(self, record_format, capacity=None, name=None):
+        """
+        :param record_format: struct format of a record, e.g. "<Bd"
+        :type record_format: str
+        :param capacity: number of records, to create the ring
+        :type capacity: int
+        :param name: name of the shared memory, to attach to a ring created by another
+        process
+        :type name: str
+        """
+        self._record = struct.Struct(record_format)
+        # Slots aligned on 8 bytes, like the counters
+        self._slot_size = _COUNTER.size + (self._record.size + 7) // 8 * 8
+        if name is None:
+            self._memory = shared_memory.SharedMemory(
+                create=True, size=_HEADER.size + capacity * self._slot_size
+            )
+            _HEADER.pack_into(self._memory.buf, 0, capacity, 0, 0)
+            self._owner = True
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+            # The resource tracker of this process would remove the shared memory
+            # when it exits, it belongs to the process creating it
+            resource_tracker.unregister(
+                self._memory._name, "shared_memory"  # pylint: disable=protected-access
+            )
+            self._owner = False
+        self._buffer = self._memory.buf
+        self._capacity, self._head, self._tail = _HEADER.unpack_from(self._buffer, 0)
+
+    @property
+    def name(self):
+        """
+        :return: name of the shared memory, to attach to the ring
+        :rtype: str
+        """
+        return self._memory.name
+
+    def __len__(self):
+        """
+        :return: number of records waiting
+        :rtype: int
+        """
+        _, head, tail = _HEADER.unpack_from(self._buffer, 0)
+        return tail - head
+
+    def put(self, *values):
+        """
+        Write a record, producer only
+        :param values: fields of the record
+        :return: False if the ring is full, the record is dropped
+        :rtype: bool
+        """
+        tail = self._tail
+        head = _COUNTER.unpack_from(self._buffer, _HEAD_OFFSET)[0]
+        if tail - head >= self._capacity:
+            return False
+        offset = self._offset(tail)
+        self._record.pack_into(self._buffer, offset + _COUNTER.size, *values)
+        _COUNTER.pack_into(self._buffer, offset, tail + 1)
+        _COUNTER.pack_into(self._buffer, _TAIL_OFFSET, tail + 1)
+        self._tail = tail + 1
+        return True
+
+    def get(self):
+        """
+        Read the next record, consumer only
+        :return: fields of the record, None if the ring is empty
+        :rtype: tuple
+        """
+        head = self._head
+        offset = self._offset(head)
+        if _COUNTER.unpack_from(self._buffer, offset)[0] != head + 1:
+            return None
+        values = self._record.unpack_from(self._buffer, offset + _COUNTER.size)
+        _COUNTER.pack_into(self._buffer, _HEAD_OFFSET, head + 1)
+        self._head = head + 1
+        return values
+
+    def close(self):
+        """Detach from the shared memory, which is removed by the process creating it"""
+        self._buffer.release()
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+    def _offset(self, position):
+        """
+        :param position: number of the record since the creation of the ring
+        :type position: int
+        :return: offset of its slot
+        :rtype: int
+        """
+        return _HEADER.size + (position % self._capacity) * self._slot_size
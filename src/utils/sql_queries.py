@@ -4,41 +4,139 @@
 GET_UNTRANSMITTED_SENSORS_DATA = (
     "select * from sensors_data where transmitted=0 order by timestamp asc"
 )
-INSERT_TANK_LEVEL = "insert into sensors_data(type, value) values ('T', ?)"
-INSERT_MOISTURE_LEVEL_FOR_PLANT = (
-    "insert into sensors_data(type, value, plant_uuid) values ('M', ?, ?)"
+INSERT_TANK_LEVEL = (
+    "insert into sensors_data(type, value, timestamp) values ('T', ?, ?)"
 )
-INSERT_AMBIANT_LIGHT = "insert into sensors_data(type, value) values ('L', ?)"
-UPDATE_SENSORS_TRANSMITTED_FROM_DATE = (
-    "update sensors_data set transmitted=1 where timestamp > ? and timestamp < ?"
+INSERT_MOISTURE_LEVEL_FOR_PLANT = "insert into sensors_data(type, value, plant_uuid, timestamp) values ('M', ?, ?, ?)"
+INSERT_AMBIANT_LIGHT = (
+    "insert into sensors_data(type, value, timestamp) values ('L', ?, ?)"
+)
+GET_UNTRANSMITTED_SENSORS_DATA_PAGE_END = (
+    "select max(rowid) from (select rowid from sensors_data "
+    "where rowid > ? and transmitted=0 order by rowid asc limit ?)"
+)
+GET_UNTRANSMITTED_SENSORS_DATA_PAGE = (
+    "select type, timestamp, value, plant_uuid from sensors_data "
+    "where rowid > ? and rowid <= ? and transmitted=0 order by rowid asc"
+)
+# Same page with the timestamps as epoch in seconds, for the columnar encoding
+GET_UNTRANSMITTED_SENSORS_DATA_COLUMNAR_PAGE = (
+    "select type, cast(strftime('%s', timestamp) as integer) as timestamp, value, plant_uuid "
+    "from sensors_data where rowid > ? and rowid <= ? and transmitted=0 order by rowid asc"
+)
+GET_SENSORS_DATA_LAST_ROWID = "select max(rowid) from sensors_data"
+UPDATE_SENSORS_TRANSMITTED_UP_TO = (
+    "update sensors_data set transmitted=1 where rowid > ? and rowid <= ? and transmitted=0"
+)
+# The newest row is never deleted so SQLite can't reuse the rowids tracked by the watermarks
+DELETE_SENSORS_TRANSMITTED = (
+    "delete from sensors_data where transmitted=1 and rowid < (select max(rowid) from sensors_data)"
+)
+DELETE_SENSORS_EXPIRED = (
+    "delete from sensors_data where rowid in ("
+    "select rowid from sensors_data where rowid <= ? and transmitted=1 "
+    "and timestamp < datetime('now', ?) and rowid < (select max(rowid) from sensors_data) "
+    "order by rowid asc limit ?)"
+)
+
+# Sensors rollups, the rows with a rowid in the range ]?, ?] are aggregated
+_ROLLUP_SENSORS_DATA = (
+    "insert into {table}(bucket, type, plant_uuid, min_value, max_value, mean_value, sample_count) "
+    "select strftime('{bucket}', timestamp), type, coalesce(plant_uuid, ''), "
+    "min(value), max(value), avg(value), count(*) "
+    "from sensors_data where rowid > ? and rowid <= ? and compacted=0 group by 1, 2, 3 "
+    "on conflict(bucket, type, plant_uuid) do update set "
+    "min_value=min(min_value, excluded.min_value), "
+    "max_value=max(max_value, excluded.max_value), "
+    "mean_value=(mean_value * sample_count + excluded.mean_value * excluded.sample_count) "
+    "/ (sample_count + excluded.sample_count), "
+    "sample_count=sample_count + excluded.sample_count"
+)
+ROLLUP_SENSORS_DATA_BY_MINUTE = _ROLLUP_SENSORS_DATA.format(
+    table="sensors_data_minute", bucket="%Y-%m-%d %H:%M:00"
+)
+ROLLUP_SENSORS_DATA_BY_HOUR = _ROLLUP_SENSORS_DATA.format(
+    table="sensors_data_hour", bucket="%Y-%m-%d %H:00:00"
+)
+DELETE_SENSORS_MINUTE_EXPIRED = (
+    "delete from sensors_data_minute where bucket < datetime('now', ?)"
+)
+# Storage budget, the rows already aggregated are replaced by their hourly average
+GET_SENSORS_DATA_COMPACTION_END = (
+    "select max(rowid) from (select rowid from sensors_data "
+    "where rowid > ? and rowid <= ? and transmitted=0 and compacted=0 order by rowid asc limit ?)"
+)
+COMPACT_SENSORS_DATA = (
+    "insert into sensors_data(type, value, plant_uuid, timestamp, compacted) "
+    "select type, avg(value), plant_uuid, strftime('%Y-%m-%d %H:00:00', timestamp), 1 "
+    "from sensors_data where rowid > ? and rowid <= ? and transmitted=0 and compacted=0 "
+    "group by type, plant_uuid, strftime('%Y-%m-%d %H:00:00', timestamp)"
+)
+DELETE_SENSORS_DATA_COMPACTED = (
+    "delete from sensors_data where rowid > ? and rowid <= ? and transmitted=0 and compacted=0"
+)
+GET_SENSORS_HISTORY_BY_MINUTE = (
+    "select * from sensors_data_minute where type=? and plant_uuid=? "
+    "and bucket >= ? and bucket < ? order by bucket asc"
+)
+GET_SENSORS_HISTORY_BY_HOUR = (
+    "select * from sensors_data_hour where type=? and plant_uuid=? "
+    "and bucket >= ? and bucket < ? order by bucket asc"
 )
-DELETE_SENSORS_TRANSMITTED = "delete from sensors_data where transmitted=1"
 
 # Actuators orders
 GET_UNTRANSMITTED_ACTUATORS_ORDERS = (
     "select * from actuators where transmitted=0 order by timestamp asc"
 )
-INSERT_VALVE_ORDER = (
-    "insert into actuators(type, status, plant_uuid) values ('V', ?, ?)"
+INSERT_VALVE_ORDER = "insert into actuators(type, status, plant_uuid, timestamp) values ('V', ?, ?, ?)"
+INSERT_LIGHT_STRIP_ORDER = "insert into actuators(type, status, plant_uuid, timestamp) values ('L', ?, ?, ?)"
+INSERT_PUMP_ORDER = (
+    "insert into actuators(type, status, timestamp) values ('P', ?, ?)"
 )
-INSERT_LIGHT_STRIP_ORDER = (
-    "insert into actuators(type, status, plant_uuid) values ('L', ?, ?)"
+GET_UNTRANSMITTED_ACTUATORS_ORDERS_PAGE_END = (
+    "select max(rowid) from (select rowid from actuators "
+    "where rowid > ? and transmitted=0 order by rowid asc limit ?)"
 )
-INSERT_PUMP_ORDER = "insert into actuators(type, status) values ('P', ?)"
-UPDATE_ACTUATORS_TRANSMITTED_FROM_DATE = (
-    "update actuators set transmitted=1 where timestamp > ? and timestamp < ?"
+GET_UNTRANSMITTED_ACTUATORS_ORDERS_PAGE = (
+    "select type, timestamp, status, plant_uuid from actuators "
+    "where rowid > ? and rowid <= ? and transmitted=0 order by rowid asc"
+)
+GET_UNTRANSMITTED_ACTUATORS_ORDERS_COLUMNAR_PAGE = (
+    "select type, cast(strftime('%s', timestamp) as integer) as timestamp, status, plant_uuid "
+    "from actuators where rowid > ? and rowid <= ? and transmitted=0 order by rowid asc"
+)
+GET_ACTUATORS_LAST_ROWID = "select max(rowid) from actuators"
+UPDATE_ACTUATORS_TRANSMITTED_UP_TO = (
+    "update actuators set transmitted=1 where rowid > ? and rowid <= ? and transmitted=0"
+)
+DELETE_ACTUATORS_TRANSMITTED = (
+    "delete from actuators where transmitted=1 and rowid < (select max(rowid) from actuators)"
+)
+
+# Watermarks
+GET_WATERMARK = "select last_rowid from watermark where name=?"
+UPDATE_WATERMARK = (
+    "insert into watermark(name, last_rowid) values (?, ?) "
+    "on conflict(name) do update set last_rowid=excluded.last_rowid"
 )
-DELETE_ACTUATORS_TRANSMITTED = "delete from actuators where transmitted=1"
 
 # Plants
-GET_UNTRANSMITTED_PLANT = "select * from plant where transmitted=0 and removed=0 order by planted_at asc limit 1"
-GET_REMOVED_UNTRANSMITTED_PLANT = "select * from plant where transmitted=0 and removed=1 order by planted_at asc limit 1"
+GET_UNTRANSMITTED_PLANT = "select * from plant where transmitted=0 and removed=0 order by planted_at asc"
+GET_REMOVED_UNTRANSMITTED_PLANT = "select * from plant where transmitted=0 and removed=1 order by planted_at asc"
 GET_PLANTS = "select * from plant"
 GET_PLANT_BY_POSITION = "select * from plant where position=?"
 GET_PLANT_BY_UUID = "select * from plant where uuid=?"
+GET_ACTIVE_PLANTS = "select * from plant where removed=0"
+GET_ACTIVE_PLANT_BY_POSITION = (
+    "select * from plant where position=? and removed=0 order by rowid desc limit 1"
+)
 INSERT_NEW_PLANT = "insert into plant(position) values (?)"
 UPDATE_PLANT_TRANSMITTED = "update plant set transmitted=1 where uuid=?"
-UPDATE_PLANT = "update plant set uuid=?, moisture_goal=?, light_exposure_min_duration=?, removed=0, transmitted=1 where position=?"
+# Only the plant waiting for its uuid, not the removed ones at the same position
+UPDATE_PLANT = (
+    "update plant set uuid=?, moisture_goal=?, light_exposure_min_duration=?, transmitted=1 "
+    "where position=? and removed=0 and uuid is null"
+)
 UPDATE_PLANT_INFO = (
     "update plant set moisture_goal=?, light_exposure_min_duration=? where uuid=?"
 )
@@ -48,3 +146,42 @@ UPDATE_PLANT_LEVELS = (
 UPDATE_PLANT_POSITION = "update plant set position=?, removed=0 where uuid=?"
 REMOVE_PLANT = "update plant set removed=1, transmitted=0 where uuid=?"
 DELETE_PLANT = "delete from plant where uuid=?"
+DELETE_UNTRANSMITTED_PLANT_BY_POSITION = (
+    "delete from plant where position=? and uuid is null"
+)
+
+# Outbox
+# A queued entry is kept as is, a dead letter is queued again with its attempts reset
+INSERT_OUTBOX_ENTRY = (
+    "insert into outbox(operation, payload, idempotency_key) values (?, ?, ?) "
+    "on conflict(idempotency_key) do update set payload=excluded.payload, attempts=0, "
+    "next_attempt_at=0, last_error=null, dead=0 where dead=1"
+)
+GET_DUE_OUTBOX_ENTRIES = (
+    "select * from outbox where dead=0 and next_attempt_at <= ? order by id asc limit ?"
+)
+GET_PENDING_OUTBOX_COUNT = "select count(*) from outbox where dead=0"
+GET_PENDING_OUTBOX_COUNT_BY_OPERATION = (
+    "select count(*) from outbox where dead=0 and operation=?"
+)
+GET_LAST_DEAD_OUTBOX_ENTRY = (
+    "select * from outbox where dead=1 and operation=? order by id desc limit 1"
+)
+DELETE_OUTBOX_ENTRY = "delete from outbox where id=?"
+UPDATE_OUTBOX_ENTRY_RETRY = (
+    "update outbox set attempts=?, next_attempt_at=?, last_error=? where id=?"
+)
+UPDATE_OUTBOX_ENTRY_DEAD = "update outbox set attempts=?, last_error=?, dead=1 where id=?"
+
+# Storage
+GET_DATABASE_PAGE_COUNT = "pragma page_count"
+GET_DATABASE_FREELIST_COUNT = "pragma freelist_count"
+GET_DATABASE_PAGE_SIZE = "pragma page_size"
+GET_DATABASE_AUTO_VACUUM = "pragma auto_vacuum"
+GET_LOGS_ROW_COUNT = (
+    "select (select count(*) from sensors_data), (select count(*) from actuators)"
+)
+SET_DATABASE_AUTO_VACUUM_INCREMENTAL = "pragma auto_vacuum=incremental"
+VACUUM_DATABASE = "vacuum"
+# Formatted with the number of pages to release, pragmas don't take parameters
+INCREMENTAL_VACUUM = "pragma incremental_vacuum({})"
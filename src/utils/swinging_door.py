@@ -0,0 +1,147 @@
+"""Compression of a time series with a deadband and the swinging door algorithm"""
+import math
+
+
+class SwingingDoor:
+    """
+    Swinging door compression of one series. The archived points are the ends of
+    segments, the series rebuilt by linear interpolation between them stays within
+    max_error of every sample received:
+    - the samples fed to the door are within the deviation of the segments, the value
+    of an archived point is moved inside the door when needed to keep this true;
+    - a sample that differs from the last sample fed by less than the deadband is
+    dropped, the last one dropped is fed before the next sample that isn't, which
+    adds twice the deadband to the error.
+    """
+
+    def __init__(self, deviation, deadband=0.0, max_interval=None):
+        """
+        :param deviation: maximum distance between a sample and its segment
+        :type deviation: float
+        :param deadband: changes smaller than this one are ignored
+        :type deadband: float
+        :param max_interval: maximum time between two archived points, None for no limit
+        :type max_interval: float
+        """
+        self._deviation = deviation
+        self._deadband = deadband
+        self._max_interval = max_interval
+
+        # Start of the current segment (time, value)
+        self._origin = None
+        # Last sample fed to the door and last sample dropped by the deadband
+        # (time, value, payload), not archived yet
+        self._last = None
+        self._held = None
+        self._reference = None
+        # Slopes of the lines from the origin that keep all the samples fed within the
+        # deviation
+        self._min_slope = -math.inf
+        self._max_slope = math.inf
+
+        self.received = 0
+        self.archived = 0
+
+    @property
+    def max_error(self):
+        """
+        :return: maximum distance between a sample and the series rebuilt
+        :rtype: float
+        """
+        return self._deviation + 2 * self._deadband
+
+    def add(self, time, value, payload=None):
+        """
+        Add a sample to the series
+        :param time: time of the sample, increasing
+        :type time: float
+        :param value: value of the sample
+        :type value: float
+        :param payload: data stored with the point if it is archived
+        :return: the points to archive, as (time, value, payload)
+        :rtype: list of tuple
+        """
+        self.received += 1
+        points = []
+        if self._origin is None:
+            self._reference = value
+            self._origin = (time, value)
+            self._append(points, time, value, payload)
+            return points
+
+        expired = (
+            self._max_interval is not None
+            and time - self._origin[0] >= self._max_interval
+        )
+        if not expired and abs(value - self._reference) <= self._deadband:
+            self._held = (time, value, payload)
+            return points
+
+        if self._held is not None:
+            self._feed(*self._held, points)
+            self._held = None
+        self._feed(time, value, payload, points)
+        if expired:
+            self._archive_last(points)
+        return points
+
+    def flush(self):
+        """
+        Archive the samples received since the last archived point, e.g. before stopping
+        :return: the points to archive, as (time, value, payload)
+        :rtype: list of tuple
+        """
+        points = []
+        if self._held is not None:
+            self._feed(*self._held, points)
+            self._held = None
+        if self._last is not None:
+            self._archive_last(points)
+        return points
+
+    def _feed(self, time, value, payload, points):
+        """Narrow the door with a sample, the segment ends when the door closes"""
+        self._reference = value
+        min_slope, max_slope = self._slopes(time, value)
+        if self._last is not None and (
+            max(self._min_slope, min_slope) > min(self._max_slope, max_slope)
+        ):
+            self._archive_last(points)
+            min_slope, max_slope = self._slopes(time, value)
+        self._min_slope = max(self._min_slope, min_slope)
+        self._max_slope = min(self._max_slope, max_slope)
+        self._last = (time, value, payload)
+
+    def _slopes(self, time, value):
+        """
+        :return: minimum and maximum slope of a line from the origin passing within the
+        deviation of the sample
+        :rtype: (float, float)
+        """
+        origin_time, origin_value = self._origin
+        duration = max(time - origin_time, 1e-9)
+        return (
+            (value - origin_value - self._deviation) / duration,
+            (value - origin_value + self._deviation) / duration,
+        )
+
+    def _archive_last(self, points):
+        """End the segment at the last sample fed, which becomes the new origin"""
+        time, value, payload = self._last
+        origin_time, origin_value = self._origin
+        duration = max(time - origin_time, 1e-9)
+        slope = min(
+            max((value - origin_value) / duration, self._min_slope), self._max_slope
+        )
+        value = origin_value + slope * duration
+
+        self._origin = (time, value)
+        self._last = None
+        self._min_slope = -math.inf
+        self._max_slope = math.inf
+        self._append(points, time, value, payload)
+
+    def _append(self, points, time, value, payload):
+        """Add an archived point to the result"""
+        points.append((time, value, payload))
+        self.archived += 1
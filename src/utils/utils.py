@@ -1,58 +1,25 @@
 """Contains utils functions"""
-import time
 import uuid
-import board
-
-def pin_number_to_digital_gpio(pin):
-    """
-    Convert a number into a digital GPIO
-    :param pin: number of the GPIO
-    :type pin: int
-    :return: GPIO Pin
-    :rtype: Pin
-    """
-
-    pins = [
-        board.D0,
-        board.D1,
-        board.D2,
-        board.D3,
-        board.D4,
-        board.D5,
-        board.D6,
-        board.D7,
-        board.D8,
-        board.D9,
-        board.D10,
-        board.D11,
-        board.D12,
-        board.D13,
-        board.D14,
-        board.D15,
-        board.D16,
-        board.D17,
-        board.D18,
-        board.D19,
-        board.D20,
-        board.D21,
-        board.D22,
-        board.D23,
-        board.D24,
-        board.D25,
-        board.D26,
-        board.D27,
-    ]
-
-    return pins[pin]
+from src.utils.clock import clock
 
 def time_in_millisecond():
     """
-    Current time in millisecond
+    Current time in millisecond, of the clock of the device
 
     :return epoch in millisecond
     :rtype: int
     """
-    return round(time.time() * 1000)
+    return round(clock().time())
+
+def utc_timestamp():
+    """
+    Current UTC time formatted like the SQLite datetime('now') function. Used to
+    timestamp rows when they are recorded rather than when they are written.
+
+    :return UTC date and time, e.g. 2021-11-10 14:02:51
+    :rtype: str
+    """
+    return clock().utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
 def generate_uuid_string():
     """
@@ -71,3 +38,5 @@ HTTP_POST = "POST"
 HTTP_PUT = "PUT"
 "DELETE = Delete a resource."
 HTTP_DELETE = "DELETE"
+"HEAD = Retrieve the headers of a resource, without its body."
+HTTP_HEAD = "HEAD"
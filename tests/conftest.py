@@ -0,0 +1,58 @@
+"""Configuration and fixtures shared by the tests"""
+import os
+import tempfile
+
+import pytest
+import yaml
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The configuration is loaded when src is imported: the one of the repository, with
+# the logs written out of the working tree
+_TEST_DIR = tempfile.mkdtemp(prefix="herbarium-tests-")
+with open(os.path.join(_ROOT, "config.yaml"), "r") as config_file:
+    _test_config = yaml.safe_load(config_file)
+_test_config["logging"]["path"] = _TEST_DIR
+_test_config["logging"]["level"] = "INFO"
+_test_config["metrics"]["enabled"] = False
+# The controllers create their hardware services when they are imported
+_test_config["hal"]["backend"] = "simulated"
+_test_config["actuation"]["process"] = False
+os.environ["CONFIG_YAML_FILE"] = os.path.join(_TEST_DIR, "config.yaml")
+with open(os.environ["CONFIG_YAML_FILE"], "w") as config_file:
+    yaml.safe_dump(_test_config, config_file)
+os.environ["DB_FILE"] = os.path.join(_TEST_DIR, "unused.db")
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A new database with every upgrade script applied"""
+    # pylint: disable=import-outside-toplevel
+    from src.services import database_service, DatabaseService
+
+    monkeypatch.setattr(database_service, "_db_path", str(tmp_path / "herbarium.db"))
+    monkeypatch.setattr(DatabaseService, "_DatabaseService__instance", None)
+    service = DatabaseService.instance()
+    service.run_init_scripts()
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def plant_registry(database, monkeypatch):  # pylint: disable=redefined-outer-name
+    """A plant registry on the new database"""
+    # pylint: disable=import-outside-toplevel
+    from src.services import PlantRegistryService
+
+    monkeypatch.setattr(PlantRegistryService, "_PlantRegistryService__instance", None)
+    return PlantRegistryService.instance()
+
+
+@pytest.fixture
+def outbox(database, monkeypatch):  # pylint: disable=redefined-outer-name
+    """An outbox on the new database"""
+    # pylint: disable=import-outside-toplevel
+    from src.services import OutboxService
+
+    monkeypatch.setattr(OutboxService, "_OutboxService__instance", None)
+    return OutboxService.instance()
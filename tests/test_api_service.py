@@ -0,0 +1,99 @@
+"""Tests of the send_logs upload of the ApiService, against a local HTTP server"""
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    """Record the requests, the chunked bodies are decoded"""
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = bytearray()
+            size = int(self.rfile.readline(), 16)
+            while size > 0:
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                size = int(self.rfile.readline(), 16)
+            self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append((self.path, dict(self.headers), bytes(body)))
+
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        answer = b"{}"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def api_server():
+    """A local HTTP server standing for the API"""
+    server = HTTPServer(("127.0.0.1", 0), _ApiHandler)
+    server.requests = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def api(api_server, monkeypatch):  # pylint: disable=redefined-outer-name
+    """An ApiService sending its requests to the local server"""
+    # pylint: disable=import-outside-toplevel
+    from src.services import ApiService, HttpTransportService
+
+    monkeypatch.setattr(HttpTransportService, "_HttpTransportService__instance", None)
+    monkeypatch.setattr(ApiService, "_ApiService__instance", None)
+    service = ApiService.instance()
+    host, port = api_server.server_address
+    # pylint: disable=protected-access
+    monkeypatch.setattr(service, "_base_url", f"http://{host}:{port}/api")
+    yield service
+    HttpTransportService.instance().close()
+
+
+def _sensors(count, timestamp="2022-06-01 00:00:00"):
+    return (
+        {"type": "H", "timestamp": timestamp, "value": index / 7, "plant_uuid": None}
+        for index in range(count)
+    )
+
+
+def test_logs_streamed_gzip_compressed(api, api_server):
+    # pylint: disable=redefined-outer-name
+    assert api.send_logs(_sensors(20000), iter([]), "send_logs:0-20000:0-0") is True
+
+    ((_, headers, body),) = api_server.requests
+    assert headers["Transfer-Encoding"] == "chunked"
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Idempotency-Key"] == "send_logs:0-20000:0-0"
+    logs = json.loads(gzip.decompress(body))
+    assert logs["sensors"] == list(_sensors(20000))
+    assert logs["actuators"] == []
+
+
+def test_rows_sent_when_columnar_logs_unsupported(api, api_server, monkeypatch):
+    # pylint: disable=redefined-outer-name
+    monkeypatch.setattr(api, "_columnar_logs", True)
+    api_server.statuses.append(415)
+    # The columnar pages have their timestamps as epoch
+    assert api.send_logs(_sensors(1, 1654041600), iter([])) is False
+    assert api.send_logs(_sensors(1, 1654041600), iter([])) is True
+
+    versions = [headers["X-Logs-Version"] for _, headers, _ in api_server.requests]
+    assert versions == ["2", "1"]
+    assert json.loads(gzip.decompress(api_server.requests[1][2]))["sensors"] == list(
+        _sensors(1, 1654041600)
+    )
@@ -0,0 +1,49 @@
+"""Tests of the synchronization engine of the DataSynchronizationController"""
+import copy
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.outbox_service import OPERATION_ADD_PLANT
+from src.utils import config
+
+_TIMEOUT = 5  # s
+
+
+@pytest.fixture
+def controller_config():
+    """The configuration with only the check_new_plant task due at once"""
+    sync_config = copy.deepcopy(config)
+    for key, task_config in sync_config["data_synchronization_task"].items():
+        task_config["delay"] = 0 if key == "check_new_plant" else 3600
+    return sync_config
+
+
+@pytest.fixture
+def connected(monkeypatch):
+    """An internet connection always healthy, without checking the network"""
+    # pylint: disable=import-outside-toplevel
+    from src.services import InternetConnectionService
+
+    monkeypatch.setattr(
+        InternetConnectionService,
+        "_InternetConnectionService__instance",
+        SimpleNamespace(last_connection_check=True),
+    )
+
+
+def test_scheduled_task_runs(controller_config, connected, plant_registry, outbox):
+    # pylint: disable=redefined-outer-name,unused-argument,import-outside-toplevel
+    from src.controllers import DataSynchronizationController
+
+    # Detected before the controller listens to the registry, only the task queues it
+    plant_registry.add_plant(3)
+    controller = DataSynchronizationController(controller_config)
+    try:
+        deadline = time.monotonic() + _TIMEOUT
+        while outbox.pending(OPERATION_ADD_PLANT) == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert outbox.pending(OPERATION_ADD_PLANT) == 1
+    finally:
+        controller.stop()
@@ -0,0 +1,83 @@
+"""Tests of the connections and the write-behind queue of the DatabaseService"""
+# pylint: disable=protected-access
+import sqlite3
+import threading
+
+_INSERT = "insert into sensors_data(type, value) values (?, ?)"
+
+
+def _values(database):
+    rows = database.execute(
+        "select value from sensors_data order by rowid", commit=False
+    )
+    return [row[0] for row in rows]
+
+
+def test_each_thread_has_its_own_connection_in_wal_mode(database):
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(database._connection()))
+    thread.start()
+    thread.join()
+    assert connections[0] is not database._connection()
+    assert database.execute("pragma journal_mode", commit=False)[0][0] == "wal"
+
+
+def test_reader_does_not_block_the_writer(database):
+    database.execute_transaction(
+        [(_INSERT, ("T", float(value))) for value in range(100)]
+    )
+    reading = threading.Event()
+    written = threading.Event()
+
+    def read():
+        # The cursor stays open, holding its read transaction, until the write is done
+        for _ in database.stream("select * from sensors_data", fetch_size=10):
+            reading.set()
+            written.wait(5)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    assert reading.wait(5)
+    database.execute(_INSERT, ("T", 100.0))
+    written.set()
+    reader.join()
+    assert len(_values(database)) == 101
+
+
+def test_rows_of_a_failed_flush_are_written_again_in_order(database, monkeypatch):
+    write_rows = database._write_rows
+    failures = [sqlite3.OperationalError("database is locked")]
+
+    def locked_once(rows):
+        if failures:
+            raise failures.pop()
+        return write_rows(rows)
+
+    monkeypatch.setattr(database, "_write_rows", locked_once)
+    database.enqueue(_INSERT, ("T", 1.0))
+    database.enqueue(_INSERT, ("T", 2.0))
+    assert database.flush() is False
+    database.enqueue(_INSERT, ("T", 3.0))
+    assert database.write_behind_stats["queue_depth"] == 3
+
+    assert database.flush() is True
+    assert _values(database) == [1.0, 2.0, 3.0]
+    assert database.write_behind_stats["failed_flushes"] == 1
+
+
+def test_only_the_rejected_rows_are_dropped(database):
+    database.enqueue(_INSERT, ("T", 1.0))
+    database.enqueue(_INSERT, ("T", None))
+    database.enqueue(_INSERT, ("T", 3.0))
+    assert database.flush() is True
+    assert _values(database) == [1.0, 3.0]
+    stats = database.write_behind_stats
+    assert stats["rows_flushed"] == 2
+    assert stats["rows_dropped"] == 1
+
+
+def test_rows_enqueued_while_closing_are_written_at_once(database):
+    database._closing = True
+    database.enqueue(_INSERT, ("T", 1.0))
+    assert database.write_behind_stats["queue_depth"] == 0
+    assert _values(database) == [1.0]
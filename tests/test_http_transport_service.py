@@ -0,0 +1,168 @@
+"""Tests of the circuit breaker of the HttpTransportService"""
+import threading
+
+import pytest
+import requests
+
+from src.errors.circuit_open_error import CircuitOpenError
+from src.services.http_transport_service import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+)
+from src.utils.clock import SystemClock, VirtualClock, set_clock
+
+_URL = "https://api.example.com/api/plants"
+
+
+class _Answer:
+    """Response with a status code only"""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class _Session:
+    """Session answering the requests with the next outcome of the list"""
+
+    def __init__(self):
+        self.outcomes = []
+
+    def request(self, method, url, **kwargs):  # pylint: disable=unused-argument
+        outcome = self.outcomes.pop(0)
+        if callable(outcome):
+            outcome = outcome()
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return _Answer(outcome)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def virtual_clock():
+    """A clock only moving when advanced"""
+    virtual = VirtualClock()
+    set_clock(virtual)
+    yield virtual
+    set_clock(SystemClock())
+
+
+@pytest.fixture
+def transport(virtual_clock, monkeypatch):  # pylint: disable=unused-argument
+    """A transport sending its requests to a _Session"""
+    # pylint: disable=import-outside-toplevel
+    from src.services import HttpTransportService
+
+    monkeypatch.setattr(HttpTransportService, "_HttpTransportService__instance", None)
+    service = HttpTransportService.instance()
+    service._session = _Session()  # pylint: disable=protected-access
+    return service
+
+
+def _outcomes(transport):
+    return transport._session.outcomes  # pylint: disable=protected-access
+
+
+def _open_circuit(transport):
+    """Fail the requests until the circuit opens"""
+    threshold = transport._failure_threshold  # pylint: disable=protected-access
+    _outcomes(transport).extend([500] * threshold)
+    for _ in range(threshold):
+        transport.request("GET", _URL)
+    assert transport.state == CIRCUIT_OPEN
+
+
+def _wait_reset_timeout(transport, virtual_clock):
+    # pylint: disable=protected-access
+    virtual_clock.advance(transport._reset_timeout * 1000)
+
+
+def test_client_errors_keep_the_circuit_closed(transport):
+    _outcomes(transport).extend([404] * 10)
+    for _ in range(10):
+        assert transport.request("GET", _URL).status_code == 404
+    assert transport.state == CIRCUIT_CLOSED
+
+
+def test_open_circuit_rejects_the_requests(transport):
+    _open_circuit(transport)
+    with pytest.raises(CircuitOpenError):
+        transport.request("GET", _URL)
+
+
+def test_successful_trial_closes_the_circuit(transport, virtual_clock):
+    _open_circuit(transport)
+    _wait_reset_timeout(transport, virtual_clock)
+    _outcomes(transport).append(200)
+    assert transport.request("GET", _URL).status_code == 200
+    assert transport.state == CIRCUIT_CLOSED
+
+
+def test_only_one_trial_in_flight(transport, virtual_clock):
+    _open_circuit(transport)
+    _wait_reset_timeout(transport, virtual_clock)
+    rejected = []
+
+    def concurrent_request():
+        assert transport.state == CIRCUIT_HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            transport.request("GET", _URL)
+        rejected.append(True)
+        return 200
+
+    _outcomes(transport).append(concurrent_request)
+    transport.request("GET", _URL)
+    assert rejected == [True]
+
+
+@pytest.mark.parametrize("status_code", [200, 500])
+def test_request_sent_before_the_circuit_opened(transport, virtual_clock, status_code):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_request():
+        started.set()
+        release.wait(5)
+        return status_code
+
+    _outcomes(transport).append(slow_request)
+    slow = threading.Thread(target=transport.request, args=("GET", _URL))
+    slow.start()
+    assert started.wait(5)
+    _open_circuit(transport)
+    _wait_reset_timeout(transport, virtual_clock)
+    rejected = []
+
+    def trial():
+        # The request sent before the circuit opened ends while the trial is in flight
+        release.set()
+        slow.join(5)
+        assert transport.state == CIRCUIT_HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            transport.request("GET", _URL)
+        rejected.append(True)
+        return 200
+
+    _outcomes(transport).append(trial)
+    transport.request("GET", _URL)
+    assert rejected == [True]
+    assert transport.state == CIRCUIT_CLOSED
+
+
+@pytest.mark.parametrize(
+    "error", [requests.ConnectionError(), ValueError("unexpected"), KeyboardInterrupt()]
+)
+def test_interrupted_trial_is_released(transport, virtual_clock, error):
+    _open_circuit(transport)
+    _wait_reset_timeout(transport, virtual_clock)
+    _outcomes(transport).append(error)
+    with pytest.raises(type(error)):
+        transport.request("GET", _URL)
+    # The trial counts as a failure, and the next one can be sent
+    assert transport.state == CIRCUIT_OPEN
+    _wait_reset_timeout(transport, virtual_clock)
+    _outcomes(transport).append(200)
+    assert transport.request("GET", _URL).status_code == 200
+    assert transport.state == CIRCUIT_CLOSED
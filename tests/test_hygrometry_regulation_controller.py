@@ -0,0 +1,55 @@
+"""Tests of the detection of the pots by the HygrometryRegulationController"""
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils.sql_queries import GET_PLANTS
+
+
+@pytest.fixture
+def moisture(monkeypatch):
+    """Moisture read at each position, in %"""
+    # pylint: disable=import-outside-toplevel
+    from src.controllers import HygrometryRegulationController
+
+    values = [10.0] * 16
+    monkeypatch.setattr(
+        HygrometryRegulationController,
+        "_adc_service",
+        SimpleNamespace(get_plant_hygrometry_value=lambda position: values[position]),
+    )
+    return values
+
+
+@pytest.fixture
+def controller(moisture, plant_registry):
+    """The controller, with the moisture of every position at 10 %"""
+    # pylint: disable=import-outside-toplevel,redefined-outer-name,unused-argument
+    from src.controllers import HygrometryRegulationController
+
+    return HygrometryRegulationController()
+
+
+def _active_positions(database):
+    rows = database.execute(GET_PLANTS, commit=False)
+    return [row["position"] for row in rows if row["removed"] == 0]
+
+
+def test_pot_placed_at_an_empty_position(controller, moisture, database):
+    # pylint: disable=redefined-outer-name
+    moisture[4] = 40.0
+    # The jump is confirmed by the next read
+    controller.update()
+    controller.update()
+    assert _active_positions(database) == [4]
+
+
+def test_moisture_jump_at_an_occupied_position(
+    controller, moisture, plant_registry, database
+):
+    # pylint: disable=redefined-outer-name
+    plant_registry.add_plant(6)
+    moisture[6] = 40.0
+    for _ in range(5):
+        controller.update()
+    assert _active_positions(database) == [6]
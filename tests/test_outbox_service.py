@@ -0,0 +1,108 @@
+"""Tests of the OutboxService"""
+import pytest
+import requests
+
+from src.errors.circuit_open_error import CircuitOpenError
+from src.services.outbox_service import OPERATION_ADD_PLANT
+from src.utils import time_in_millisecond
+
+_KEY = "add_plant:3:2022-06-01 00:00:00"
+_PAYLOAD = {"planted_at": "2022-06-01 00:00:00", "position": 3}
+
+
+def _entry(database):
+    """The only entry of the outbox, as a dict"""
+    rows = database.execute("select * from outbox", commit=False)
+    assert len(rows) == 1
+    return dict(rows[0])
+
+
+def _drain_now(outbox, database):
+    """Drain the outbox with every entry due, whatever its backoff"""
+    database.execute("update outbox set next_attempt_at=0")
+    return outbox.drain()
+
+
+def test_entry_removed_when_acknowledged(outbox, database):
+    calls = []
+    outbox.register_handler(
+        OPERATION_ADD_PLANT, lambda payload, key: calls.append((payload, key)) or True
+    )
+    assert outbox.enqueue(OPERATION_ADD_PLANT, _PAYLOAD, _KEY)
+
+    assert outbox.drain()
+    assert calls == [(_PAYLOAD, _KEY)]
+    assert outbox.pending() == 0
+
+
+def test_same_key_queued_once(outbox):
+    assert outbox.enqueue(OPERATION_ADD_PLANT, _PAYLOAD, _KEY)
+    assert not outbox.enqueue(OPERATION_ADD_PLANT, _PAYLOAD, _KEY)
+    assert outbox.pending(OPERATION_ADD_PLANT) == 1
+
+
+def test_rejected_entry_dead_lettered_then_revived(outbox, database):
+    outbox.register_handler(OPERATION_ADD_PLANT, lambda payload, key: False)
+    outbox.enqueue(OPERATION_ADD_PLANT, _PAYLOAD, _KEY)
+    max_attempts = outbox._max_attempts  # pylint: disable=protected-access
+
+    for _ in range(max_attempts):
+        assert not _drain_now(outbox, database)
+    entry = _entry(database)
+    assert entry["dead"] == 1
+    assert entry["attempts"] == max_attempts
+    assert outbox.pending() == 0
+    assert outbox.last_dead_letter(OPERATION_ADD_PLANT) == (_PAYLOAD, _KEY)
+
+    # Queuing the mutation again gives it a new set of attempts
+    assert outbox.enqueue(OPERATION_ADD_PLANT, _PAYLOAD, _KEY)
+    entry = _entry(database)
+    assert entry["dead"] == 0
+    assert entry["attempts"] == 0
+    assert entry["next_attempt_at"] == 0
+    assert outbox.pending() == 1
+
+    outbox.register_handler(OPERATION_ADD_PLANT, lambda payload, key: True)
+    assert outbox.drain()
+    assert outbox.pending() == 0
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        CircuitOpenError(503),
+        requests.ConnectionError("Network is unreachable"),
+        requests.Timeout("Read timed out"),
+    ],
+)
+def test_unreachable_api_does_not_use_the_attempts(outbox, database, error):
+    def handler(payload, key):
+        raise error
+
+    outbox.register_handler(OPERATION_ADD_PLANT, handler)
+    outbox.enqueue(OPERATION_ADD_PLANT, _PAYLOAD, _KEY)
+    max_attempts = outbox._max_attempts  # pylint: disable=protected-access
+
+    for _ in range(max_attempts * 2):
+        assert not _drain_now(outbox, database)
+    entry = _entry(database)
+    assert entry["dead"] == 0
+    assert entry["attempts"] == 0
+    assert entry["last_error"] == str(error)
+    # Postponed with the backoff of a first attempt, nothing is due until then
+    assert entry["next_attempt_at"] > time_in_millisecond()
+    assert outbox.drain()
+    assert outbox.pending() == 1
+
+
+def test_handler_error_uses_an_attempt(outbox, database):
+    def handler(payload, key):
+        raise ValueError("Unexpected answer")
+
+    outbox.register_handler(OPERATION_ADD_PLANT, handler)
+    outbox.enqueue(OPERATION_ADD_PLANT, _PAYLOAD, _KEY)
+
+    assert not _drain_now(outbox, database)
+    entry = _entry(database)
+    assert entry["attempts"] == 1
+    assert entry["last_error"] == "Unexpected answer"
@@ -0,0 +1,59 @@
+"""Tests of the PlantRegistryService"""
+from src.models import Plant
+from src.utils.sql_queries import GET_PLANTS
+
+
+def _transmit(registry, position, uuid):
+    """Save the uuid given by the API to the plant detected at a position"""
+    registry.add_plant(position)
+    plant = Plant(uuid, position, 55.0, 12.0)
+    registry.update_plant(plant)
+    return plant
+
+
+def test_update_plant_saves_the_uuid(plant_registry, database):
+    _transmit(plant_registry, 3, "plant-a")
+
+    rows = database.execute(GET_PLANTS, commit=False)
+    assert [(row["uuid"], row["position"], row["removed"]) for row in rows] == [
+        ("plant-a", 3, 0)
+    ]
+    assert plant_registry.get_by_position(3).uuid == "plant-a"
+    assert plant_registry.get_by_uuid("plant-a").moisture_goal == 55.0
+
+
+def test_plant_replaced_at_the_same_position(plant_registry, database):
+    plant_a = _transmit(plant_registry, 3, "plant-a")
+    plant_registry.remove_plant(plant_a)
+    _transmit(plant_registry, 3, "plant-b")
+
+    rows = {row["uuid"]: row for row in database.execute(GET_PLANTS, commit=False)}
+    assert set(rows) == {"plant-a", "plant-b"}
+    # The removal of A is still waiting to be sent to the API
+    assert rows["plant-a"]["removed"] == 1
+    assert rows["plant-a"]["transmitted"] == 0
+    assert rows["plant-b"]["removed"] == 0
+    assert rows["plant-b"]["transmitted"] == 1
+    assert plant_registry.get_by_position(3).uuid == "plant-b"
+    assert plant_registry.get_by_uuid("plant-a") is None
+
+
+def test_untransmitted_plant_removed_then_replaced(plant_registry, database):
+    plant = plant_registry.add_plant(5)
+    plant_registry.remove_plant(plant)
+    _transmit(plant_registry, 5, "plant-c")
+
+    rows = database.execute(GET_PLANTS, commit=False)
+    assert [(row["uuid"], row["removed"]) for row in rows] == [("plant-c", 0)]
+    assert [plant.uuid for plant in plant_registry.plants] == ["plant-c"]
+
+
+def test_plant_removed_while_being_transmitted(plant_registry, database):
+    plant = plant_registry.add_plant(7)
+    # The pot is taken away while the API creates the plant
+    plant_registry.remove_plant(plant)
+
+    assert plant_registry.update_plant(Plant("plant-d", 7, 55.0, 12.0)) is False
+    assert database.execute(GET_PLANTS, commit=False) == []
+    assert plant_registry.get_by_position(7) is None
+    assert plant_registry.get_by_uuid("plant-d") is None
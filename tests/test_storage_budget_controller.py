@@ -0,0 +1,83 @@
+"""Tests of the vacuum mode of the StorageBudgetController"""
+from collections import namedtuple
+
+import pytest
+
+from src.utils import config
+
+_AUTO_VACUUM_NONE = 0
+_AUTO_VACUUM_INCREMENTAL = 2
+
+_DiskUsage = namedtuple("_DiskUsage", "total used free")
+
+
+@pytest.fixture
+def controller(database, monkeypatch):
+    """A controller of the new database"""
+    # pylint: disable=import-outside-toplevel
+    from src.controllers import StorageBudgetController
+
+    monkeypatch.setattr(StorageBudgetController, "_db_service", database)
+    budget_controller = StorageBudgetController(config)
+    yield budget_controller
+    budget_controller.stop()
+
+
+@pytest.fixture
+def free_space(monkeypatch):
+    """Set the free space of the disk of the database, in bytes"""
+    # pylint: disable=import-outside-toplevel
+    from src.controllers import storage_budget_controller
+
+    def set_free_space(free):
+        monkeypatch.setattr(
+            storage_budget_controller.shutil,
+            "disk_usage",
+            lambda path: _DiskUsage(free, 0, free),
+        )
+
+    return set_free_space
+
+
+def _auto_vacuum(database):
+    return database.execute("pragma auto_vacuum", commit=False)[0][0]
+
+
+def _create_without_auto_vacuum(database):
+    """Rebuild the database like one created before the incremental vacuum"""
+    database.execute_script("pragma auto_vacuum=none; vacuum;")
+    assert _auto_vacuum(database) == _AUTO_VACUUM_NONE
+
+
+def test_new_database_uses_the_incremental_vacuum(database):
+    assert _auto_vacuum(database) == _AUTO_VACUUM_INCREMENTAL
+
+
+def test_existing_database_kept_without_room_for_a_full_vacuum(
+    controller, database, free_space
+):
+    # pylint: disable=redefined-outer-name,protected-access
+    _create_without_auto_vacuum(database)
+    free_space(controller.usage()["file_size"])
+    controller._run()
+    assert _auto_vacuum(database) == _AUTO_VACUUM_NONE
+
+
+def test_existing_database_converted_with_room_for_a_full_vacuum(
+    controller, database, free_space
+):
+    # pylint: disable=redefined-outer-name,protected-access
+    _create_without_auto_vacuum(database)
+    free_space(1024 * 1024 * 1024)
+    controller._run()
+    assert _auto_vacuum(database) == _AUTO_VACUUM_INCREMENTAL
+
+
+def test_vacuum_mode_checked_once_after_the_start(controller, database, free_space):
+    # pylint: disable=redefined-outer-name,protected-access
+    _create_without_auto_vacuum(database)
+    free_space(0)
+    controller._run()
+    free_space(1024 * 1024 * 1024)
+    controller._run()
+    assert _auto_vacuum(database) == _AUTO_VACUUM_NONE
@@ -0,0 +1,149 @@
+"""Tests of the series rebuilt from the points archived by the swinging door compression"""
+import bisect
+import random
+from datetime import datetime
+
+import pytest
+
+from src.utils import config
+from src.utils.clock import SystemClock, VirtualClock, set_clock
+from src.utils.swinging_door import SwingingDoor
+
+_EPSILON = 1e-9
+_SAMPLE_PERIOD = 60  # s
+
+
+def _rebuild(points, time):
+    """Value at a time of the series rebuilt by linear interpolation of the points"""
+    times = [point[0] for point in points]
+    index = bisect.bisect_left(times, time)
+    if times[index] == time:
+        return points[index][1]
+    (start_time, start_value), (end_time, end_value) = (
+        points[index - 1][:2],
+        points[index][:2],
+    )
+    return start_value + (end_value - start_value) * (time - start_time) / (
+        end_time - start_time
+    )
+
+
+def _max_error(samples, points):
+    return max(abs(_rebuild(points, time) - value) for time, value in samples)
+
+
+def _max_gap(points):
+    return max(end[0] - start[0] for start, end in zip(points, points[1:]))
+
+
+def _compress(door, samples):
+    points = []
+    for time, value in samples:
+        points.extend(door.add(time, value))
+    points.extend(door.flush())
+    return points
+
+
+@pytest.mark.parametrize(
+    "deadband, max_interval", [(0.0, None), (0.5, None), (0.5, 50.0), (1.5, 20.0)]
+)
+def test_random_walk_rebuilt_within_the_max_error(deadband, max_interval):
+    generator = random.Random(17)
+    level = 50.0
+    samples = []
+    for time in range(5000):
+        level += generator.gauss(0.0, 0.3)
+        samples.append((float(time), level + generator.uniform(-0.4, 0.4)))
+    door = SwingingDoor(1.0, deadband, max_interval)
+
+    points = _compress(door, samples)
+
+    assert _max_error(samples, points) <= door.max_error + _EPSILON
+    assert door.archived == len(points) < door.received == len(samples)
+    if max_interval is not None:
+        assert _max_gap(points) <= max_interval
+
+
+def test_changes_within_the_deadband_are_held():
+    # Oscillations smaller than the deadband, then a step
+    samples = [(float(time), 20.0 + 0.2 * (-1) ** time) for time in range(100)]
+    samples += [(float(time), 30.0 + 0.1 * time) for time in range(100, 150)]
+    door = SwingingDoor(1.0, 0.5)
+
+    points = _compress(door, samples)
+
+    # The last sample held is fed before the step and ends the first segment
+    assert [point[0] for point in points[:2]] == [0.0, 99.0]
+    assert len(points) < 10
+    assert _max_error(samples, points) <= door.max_error + _EPSILON
+
+
+def test_max_interval_forces_an_archived_point():
+    samples = [(float(time), 20.0) for time in range(1000)]
+    door = SwingingDoor(1.0, 0.5, max_interval=100.0)
+
+    points = _compress(door, samples)
+
+    expected = [float(time) for time in range(0, 1000, 100)] + [999.0]
+    assert [point[0] for point in points] == expected
+    assert _max_error(samples, points) == 0.0
+
+
+@pytest.fixture
+def virtual_clock():
+    """A clock only moving when advanced, on a whole second"""
+    virtual = VirtualClock(datetime(2026, 1, 1))
+    set_clock(virtual)
+    yield virtual
+    set_clock(SystemClock())
+
+
+@pytest.fixture
+def recorder(database, virtual_clock, monkeypatch):
+    """A sensor recorder on the new database"""
+    # pylint: disable=import-outside-toplevel,redefined-outer-name,unused-argument
+    from src.services import SensorRecorderService
+
+    monkeypatch.setattr(SensorRecorderService, "_SensorRecorderService__instance", None)
+    return SensorRecorderService.instance()
+
+
+def _tank_level_rows(database):
+    rows = database.execute(
+        "select timestamp, value from sensors_data where type='T' order by rowid",
+        commit=False,
+    )
+    start = datetime(2026, 1, 1)
+    return [
+        (
+            (datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S") - start).total_seconds(),
+            row[1],
+        )
+        for row in rows
+    ]
+
+
+def test_recorded_series_rebuilt_within_the_max_error(recorder, virtual_clock, database):
+    # pylint: disable=redefined-outer-name
+    generator = random.Random(3)
+    samples = []
+    for index in range(6 * 60):
+        # Stable for 3 hours, within the deadband, then the tank empties
+        if index < 3 * 60:
+            level = 80.0 + generator.uniform(-0.5, 0.5)
+        else:
+            level = 80.0 - 0.2 * (index - 3 * 60) + generator.uniform(-0.5, 0.5)
+        samples.append((float(index * _SAMPLE_PERIOD), level))
+        recorder.record_tank_level(level)
+        virtual_clock.advance(_SAMPLE_PERIOD * 1000)
+    recorder.flush()
+    database.flush()
+
+    points = _tank_level_rows(database)
+
+    settings = config["sensor_compression"]
+    max_error = settings["tank_level"]["deviation"] + 2 * settings["tank_level"]["deadband"]
+    assert recorder.statistics["T"]["max_error"] == max_error
+    assert _max_error(samples, points) <= max_error + _EPSILON
+    assert _max_gap(points) <= settings["max_interval"]
+    assert len(points) < len(samples) / 4
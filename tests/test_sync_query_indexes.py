@@ -0,0 +1,99 @@
+"""Query plans and timings of the synchronization queries on the indexed schema
+
+The timings are printed, run with `pytest -s`. The size of the table is set by
+HERBARIUM_BENCHMARK_ROWS (e.g. 10000000, the default keeps the test suite fast).
+"""
+# pylint: disable=protected-access
+import os
+import time
+
+import pytest
+
+from src.utils.sql_queries import (
+    DELETE_SENSORS_TRANSMITTED,
+    GET_UNTRANSMITTED_SENSORS_DATA_PAGE,
+    GET_UNTRANSMITTED_SENSORS_DATA_PAGE_END,
+    UPDATE_SENSORS_TRANSMITTED_UP_TO,
+)
+
+_ROWS = int(os.environ.get("HERBARIUM_BENCHMARK_ROWS", "100000"))
+_PAGE_SIZE = 5000
+_INSERT = "insert into sensors_data(type, value, timestamp) values ('T', ?, datetime('now'))"
+# Indexes of the version 2 of the schema, dropped by the version 7
+_UNTRANSMITTED_INDEXES = [
+    "create index sensors_data_untransmitted_idx "
+    "on sensors_data (timestamp, type, value, plant_uuid, transmitted) "
+    "where transmitted = 0",
+    "create index actuators_untransmitted_idx "
+    "on actuators (timestamp, type, status, plant_uuid, transmitted) "
+    "where transmitted = 0",
+]
+
+
+def _indexes(connection):
+    rows = connection.execute("select name from sqlite_master where type='index'")
+    return {row[0] for row in rows}
+
+
+def _plan(connection, query, parameters):
+    rows = connection.execute(f"explain query plan {query}", parameters)
+    return " ".join(row[3] for row in rows)
+
+
+def _time_inserts(connection, count):
+    start = time.perf_counter()
+    with connection:
+        connection.executemany(_INSERT, ((float(i),) for i in range(count)))
+    return time.perf_counter() - start
+
+
+def _time_page(connection, after):
+    start = time.perf_counter()
+    end = connection.execute(
+        GET_UNTRANSMITTED_SENSORS_DATA_PAGE_END, [after, _PAGE_SIZE]
+    ).fetchone()[0]
+    rows = connection.execute(GET_UNTRANSMITTED_SENSORS_DATA_PAGE, [after, end]).fetchall()
+    return time.perf_counter() - start, rows
+
+
+def test_untransmitted_indexes_dropped(database):
+    indexes = _indexes(database._connection())
+    assert "sensors_data_untransmitted_idx" not in indexes
+    assert "actuators_untransmitted_idx" not in indexes
+
+
+@pytest.mark.parametrize(
+    "query, parameters, plan",
+    [
+        (GET_UNTRANSMITTED_SENSORS_DATA_PAGE_END, [0, _PAGE_SIZE], "INTEGER PRIMARY KEY"),
+        (GET_UNTRANSMITTED_SENSORS_DATA_PAGE, [0, _PAGE_SIZE], "INTEGER PRIMARY KEY"),
+        (UPDATE_SENSORS_TRANSMITTED_UP_TO, [0, _PAGE_SIZE], "INTEGER PRIMARY KEY"),
+        (DELETE_SENSORS_TRANSMITTED, [], "sensors_data_transmitted_idx"),
+    ],
+)
+def test_sync_queries_search_the_table(database, query, parameters, plan):
+    connection = database._connection()
+    assert plan in _plan(connection, query, parameters)
+
+
+def test_timings_before_and_after_the_untransmitted_indexes(database):
+    connection = database._connection()
+    with connection:
+        for statement in _UNTRANSMITTED_INDEXES:
+            connection.execute(statement)
+    before_insert = _time_inserts(connection, _ROWS)
+    before_page, before_rows = _time_page(connection, _ROWS // 2)
+
+    with connection:
+        connection.execute("drop index sensors_data_untransmitted_idx")
+        connection.execute("drop index actuators_untransmitted_idx")
+    after_insert = _time_inserts(connection, _ROWS)
+    after_page, after_rows = _time_page(connection, _ROWS // 2)
+
+    print(
+        f"\n{_ROWS} inserts: {before_insert:.3f} s with the untransmitted indexes, "
+        f"{after_insert:.3f} s without"
+        f"\npage of {_PAGE_SIZE} rows: {before_page * 1000:.2f} ms with the untransmitted "
+        f"indexes, {after_page * 1000:.2f} ms without"
+    )
+    assert after_rows == before_rows